@@ -0,0 +1,276 @@
+"""
+Benchmarks of the backend over synthetic discussion corpora.
+
+Generates discussion and draft files of several sizes and tree shapes (see
+benchmarks/synthetic.py) into a scratch data folder, starts the FastAPI app
+in-process on it (BACKEND_DATA_DIR) and drives it with the test client:
+
+  - classify_file         classification of every generated file
+  - migrate_files         cold (empty files table, full reclassification) and
+                          incremental (nothing changed) rescans
+  - list_files            whole list, first page, folder filter, sorted page
+  - get_file_by_id        plain, gzip and conditional (304) GETs
+  - patch_save            one-node JSON patch vs. whole-document PATCH
+  - move_files            bulk move of the small files between two folders
+
+For each measurement the report has the number of runs, p50/p95/mean/min/max
+latency (ms), throughput (ops/s, and MB/s where a file is involved) and the
+peak RSS of the process after the phase. The JSON report has stable keys so
+reports of two commits can be diffed, or compared with --compare.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_backend [--sizes 100 1000 10000 100000] [--shapes balanced wide deep]
+        [--small-files 200] [--repeat 20] [--out report.json] [--compare previous.json]
+
+Sizes up to 1000000 nodes work but take minutes to generate and parse.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.synthetic import SHAPES, make_discussion, make_draft  # noqa: E402
+
+# very large files are timed fewer times
+LARGE_FILE_BYTES = 50 * 1024 * 1024
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def summarize(samples: List[float], nbytes: Optional[int] = None) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    total = sum(ordered)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    stats = {
+        "runs": len(ordered),
+        "p50_ms": round(pct(0.5) * 1000, 3),
+        "p95_ms": round(pct(0.95) * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "ops_per_s": round(len(ordered) / total, 2) if total else None,
+    }
+    if nbytes:
+        stats["mb_per_s"] = round(nbytes * len(ordered) / total / 1e6, 2) if total else None
+    return stats
+
+
+class Bench:
+    def __init__(self, repeat: int) -> None:
+        self.repeat = repeat
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def runs_for(self, nbytes: int) -> int:
+        return self.repeat if nbytes < LARGE_FILE_BYTES else max(1, self.repeat // 10)
+
+    def measure(self, key: str, fn: Callable[[], Any], runs: Optional[int] = None, nbytes: Optional[int] = None,
+                setup: Optional[Callable[[], Any]] = None) -> Dict[str, Any]:
+        samples = []
+        for _ in range(runs or self.repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        stats = summarize(samples, nbytes)
+        stats["peak_rss_mb"] = peak_rss_mb()
+        self.results[key] = stats
+        print(f"  {key:<58} p50 {stats['p50_ms']:>10.2f} ms  p95 {stats['p95_ms']:>10.2f} ms  rss {stats['peak_rss_mb']} MB", flush=True)
+        return stats
+
+
+def generate_corpus(files_root: str, sizes: List[int], shapes: List[str], small_files: int) -> List[Dict[str, Any]]:
+    corpus = []
+    os.makedirs(os.path.join(files_root, 'corpus'), exist_ok=True)
+    for shape in shapes:
+        for nodes in sizes:
+            for kind in ('discussion', 'draft'):
+                name = f'{kind}_{shape}_{nodes}.json'
+                doc = make_discussion(nodes, seed=nodes, shape=shape) if kind == 'discussion' else make_draft(nodes, min(nodes, 5000), seed=nodes, shape=shape)
+                path = os.path.join(files_root, 'corpus', name)
+                with open(path, 'w', encoding='utf-8') as fh:
+                    json.dump(doc, fh, indent=2, ensure_ascii=False)
+                corpus.append({"name": name, "kind": kind, "shape": shape, "nodes": nodes, "bytes": os.path.getsize(path), "path": path})
+                print(f"  generated {name} ({corpus[-1]['bytes'] / 1e6:.1f} MB)", flush=True)
+    for folder in ('small_a', 'small_b'):
+        os.makedirs(os.path.join(files_root, folder), exist_ok=True)
+    for i in range(small_files):
+        with open(os.path.join(files_root, 'small_a', f'small_{i}.json'), 'w', encoding='utf-8') as fh:
+            json.dump(make_discussion(100, seed=i), fh, indent=2, ensure_ascii=False)
+    return corpus
+
+
+def node_pointer(doc: Dict[str, Any], depth: int) -> str:
+    """JSON pointer to the text of a node reached by following last children down `depth` levels."""
+    pointer, node = '/tree', doc['tree']
+    for _ in range(depth):
+        if not node['children']:
+            break
+        index = len(node['children']) - 1
+        pointer, node = f'{pointer}/children/{index}', node['children'][index]
+    return pointer + '/text'
+
+
+def run(args: argparse.Namespace, data_dir: str) -> Dict[str, Any]:
+    files_root = os.path.join(data_dir, 'files_root')
+    print(f"generating corpus in {files_root}", flush=True)
+    corpus = generate_corpus(files_root, args.sizes, args.shapes, args.small_files)
+
+    # configure the app before importing it
+    os.environ['BACKEND_DATA_DIR'] = data_dir
+    os.environ.setdefault('LLM_CACHE_PATH', os.path.join(data_dir, 'llm_cache.sqlite3'))
+    os.environ['FS_WATCHER'] = '0'
+    os.environ['BLOB_STORE'] = '0'
+    import main
+    from fastapi.testclient import TestClient
+    from scripts import json_codec
+    from scripts.classify import classify_file
+
+    bench = Bench(args.repeat)
+    with TestClient(main.app) as client:
+        print("classify_file", flush=True)
+        for f in corpus:
+            bench.measure(f"classify_file/{f['name']}", lambda: classify_file(f['path']), runs=bench.runs_for(f['bytes']), nbytes=f['bytes'])
+
+        print("migrate_files", flush=True)
+        cold_runs = max(1, min(3, args.repeat))
+        bench.measure('migrate_files/cold', lambda: client.post('/api/migrate-files').raise_for_status(), runs=cold_runs,
+                      setup=lambda: main._db.execute('DELETE FROM files'))
+        bench.measure('migrate_files/incremental', lambda: client.post('/api/migrate-files').raise_for_status())
+
+        print("list_files", flush=True)
+        bench.measure('list_files/all', lambda: client.get('/api/files').raise_for_status())
+        bench.measure('list_files/first_page_50', lambda: client.get('/api/files', params={'limit': 50}).raise_for_status())
+        bench.measure('list_files/folder_small_a', lambda: client.get('/api/files', params={'folder': 'small_a'}).raise_for_status())
+        bench.measure('list_files/sorted_by_size_page_50', lambda: client.get('/api/files', params={'sort': 'size', 'limit': 50}).raise_for_status())
+
+        ids = {name: fid for fid, name in main._db.query_all('SELECT id, name FROM files')}
+        print("get_file_by_id", flush=True)
+        for f in corpus:
+            fid, runs = ids[f['name']], bench.runs_for(f['bytes'])
+            url = f'/api/files/id/{fid}'
+            bench.measure(f"get_file_by_id/{f['name']}", lambda: client.get(url, headers={'Accept-Encoding': 'identity'}).raise_for_status(), runs=runs, nbytes=f['bytes'])
+            bench.measure(f"get_file_by_id_gzip/{f['name']}", lambda: client.get(url, headers={'Accept-Encoding': 'gzip'}).raise_for_status(), runs=runs, nbytes=f['bytes'])
+            etag = client.get(url, headers={'Accept-Encoding': 'identity'}).headers['etag']
+            bench.measure(f"get_file_by_id_304/{f['name']}", lambda: client.get(url, headers={'If-None-Match': etag}), runs=args.repeat)
+
+        print("patch_save", flush=True)
+        for f in corpus:
+            if f['kind'] != 'discussion':
+                continue
+            fid, runs = ids[f['name']], bench.runs_for(f['bytes'])
+            url = f'/api/files/id/{fid}'
+            doc = json_codec.load_file(f['path'])
+            pointer = node_pointer(doc, depth=8)
+            state = {"version": client.get(url).headers['x-document-version'], "n": 0}
+
+            def json_patch() -> None:
+                state["n"] += 1
+                r = client.patch(url, json={"patch": [{"op": "replace", "path": pointer, "value": f"edit {state['n']}"}], "baseVersion": state["version"]})
+                r.raise_for_status()
+                state["version"] = r.json()["version"]
+
+            bench.measure(f"patch_save_json_patch/{f['name']}", json_patch, runs=args.repeat)
+            main.journals.flush(f['path'])
+            bench.measure(f"patch_save_full_document/{f['name']}", lambda: client.patch(url, json=doc).raise_for_status(), runs=runs, nbytes=f['bytes'])
+
+        print("move_files", flush=True)
+        small_ids = [fid for fid, in main._db.query_all("SELECT id FROM files WHERE folder = 'small_a/'")]
+        where = {"dest": 'small_b'}
+
+        def move_all() -> None:
+            client.post('/api/files/move', json={"targets": small_ids, "dest": where["dest"]}).raise_for_status()
+            where["dest"] = 'small_a' if where["dest"] == 'small_b' else 'small_b'
+
+        if small_ids:
+            bench.measure(f'move_files/{len(small_ids)}_files', move_all)
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "json_backend": json_codec.BACKEND,
+            "params": {"sizes": args.sizes, "shapes": args.shapes, "small_files": args.small_files, "repeat": args.repeat},
+        },
+        "corpus": [{k: v for k, v in f.items() if k != 'path'} for f in corpus],
+        "results": bench.results,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """Print the p50/p95 change of every measurement present in both reports."""
+    print(f"\ncompared with {previous['meta'].get('commit')} ({previous['meta'].get('created_at')})")
+    print(f"{'measurement':<60} {'p50 before':>11} {'p50 after':>11} {'change':>8}")
+    for key, stats in current['results'].items():
+        old = previous['results'].get(key)
+        if not old or not old.get('p50_ms'):
+            continue
+        change = (stats['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+        print(f"{key:<60} {old['p50_ms']:>11.2f} {stats['p50_ms']:>11.2f} {change:>+7.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip(), formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000], help='tree sizes in nodes')
+    parser.add_argument('--shapes', nargs='+', default=['balanced', 'deep'], choices=sorted(SHAPES))
+    parser.add_argument('--small-files', type=int, default=200, help='number of 100-node files used by list/move')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per measurement (fewer for files over 50 MB)')
+    parser.add_argument('--out', default='benchmark_report.json', help='where to write the JSON report')
+    parser.add_argument('--compare', help='previous report to compare with')
+    parser.add_argument('--data-dir', help='scratch data folder (default: a temporary folder, removed afterwards)')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='conv_bench_')
+    try:
+        report = run(args, data_dir)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    with open(args.out, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nreport written to {args.out}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as fh:
+            compare(json.load(fh), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+Offline stand-in for the Groq (OpenAI-compatible) chat completions API.
+
+Serves POST /openai/v1/chat/completions (the path the Groq SDK uses, also
+under /v1/...) with configurable latency, token throughput, failures and
+replies, so the LLM endpoints of the backend can be load-tested on an
+isolated machine. Start it, then point the backend at it:
+
+    python -m benchmarks.fake_groq --port 8100 --ttft lognormal:300,0.5 --tokens-per-s 250
+    GROQ_BASE_URL=http://127.0.0.1:8100 LLM_CACHE=0 uvicorn main:app
+
+Timing of a request: a time to first token drawn from --ttft, then one token
+every 1/--tokens-per-s seconds (streamed as SSE chunks when the request has
+stream=true, otherwise the whole reply is sent at the end). Distributions are
+"const:MS", "uniform:LO,HI", "normal:MEAN,SD", "exp:MEAN" or
+"lognormal:MEDIAN,SIGMA", in milliseconds.
+
+Failures: --rate-limit-prob answers 429 with a Retry-After header like Groq
+does, --rpm enforces an actual requests-per-minute budget (429 beyond it),
+--error-prob answers --error-status (default 503).
+
+Replies (--reply):
+  - auto   (default) the transform prompt of /api/files/fix gets a valid
+           {"users", "tree"} document built from its input; anything else
+           gets generated text of --reply-tokens tokens
+  - echo   the last user message
+  - FILE   a JSON file holding a string or a list of strings, used in turn
+
+GET /stats returns request/failure counters and the peak concurrency;
+POST /stats/reset clears them.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = 'sure I think that the point here is we should look at what people actually said about it'.split()
+
+
+def parse_distribution(spec: str) -> Callable[[random.Random], float]:
+    """Turn "kind:a,b" (milliseconds) into a function returning a delay in seconds."""
+    kind, _, args = spec.partition(':')
+    try:
+        values = [float(v) for v in args.split(',')] if args else []
+        if kind == 'const' and len(values) == 1:
+            return lambda rng: values[0] / 1000
+        if kind == 'uniform' and len(values) == 2:
+            return lambda rng: rng.uniform(*values) / 1000
+        if kind == 'normal' and len(values) == 2:
+            return lambda rng: max(0.0, rng.gauss(*values)) / 1000
+        if kind == 'exp' and len(values) == 1:
+            return lambda rng: rng.expovariate(1000 / values[0]) if values[0] else 0.0
+        if kind == 'lognormal' and len(values) == 2:
+            # median in ms, sigma of the underlying normal
+            return lambda rng: values[0] * rng.lognormvariate(0, values[1]) / 1000
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"invalid distribution {spec!r}")
+
+
+def _distribution_spec(spec: str) -> str:
+    parse_distribution(spec)
+    return spec
+
+
+def _tokens(text: str) -> List[str]:
+    """Split a reply into token-sized pieces (words with their trailing space)."""
+    return re.findall(r'\S+\s*|\s+', text) or ['']
+
+
+def _transform_reply(prompt: str) -> str:
+    """A valid answer to llm_calls' transform prompt: the input messages as a flat tree."""
+    match = re.search(r'### Input JSON\s*(.*?)\s*Make sure that the output', prompt, re.S)
+    try:
+        data = json.loads(match.group(1)) if match else []
+    except ValueError:
+        data = []
+    items = data if isinstance(data, list) else [data]
+    messages = [m for m in items if isinstance(m, dict)]
+    speakers = sorted({str(m.get('speaker') or m.get('from') or 'unknown') for m in messages}) or ['unknown']
+    nodes = [
+        {"id": str(m.get('id', i)), "speaker": str(m.get('speaker') or m.get('from') or 'unknown'), "text": str(m.get('text', '')), "children": []}
+        for i, m in enumerate(messages)
+    ] or [{"id": "1", "speaker": speakers[0], "text": "", "children": []}]
+    root = nodes[0]
+    root["children"] = nodes[1:]
+    return json.dumps({"users": [{"speaker": s, "description": "This is a telegram user"} for s in speakers], "tree": root}, ensure_ascii=False)
+
+
+class FakeGroq:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.ttft = parse_distribution(args.ttft)
+        self.tokens_per_s = args.tokens_per_s
+        self.reply_tokens = args.reply_tokens
+        self.rate_limit_prob = args.rate_limit_prob
+        self.retry_after = args.retry_after
+        self.rpm = args.rpm
+        self.error_prob = args.error_prob
+        self.error_status = args.error_status
+        self.reply_mode = args.reply
+        self.rng = random.Random(args.seed)
+        self.canned: Optional[itertools.cycle] = None
+        if args.reply not in ('auto', 'echo'):
+            with open(args.reply, 'r', encoding='utf-8') as fh:
+                canned = json.load(fh)
+            self.canned = itertools.cycle(canned if isinstance(canned, list) else [canned])
+        self._window: deque = deque()
+        self.reset()
+
+    def reset(self) -> None:
+        self.stats = {"requests": 0, "streamed": 0, "completed": 0, "rate_limited": 0, "errors": 0,
+                      "in_flight": 0, "peak_in_flight": 0, "completion_tokens": 0}
+
+    def reply(self, body: Dict[str, Any]) -> str:
+        messages = body.get('messages') or []
+        user = next((m.get('content') or '' for m in reversed(messages) if m.get('role') == 'user'), '')
+        if self.canned is not None:
+            return next(self.canned)
+        if self.reply_mode == 'echo':
+            return user
+        system = next((m.get('content') or '' for m in messages if m.get('role') == 'system'), '')
+        if 'JSON transformation' in system:
+            return _transform_reply(user)
+        count = min(self.reply_tokens, body.get('max_completion_tokens') or body.get('max_tokens') or self.reply_tokens)
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count)).capitalize() + '.'
+
+    def _over_rpm(self) -> bool:
+        if not self.rpm:
+            return False
+        now = time.monotonic()
+        while self._window and now - self._window[0] > 60:
+            self._window.popleft()
+        if len(self._window) >= self.rpm:
+            return True
+        self._window.append(now)
+        return False
+
+    def failure(self) -> Optional[JSONResponse]:
+        """Injected 429/5xx response for this request, if any."""
+        if self._over_rpm() or self.rng.random() < self.rate_limit_prob:
+            self.stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached for model. Please try again later.", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after": f"{self.retry_after:g}"},
+            )
+        if self.rng.random() < self.error_prob:
+            self.stats["errors"] += 1
+            return JSONResponse({"error": {"message": "Service unavailable (injected)", "type": "internal_server_error"}}, status_code=self.error_status)
+        return None
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    fake = FakeGroq(args)
+    app = FastAPI(title='fake groq')
+    app.state.fake = fake
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        fake.stats["requests"] += 1
+        failed = fake.failure()
+        if failed is not None:
+            return failed
+
+        model = body.get('model') or 'fake-model'
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        created = int(time.time())
+        tokens = _tokens(fake.reply(body))
+        prompt_tokens = sum(len(_tokens(m.get('content') or '')) for m in body.get('messages') or [])
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+        interval = 1 / fake.tokens_per_s if fake.tokens_per_s else 0.0
+        first = fake.ttft(fake.rng)
+
+        fake.stats["in_flight"] += 1
+        fake.stats["peak_in_flight"] = max(fake.stats["peak_in_flight"], fake.stats["in_flight"])
+
+        def done() -> None:
+            fake.stats["in_flight"] -= 1
+            fake.stats["completed"] += 1
+            fake.stats["completion_tokens"] += len(tokens)
+
+        if not body.get('stream'):
+            try:
+                await asyncio.sleep(first + interval * len(tokens))
+            finally:
+                done()
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": ''.join(tokens)}, "finish_reason": "stop", "logprobs": None}],
+                "usage": usage,
+            }
+
+        fake.stats["streamed"] += 1
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> str:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}], **extra}
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def events():
+            try:
+                await asyncio.sleep(first)
+                yield chunk({"role": "assistant", "content": ""})
+                for token in tokens:
+                    yield chunk({"content": token})
+                    if interval:
+                        await asyncio.sleep(interval)
+                yield chunk({}, "stop", x_groq={"id": completion_id, "usage": usage})
+                yield "data: [DONE]\n\n"
+            finally:
+                done()
+
+        return StreamingResponse(events(), media_type='text/event-stream')
+
+    for prefix in ('/openai/v1', '/v1'):
+        app.add_api_route(f'{prefix}/chat/completions', chat_completions, methods=['POST'])
+
+    @app.get('/stats')
+    def stats():
+        return fake.stats
+
+    @app.post('/stats/reset')
+    def reset_stats():
+        fake.reset()
+        return fake.stats
+
+    return app
+
+
+def build_parser(add_help: bool = True) -> argparse.ArgumentParser:
+    """Options of the stand-in; also used as a parent parser by benchmarks/llm_load.py."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1].strip(), formatter_class=argparse.RawDescriptionHelpFormatter, add_help=add_help)
+    parser.add_argument('--ttft', type=_distribution_spec, default='lognormal:300,0.5', help='time to first token distribution (ms)')
+    parser.add_argument('--tokens-per-s', type=float, default=250.0, help='output speed, 0 for instant replies')
+    parser.add_argument('--reply', default='auto', help="auto | echo | path to a JSON file of canned replies")
+    parser.add_argument('--reply-tokens', type=int, default=80, help='length of generated replies (auto mode)')
+    parser.add_argument('--rate-limit-prob', type=float, default=0.0, help='probability of a 429 per request')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After of injected 429s (seconds)')
+    parser.add_argument('--rpm', type=int, default=0, help='requests per minute accepted before answering 429 (0: no limit)')
+    parser.add_argument('--error-prob', type=float, default=0.0, help='probability of a server error per request')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=None)
+    return parser
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = build_parser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
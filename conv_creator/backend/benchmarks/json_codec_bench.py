@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of JSON load/dump throughput on synthetic discussion trees.
+
+Compares the standard library with orjson (when installed) for the operations
+the backend performs: parsing a file, writing it indented (the default on-disk
+layout) or compact (JSON_COMPACT=1), and encoding an API response.
+
+Run from the backend folder:
+
+    python -m benchmarks.json_codec_bench [--nodes 1000 10000 100000] [--repeat 5] [--json out.json]
+"""
+
+import argparse
+import json
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.synthetic import make_discussion
+from scripts import json_codec
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _best_of(fn: Callable[[], object], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _cases(doc: object, indented: bytes, compact: bytes) -> Dict[str, Dict[str, Callable[[], object]]]:
+    cases = {
+        'stdlib': {
+            'load indented': lambda: json.loads(indented),
+            'load compact': lambda: json.loads(compact),
+            'dump indented': lambda: json.dumps(doc, indent=2, ensure_ascii=False).encode('utf-8'),
+            'dump compact': lambda: json.dumps(doc, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+        },
+    }
+    if orjson is not None:
+        cases['orjson'] = {
+            'load indented': lambda: orjson.loads(indented),
+            'load compact': lambda: orjson.loads(compact),
+            'dump indented': lambda: orjson.dumps(doc, option=orjson.OPT_INDENT_2),
+            'dump compact': lambda: orjson.dumps(doc),
+        }
+    return cases
+
+
+def run(node_counts: List[int], repeat: int) -> List[dict]:
+    results = []
+    for nodes in node_counts:
+        doc = make_discussion(nodes, seed=nodes)
+        indented = json.dumps(doc, indent=2, ensure_ascii=False).encode('utf-8')
+        compact = json.dumps(doc, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        for backend, ops in _cases(doc, indented, compact).items():
+            for op, fn in ops.items():
+                try:
+                    seconds = _best_of(fn, repeat)
+                except (TypeError, ValueError) as e:
+                    # e.g. orjson's nesting limit; json_codec falls back to the stdlib there
+                    print(f"{nodes} nodes, {backend} {op}: unsupported ({e})")
+                    continue
+                size = len(compact) if op.endswith('compact') else len(indented)
+                results.append({
+                    "nodes": nodes, "backend": backend, "op": op, "bytes": size,
+                    "seconds": seconds, "mb_per_s": size / seconds / 1e6 if seconds else None,
+                })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', dest='json_out', help='also write the results to this file')
+    args = parser.parse_args()
+
+    print(f"json_codec backend in use: {json_codec.BACKEND} (compact files: {json_codec.COMPACT_FILES})")
+    results = run(args.nodes, args.repeat)
+    print(f"{'nodes':>8} {'backend':>8} {'op':>14} {'bytes':>12} {'ms':>9} {'MB/s':>8} {'vs stdlib':>9}")
+    baseline = {(r["nodes"], r["op"]): r["seconds"] for r in results if r["backend"] == 'stdlib'}
+    for r in results:
+        speedup = baseline[(r["nodes"], r["op"])] / r["seconds"] if r["seconds"] else 0
+        print(f"{r['nodes']:>8} {r['backend']:>8} {r['op']:>14} {r['bytes']:>12} {r['seconds'] * 1000:>9.2f} {r['mb_per_s']:>8.1f} {speedup:>8.1f}x")
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as fh:
+            json.dump({"backend": json_codec.BACKEND, "results": results}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
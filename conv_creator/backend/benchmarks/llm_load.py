@@ -0,0 +1,230 @@
+"""
+Load test of the LLM endpoints against the offline Groq stand-in.
+
+Starts benchmarks/fake_groq.py and the backend (pointed at it through
+GROQ_BASE_URL, with the LLM response cache off) as local servers on a scratch
+data folder, then sends --requests requests per scenario at each of the
+--concurrency levels:
+
+  - bio, bio_stream            /api/llm/generate-bio(/stream)
+  - rewrite, rewrite_stream    /api/llm/rewrite-message(/stream)
+  - rewrite_draft              /api/llm/rewrite-draft/{id} (--draft-messages calls each)
+  - fix                        /api/files/fix/{id}/preview?force_llm=true
+
+For every scenario and concurrency the report has latency percentiles (time
+to first token too for streams), throughput, status codes and the stand-in's
+counters (upstream requests, injected 429s, peak upstream concurrency). All
+options of the stand-in (--ttft, --tokens-per-s, --rate-limit-prob...) apply.
+
+Run from the backend folder:
+
+    python -m benchmarks.llm_load [--concurrency 1 8 32] [--requests 64] [--scenarios bio rewrite_stream]
+        [--ttft lognormal:300,0.5] [--tokens-per-s 250] [--rate-limit-prob 0.05] [--out llm_load_report.json]
+
+Both servers run in this process (in threads), so the numbers include some
+interference from the load generator; use a separate machine for the
+stand-in when that matters.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks import fake_groq  # noqa: E402
+from benchmarks.bench_backend import _git_commit, summarize  # noqa: E402
+from benchmarks.synthetic import make_discussion, make_draft  # noqa: E402
+
+SCENARIOS = ('bio', 'bio_stream', 'rewrite', 'rewrite_stream', 'rewrite_draft', 'fix')
+
+CHAT = [f"message {i} about the new bike lanes and the city budget" for i in range(20)]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _serve(app: Any, port: int):
+    """Run `app` with uvicorn in a daemon thread; returns the server once it accepts connections."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"server on port {port} did not start")
+        time.sleep(0.05)
+    return server
+
+
+def _prepare_files(files_root: str, draft_messages: int) -> None:
+    os.makedirs(files_root, exist_ok=True)
+    with open(os.path.join(files_root, 'load_draft.json'), 'w', encoding='utf-8') as fh:
+        json.dump(make_draft(200, draft_messages, seed=1), fh, indent=2, ensure_ascii=False)
+    # a flat message list, the input of the fix endpoint
+    tree = make_discussion(30, seed=2)['tree']
+    flat, stack = [], [tree]
+    while stack:
+        node = stack.pop()
+        flat.append({"id": node["id"], "speaker": node["speaker"], "text": node["text"]})
+        stack.extend(node["children"])
+    with open(os.path.join(files_root, 'load_flat.json'), 'w', encoding='utf-8') as fh:
+        json.dump(flat, fh, indent=2, ensure_ascii=False)
+
+
+async def _timed_json(client: httpx.AsyncClient, url: str, body: Dict[str, Any]) -> Tuple[int, float, Optional[float]]:
+    start = time.perf_counter()
+    r = await client.post(url, json=body)
+    return r.status_code, time.perf_counter() - start, None
+
+
+async def _timed_stream(client: httpx.AsyncClient, url: str, body: Dict[str, Any]) -> Tuple[int, float, Optional[float]]:
+    """POST to an SSE endpoint; the status is 200 only if the stream ended with a `done` event."""
+    start = time.perf_counter()
+    first = None
+    event = None
+    async with client.stream('POST', url, json=body) as r:
+        async for line in r.aiter_lines():
+            if line.startswith('event: '):
+                event = line[len('event: '):]
+                if event == 'token' and first is None:
+                    first = time.perf_counter() - start
+        status = r.status_code if event == 'done' else 502
+    return status, time.perf_counter() - start, first
+
+
+def _requests(ids: Dict[str, int]) -> Dict[str, Callable[[httpx.AsyncClient], Awaitable[Tuple[int, float, Optional[float]]]]]:
+    bio = {"existing_bio": "", "messages": CHAT, "bypassCache": True}
+    rewrite = {
+        "messageToRewrite": {"text": CHAT[0], "speaker": "user_1"},
+        "speakerProfile": {"speaker": "user_1", "bio": "Cycles to work every day."},
+        "messagesInTheChat": CHAT[1:],
+        "bypassCache": True,
+    }
+    return {
+        'bio': lambda c: _timed_json(c, '/api/llm/generate-bio', bio),
+        'bio_stream': lambda c: _timed_stream(c, '/api/llm/generate-bio/stream', bio),
+        'rewrite': lambda c: _timed_json(c, '/api/llm/rewrite-message', rewrite),
+        'rewrite_stream': lambda c: _timed_stream(c, '/api/llm/rewrite-message/stream', rewrite),
+        'rewrite_draft': lambda c: _timed_json(c, f"/api/llm/rewrite-draft/{ids['load_draft.json']}", {"bypassCache": True}),
+        'fix': lambda c: _timed_json(c, f"/api/files/fix/{ids['load_flat.json']}/preview?force_llm=true&bypass_cache=true", {}),
+    }
+
+
+async def _run_level(base_url: str, send: Callable, concurrency: int, total: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    statuses: Counter = Counter()
+    queue = iter(range(total))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+        async def worker() -> None:
+            for _ in queue:
+                try:
+                    status, elapsed, first = await send(client)
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                    continue
+                statuses[str(status)] += 1
+                latencies.append(elapsed)
+                if first is not None:
+                    ttfts.append(first)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    result = summarize(latencies) if latencies else {"runs": 0}
+    result["requests_per_s"] = round(total / wall, 2)
+    result["statuses"] = dict(sorted(statuses.items()))
+    if ttfts:
+        result["ttft"] = summarize(ttfts)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n')[0].strip(), formatter_class=argparse.RawDescriptionHelpFormatter,
+        parents=[fake_groq.build_parser(add_help=False)],
+    )
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=64, help='requests per scenario and concurrency level')
+    parser.add_argument('--draft-messages', type=int, default=20, help='messages of the draft rewritten by rewrite_draft')
+    parser.add_argument('--out', default='llm_load_report.json')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='conv_llm_load_')
+    try:
+        fake_port, backend_port = _free_port(), _free_port()
+        fake_app = fake_groq.create_app(args)
+        _serve(fake_app, fake_port)
+
+        # configure the backend before importing it
+        os.environ['BACKEND_DATA_DIR'] = data_dir
+        os.environ['GROQ_BASE_URL'] = f'http://127.0.0.1:{fake_port}'
+        os.environ['LLM_CACHE'] = '0'
+        os.environ['FS_WATCHER'] = '0'
+        _prepare_files(os.path.join(data_dir, 'files_root'), args.draft_messages)
+        import main as backend
+        from scripts import llm_calls
+
+        _serve(backend.app, backend_port)
+        base_url = f'http://127.0.0.1:{backend_port}'
+        httpx.post(f'{base_url}/api/migrate-files').raise_for_status()
+        ids = {name: fid for fid, name in backend._db.query_all('SELECT id, name FROM files')}
+        senders = _requests(ids)
+
+        results: Dict[str, Dict[str, Any]] = {}
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                fake_app.state.fake.reset()
+                result = asyncio.run(_run_level(base_url, senders[scenario], concurrency, args.requests))
+                result["upstream"] = dict(fake_app.state.fake.stats)
+                key = f'{scenario}/c{concurrency}'
+                results[key] = result
+                print(f"  {key:<24} p50 {result.get('p50_ms', 0):>9.1f} ms  p95 {result.get('p95_ms', 0):>9.1f} ms  "
+                      f"{result['requests_per_s']:>7.2f} req/s  {result['statuses']}  upstream peak {result['upstream']['peak_in_flight']}", flush=True)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    fake_options = {a.dest: getattr(args, a.dest) for a in fake_groq.build_parser(add_help=False)._actions}
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "llm_max_concurrency": llm_calls.LLM_MAX_CONCURRENCY,
+            "groq_max_retries": llm_calls.sdk_max_retries,
+            "params": {"scenarios": args.scenarios, "concurrency": args.concurrency, "requests": args.requests,
+                       "draft_messages": args.draft_messages, "fake_groq": fake_options},
+        },
+        "results": results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nreport written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
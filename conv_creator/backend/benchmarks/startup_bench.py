@@ -0,0 +1,110 @@
+"""
+Cold-start benchmark of the backend.
+
+Starts fresh interpreters (like uvicorn spawning workers) and measures, in each:
+
+  - import_ms         `import main` (must do no I/O and not load the LLM client)
+  - startup_ms        the lifespan startup: folders, DB schema check, journal
+                      recovery, watcher
+  - first_request_ms  a first GET /api/files
+  - llm_client_ms     creating the Groq client on first use (paid by the first
+                      LLM request, not at startup)
+
+and reports the median and max of each over --runs runs. Exits with status 1
+when the median import + startup time exceeds --target-ms, so it can guard
+against regressions.
+
+Run from the backend folder:
+
+    python -m benchmarks.startup_bench [--runs 10] [--target-ms 500] [--data-dir DIR] [--json out.json]
+
+Without --data-dir every run starts from an empty data folder, which includes
+creating the database.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import main
+import_ms = (time.perf_counter() - t0) * 1000
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+t1 = time.perf_counter()
+with client:
+    t2 = time.perf_counter()
+    client.get('/api/files').raise_for_status()
+    t3 = time.perf_counter()
+    groq_loaded = 'groq' in sys.modules
+    from scripts import llm_calls
+    t4 = time.perf_counter()
+    llm_calls._groq()
+    t5 = time.perf_counter()
+print(json.dumps({
+    "import_ms": import_ms,
+    "startup_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "llm_client_ms": (t5 - t4) * 1000,
+    "groq_imported_before_first_llm_call": groq_loaded,
+}))
+'''
+
+
+def probe(data_dir: str) -> dict:
+    env = {
+        **os.environ,
+        'BACKEND_DATA_DIR': data_dir,
+        'LLM_CACHE_PATH': os.path.join(data_dir, 'llm_cache.sqlite3'),
+        'GROQ_API_KEY': os.environ.get('GROQ_API_KEY') or 'startup-bench',
+    }
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip(), formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--target-ms', type=float, default=500.0, help='budget for the median import + startup time')
+    parser.add_argument('--data-dir', help='existing data folder to start on (default: a new empty one per run)')
+    parser.add_argument('--json', dest='json_out', help='also write the results to this file')
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        data_dir = args.data_dir or tempfile.mkdtemp(prefix='conv_startup_')
+        try:
+            runs.append(probe(data_dir))
+        finally:
+            if not args.data_dir:
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+    summary = {}
+    for key in ('import_ms', 'startup_ms', 'first_request_ms', 'llm_client_ms'):
+        values = [r[key] for r in runs]
+        summary[key] = {"median": round(statistics.median(values), 1), "max": round(max(values), 1)}
+        print(f"{key:<18} median {summary[key]['median']:>8.1f} ms   max {summary[key]['max']:>8.1f} ms")
+    cold_start = statistics.median(r['import_ms'] + r['startup_ms'] for r in runs)
+    eager_llm = any(r['groq_imported_before_first_llm_call'] for r in runs)
+    print(f"{'import + startup':<18} median {cold_start:>8.1f} ms   target {args.target_ms:.0f} ms")
+    if eager_llm:
+        print("the Groq client was loaded before the first LLM call")
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as fh:
+            json.dump({"runs": runs, "summary": summary, "cold_start_ms": round(cold_start, 1), "target_ms": args.target_ms}, fh, indent=2)
+    if cold_start > args.target_ms or eager_llm:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
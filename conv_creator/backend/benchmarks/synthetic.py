@@ -0,0 +1,85 @@
+"""
+Synthetic discussion files for benchmarks.
+
+`make_discussion` builds a {"users", "tree"} document and `make_draft` a draft
+({"fileRef", "users", "tree", "discussion"}) of a given size, shaped like the
+real ones: a few dozen speakers, a tree whose fan-out shrinks with depth, and
+message texts mixing short replies with long paragraphs and non-ASCII text.
+Output is deterministic for a given seed.
+
+SHAPES gives a few tree shapes of the same size: 'balanced' (the default),
+'wide' (huge fan-out, a handful of levels) and 'deep' (long reply chains, up
+to a couple of hundred levels).
+"""
+
+import random
+from typing import Any, Dict, List
+
+WORDS = (
+    'the a we you they think agree disagree because however source claim evidence policy vote people '
+    'city tax school bike lane park budget council data study report perché però città così già '
+    'más también opinión über schön ça été'
+).split()
+
+
+def _text(rng: random.Random) -> str:
+    length = rng.choice((4, 8, 15, 30, 60, 120))
+    return ' '.join(rng.choice(WORDS) for _ in range(length)).capitalize() + '.'
+
+
+def make_users(count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {"speaker": f"user_{i}", "name": f"User {i}", "description": "This is a telegram user", "bio": _text(rng)}
+        for i in range(count)
+    ]
+
+
+# shape -> (max fan-out at the root, min fan-out, max depth); fan-out shrinks by one per level
+SHAPES = {
+    'balanced': (6, 2, 64),
+    'wide': (60, 20, 8),
+    'deep': (3, 1, 200),
+}
+
+
+def make_tree(nodes: int, rng: random.Random, speakers: int = 40, shape: str = 'balanced') -> Dict[str, Any]:
+    """Build a tree of exactly `nodes` nodes, breadth-first, following one of SHAPES.
+
+    Unless the shape allows a fan-out of 1, the depth stays logarithmic in the
+    size. Nodes at the maximum depth get no children; when the frontier runs
+    out, new branches start again under the root.
+    """
+    max_fanout, min_fanout, max_depth = SHAPES[shape]
+    root = {"id": "1", "speaker": "user_0", "text": _text(rng), "children": []}
+    frontier = [(root, 0)]
+    created = 1
+    while created < nodes:
+        next_frontier = []
+        for node, depth in frontier:
+            if depth >= max_depth:
+                continue
+            fanout = rng.randint(1, max(min_fanout, max_fanout - depth))
+            for _ in range(fanout):
+                if created >= nodes:
+                    break
+                created += 1
+                child = {"id": str(created), "speaker": f"user_{rng.randrange(speakers)}", "text": _text(rng), "children": []}
+                node["children"].append(child)
+                next_frontier.append((child, depth + 1))
+        frontier = next_frontier or [(root, 0)]
+    return root
+
+
+def make_discussion(nodes: int, seed: int = 0, shape: str = 'balanced') -> Dict[str, Any]:
+    rng = random.Random(seed)
+    return {"users": make_users(40, rng), "tree": make_tree(nodes, rng, shape=shape)}
+
+
+def make_draft(nodes: int, messages: int, seed: int = 0, shape: str = 'balanced') -> Dict[str, Any]:
+    rng = random.Random(seed)
+    users = make_users(40, rng)
+    discussion = [
+        {"id": i, "referenceId": str(rng.randint(1, nodes)), "speaker": f"user_{rng.randrange(40)}", "text": _text(rng), "addressees": []}
+        for i in range(messages)
+    ]
+    return {"fileRef": "synthetic.json", "users": users, "tree": make_tree(nodes, rng, shape=shape), "discussion": discussion}
@@ -1,15 +1,21 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 import os
 import sys
 import json
-import sqlite3
+import base64
 import shutil
+import errno
+import time
+import uuid
+import threading
+from contextlib import asynccontextmanager
 from typing import List, Optional, Dict, Any, Tuple
 import logging
 from datetime import datetime
+from python_multipart.multipart import MultipartParser, parse_options_header
 
 # Add backend directory to Python path so we can import scripts module
 BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,10 +23,50 @@ if BACKEND_DIR not in sys.path:
     sys.path.insert(0, BACKEND_DIR)
 
 # Now we can import from scripts
-from scripts.llm_calls import transform_discussion_json, generate_user_bio, generate_message_rewrite
+from scripts.llm_calls import (
+    transform_discussion_json,
+    transform_discussion_json_async,
+    generate_user_bio_async,
+    generate_message_rewrite_async,
+    stream_user_bio_async,
+    stream_message_rewrite_async,
+    generate_message_rewrites_async,
+)
+from scripts.db import SQLitePool
+from scripts.llm_cache import response_cache
+from scripts.tree_builder import build_discussion_tree
+from scripts import tree_index
+from scripts import blob_store
+from scripts.doc_cache import documents
+from scripts.json_patch import InvalidPatch, JsonPatchError, PatchTestFailed
+from scripts import patch_journal
+from scripts.patch_journal import PatchJournal, VersionConflict
+from scripts.fs_watcher import FilesWatcher
+from scripts.http_cache import CompressedBodyCache, GZIP_MIN_BYTES, accepts_gzip, etag_for, file_version, gzip_etag, is_not_modified, iter_file, iter_gzip, last_modified
+from scripts.classify import StreamingDigest, classify_file, classify_paths, hash_file, shutdown_pool
+from scripts import json_codec
+from scripts import metrics
+
+
+class JSONCodecResponse(JSONResponse):
+    """JSONResponse encoded with scripts/json_codec (orjson when available)."""
+
+    def render(self, content: Any) -> bytes:
+        return json_codec.dumps(content)
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    _startup()
+    try:
+        yield
+    finally:
+        _shutdown()
+
 
-# FastAPI app
-app = FastAPI()
+# FastAPI app. Importing this module does no I/O: folders, the DB schema check,
+# journal recovery and the watcher run in _startup, the LLM client on first use.
+app = FastAPI(default_response_class=JSONCodecResponse, lifespan=_lifespan)
 
 # Configuration
 # Use the already computed absolute BACKEND_DIR (set earlier using
@@ -28,28 +74,81 @@ app = FastAPI()
 # os.path.dirname(__file__) which can be a relative path depending on
 # how the application is started (this caused incorrect FILES_ROOT
 # resolution and 'file not found' errors).
-FILES_ROOT = os.path.join(BACKEND_DIR, 'files_root')
-if not os.path.exists(FILES_ROOT):
-    os.makedirs(FILES_ROOT, exist_ok=True)
-    # Log when we create the folder so startup logs contain useful info
-    logger = logging.getLogger('uvicorn.error')
-    logger.error(f"Created FILES_ROOT directory at: {FILES_ROOT}")
-else:
-    logger = logging.getLogger('uvicorn.error')
-    logger.info(f"Using existing FILES_ROOT: {FILES_ROOT}")
+# Folder holding files_root/, the database and the blob store. Defaults to the
+# backend folder; BACKEND_DATA_DIR points the app at another data set (e.g. the
+# benchmarks). Stored file paths are relative to it ('files_root/...').
+DATA_DIR = os.path.abspath(os.getenv('BACKEND_DATA_DIR', BACKEND_DIR))
+FILES_ROOT = os.path.join(DATA_DIR, 'files_root')
 ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
 ]
 
-# Use the existing sqlite DB in the backend folder if present
-DB_PATH = os.path.join(BACKEND_DIR, 'db.sqlite3')
+# Use the existing sqlite DB in the data folder if present
+DB_PATH = os.getenv('DB_PATH', os.path.join(DATA_DIR, 'db.sqlite3'))
 logger = logging.getLogger('uvicorn.error')
-logger.info(f"BACKEND_DIR={BACKEND_DIR} FILES_ROOT={FILES_ROOT} DB_PATH={DB_PATH}")
 
 
-def _init_db() -> None:
-    conn = sqlite3.connect(DB_PATH)
+FILE_COLUMNS = 'id, name, size, uploadDate, type, path, structure_ok, category'
+FILE_UPSERT_SQL = (
+    'INSERT INTO files(name, size, uploadDate, type, path, structure_ok, category, mtime_ns, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+    ' ON CONFLICT(name) DO UPDATE SET size=excluded.size, uploadDate=excluded.uploadDate, type=excluded.type, path=excluded.path,'
+    ' structure_ok=excluded.structure_ok, category=excluded.category, mtime_ns=excluded.mtime_ns, content_hash=excluded.content_hash'
+)
+# file types tracked in the files table
+ALLOWED_EXTS = {'.json', '.pkl', '.csv'}
+# uploads larger than this are rejected with 413 (0 disables the limit)
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(512 * 1024 * 1024)))
+# directory of a file relative to files_root ('' for top-level files, 'sub/dir/' otherwise);
+# rtrim strips every character except '/' from the end, i.e. the basename
+FOLDER_EXPR = "rtrim(CASE WHEN path LIKE 'files_root/%' THEN substr(path, 12) ELSE path END, replace(CASE WHEN path LIKE 'files_root/%' THEN substr(path, 12) ELSE path END, '/', ''))"
+# sort keys accepted by GET /api/files -> SQL expression; each can be read in order from an
+# index created in _init_db (name from the UNIQUE constraint's index, which ends in the rowid id)
+FILE_SORT_KEYS = {
+    'id': 'id',
+    'name': 'name',
+    'size': 'COALESCE(size, 0)',
+    'uploadDate': "COALESCE(uploadDate, '')",
+    'category': "COALESCE(category, '')",
+}
+
+# Shared per-thread connections (WAL mode) for every DB access in this module.
+# The schema is checked when the first connection is opened (see _ensure_db).
+_db = SQLitePool(DB_PATH, on_connect=lambda conn: _ensure_db(conn), observe=metrics.sqlite_observer('main'))
+# optional content-addressed store behind the file-write helpers (see scripts/blob_store.py)
+blobs = blob_store.BlobStore(
+    os.getenv('BLOB_STORE_DIR', os.path.join(DATA_DIR, 'blob_store')),
+    _db,
+    enabled=os.getenv('BLOB_STORE', '0').lower() in ('1', 'true', 'yes'),
+    hardlinks=os.getenv('BLOB_STORE_HARDLINKS', '1').lower() in ('1', 'true', 'yes'),
+)
+
+
+def _row_to_record(r: tuple) -> dict:
+    return {"id": r[0], "name": r[1], "size": r[2], "uploadDate": r[3], "type": r[4], "path": r[5], "structure_ok": r[6], "category": r[7]}
+
+
+_db_ready = False
+_db_ready_lock = threading.Lock()
+
+
+def _ensure_db(conn) -> None:
+    """Create or migrate the schema once per process, on the first connection of `_db`."""
+    global _db_ready
+    with _db_ready_lock:
+        if _db_ready:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            _init_db(conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        _db_ready = True
+
+
+def _init_db(conn) -> None:
     cur = conn.cursor()
     # If files table doesn't exist, create it with an autoincrement id and unique name.
     cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='files'")
@@ -122,111 +221,279 @@ def _init_db() -> None:
                     cur.execute("ALTER TABLE files ADD COLUMN category TEXT")
                 except Exception:
                     pass
-    conn.commit()
-    conn.close()
+    # change-detection columns used by the incremental rescan
+    cur.execute("PRAGMA table_info(files)")
+    cols = [r[1] for r in cur.fetchall()]
+    for col, decl in (('mtime_ns', 'INTEGER'), ('content_hash', 'TEXT')):
+        if col not in cols:
+            try:
+                cur.execute(f"ALTER TABLE files ADD COLUMN {col} {decl}")
+            except Exception:
+                pass
+    # folder (virtual) column and indexes used by the filters of GET /api/files
+    cur.execute("PRAGMA table_xinfo(files)")
+    if 'folder' not in [r[1] for r in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE files ADD COLUMN folder TEXT GENERATED ALWAYS AS ({FOLDER_EXPR}) VIRTUAL")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_files_path ON files(path)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_files_folder ON files(folder, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_files_category ON files(category, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_files_upload_date ON files(COALESCE(uploadDate, ''), id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_files_size ON files(COALESCE(size, 0), id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_files_category_sort ON files(COALESCE(category, ''), id)")
+    # node index for random access into discussion trees (scripts/tree_index.py)
+    tree_index.ensure_schema(conn)
+    blob_store.ensure_schema(conn)
+    patch_journal.ensure_schema(conn)
+
+
+def _upload_date(path: str, stat: os.stat_result) -> str:
+    # the file's own mtime: a file hard-linked to a shared blob has the blob's
+    return datetime.fromtimestamp(blobs.modified_ns(path, stat) / 1e9).isoformat()
+
+
+def _file_record_params(path: str, stat: os.stat_result, classified: Tuple[Optional[int], Optional[str], Optional[str]]) -> tuple:
+    """Build the parameters for FILE_UPSERT_SQL from a stat result and a classify_paths() result."""
+    name = os.path.basename(path)
+    uploadDate = _upload_date(path, stat)
+    ftype = os.path.splitext(path)[1].lstrip('.').lower() or 'unknown'
+    relpath = os.path.relpath(path, DATA_DIR)
+    struct_flag, category, content_hash = classified
+    return (name, stat.st_size, uploadDate, ftype, relpath, struct_flag, category, stat.st_mtime_ns, content_hash)
 
 
-def _upsert_file_record(path: str) -> dict:
+def _upsert_file_record(path: str, classified: Optional[tuple] = None) -> dict:
+    """Upsert one file; `classified` is a precomputed (structure_ok, category, content_hash)."""
     stat = os.stat(path)
-    name = os.path.basename(path)
-    size = stat.st_size
-    uploadDate = datetime.fromtimestamp(stat.st_mtime).isoformat()
-    ftype = os.path.splitext(path)[1].lstrip('.').lower() or 'unknown'
-    relpath = os.path.relpath(path, BACKEND_DIR)
-
-    # classify JSON files and compute structure_ok for JSON files:
-    # struct_flag: 1 = valid tree/draft, 0 = invalid, None = skipped/non-json
-    # category: 'discussion' | 'draft' | 'invalid' | None
-    def _classify_file(full_path: str) -> Tuple[Optional[int], Optional[str]]:
-        if not full_path.lower().endswith('.json'):
-            return None, None
-        parts = os.path.normpath(full_path).split(os.sep)
-        # do not skip user files here; upload should classify everything
-        try:
-            with open(full_path, 'r', encoding='utf-8') as fh:
-                data = json.load(fh)
-        except Exception:
-            return 0, 'invalid'
-
-        def valid_node(node: any) -> bool:
-            if not isinstance(node, dict):
-                return False
-            for k in ('id', 'speaker', 'text', 'children'):
-                if k not in node:
-                    return False
-            if not isinstance(node.get('id'), str):
-                return False
-            if not isinstance(node.get('speaker'), str):
-                return False
-            if not isinstance(node.get('text'), str):
-                return False
-            if not isinstance(node.get('children'), list):
-                return False
-            for ch in node.get('children'):
-                if not valid_node(ch):
-                    return False
-            return True
-
-        # detect draft: has fileRef, users, tree, discussion
-        if isinstance(data, dict) and all(k in data for k in ('fileRef', 'users', 'tree', 'discussion')):
-            # validate tree and discussion minimally
-            tree_ok = isinstance(data.get('tree'), dict) and (valid_node(data['tree']) if isinstance(data.get('tree'), dict) else False)
-            discussion_ok = isinstance(data.get('discussion'), list)
-            if tree_ok and discussion_ok:
-                return 1, 'draft'
-            return 0, 'invalid'
-
-        # detect discussion tree file: top-level users + tree
-        if isinstance(data, dict) and all(k in data for k in ('users', 'tree')):
-            tree_ok = isinstance(data.get('tree'), dict) and (valid_node(data['tree']) if isinstance(data.get('tree'), dict) else False)
-            users_ok = isinstance(data.get('users'), list)
-            if tree_ok and users_ok:
-                return 1, 'discussion'
-            return 0, 'invalid'
-
-        # fallback: invalid
-        return 0, 'invalid'
-
-    struct_flag, category = _classify_file(path)
-
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        'INSERT INTO files(name, size, uploadDate, type, path, structure_ok, category) VALUES (?, ?, ?, ?, ?, ?, ?)' 
-        ' ON CONFLICT(name) DO UPDATE SET size=excluded.size, uploadDate=excluded.uploadDate, type=excluded.type, path=excluded.path, structure_ok=excluded.structure_ok, category=excluded.category',
-        (name, size, uploadDate, ftype, relpath, struct_flag, category),
-    )
-    conn.commit()
+    if classified is None:
+        classified = (*classify_file(path), None)
+    params = _file_record_params(path, stat, classified)
+    name = params[0]
+    _db.execute(FILE_UPSERT_SQL, params)
     # fetch id and return full record
-    cur.execute('SELECT id, name, size, uploadDate, type, path, structure_ok, category FROM files WHERE name = ?', (name,))
-    row = cur.fetchone()
-    conn.close()
+    row = _db.query_one(f'SELECT {FILE_COLUMNS} FROM files WHERE name = ?', (name,))
     if row:
-        return {"id": row[0], "name": row[1], "size": row[2], "uploadDate": row[3], "type": row[4], "path": row[5], "structure_ok": row[6], "category": row[7]}
-    return {"name": name, "size": size, "uploadDate": uploadDate, "type": ftype, "path": relpath, "category": category}
+        rec = _row_to_record(row)
+        # the node index is rebuilt by the next lookup (tree_index.ensure_index), not on every save
+        tree_index.invalidate(_db, rec["id"])
+        return rec
+    return {"name": name, "size": params[1], "uploadDate": params[2], "type": params[3], "path": params[4], "category": params[6]}
+
+
+def _upsert_file_records(paths: List[str], with_hash: bool = False) -> List[dict]:
+    """Upsert many files in a single transaction and return their records.
+
+    Classification is spread over the classify process pool; the results are
+    then written back in one transaction. Files that disappear or cannot be
+    stat'ed between listing and upsert are skipped.
+    """
+    present = []
+    for path in paths:
+        try:
+            present.append((path, os.stat(path)))
+        except OSError:
+            continue
+    if not present:
+        return []
+    classified = classify_paths([p for p, _ in present], with_hash=with_hash)
+    rows = [_file_record_params(p, st, c) for (p, st), c in zip(present, classified)]
+    names = [r[0] for r in rows]
+    records: Dict[str, dict] = {}
+    with _db.transaction() as conn:
+        conn.executemany(FILE_UPSERT_SQL, rows)
+        # keep well below SQLite's host-parameter limit
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for r in conn.execute(f'SELECT {FILE_COLUMNS} FROM files WHERE name IN ({placeholders})', chunk):
+                records[r[1]] = _row_to_record(r)
+    return [records[n] for n in names if n in records]
 
 
 def _delete_file_record(name: str) -> None:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute('DELETE FROM files WHERE name = ?', (name,))
-    conn.commit()
-    conn.close()
+    _db.execute('DELETE FROM files WHERE name = ?', (name,))
 
 
-def _list_files_db() -> List[dict]:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute('SELECT id, name, size, uploadDate, type, path, structure_ok, category FROM files')
-    rows = cur.fetchall()
-    conn.close()
-    return [
-        {"id": r[0], "name": r[1], "size": r[2], "uploadDate": r[3], "type": r[4], "path": r[5], "structure_ok": r[6], "category": r[7]} for r in rows
-    ]
+def _iter_tracked_files(start: str):
+    """Yield (full_path, stat) for every tracked file under `start` using os.scandir.
+
+    The stat results come from the directory listing itself, so no extra
+    system call per file is needed to compare against the DB.
+    """
+    stack = [start]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in ALLOWED_EXTS:
+                            yield entry.path, entry.stat()
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+def _rescan_files(start: str, full: bool = False, use_hash: bool = False) -> dict:
+    """Bring the files table in sync with the files under `start`.
+
+    Only new files and files whose size/mtime differ from the stored values are
+    reclassified; rows for files that vanished from disk are deleted. With
+    `use_hash`, a file whose mtime changed but whose content hash matches the
+    stored one only gets its mtime refreshed. `full` reclassifies everything.
+
+    Returns the upserted records plus a diff of what changed.
+    """
+    start = os.path.normpath(start)
+    # stored rows under `start`, keyed by their path relative to DATA_DIR
+    stored: Dict[str, tuple] = {}
+    for rid, name, relpath, size, mtime_ns, content_hash in _db.query_all(
+        'SELECT id, name, path, size, mtime_ns, content_hash FROM files'
+    ):
+        resolved = _resolve_stored_relpath(relpath)
+        if resolved == start or resolved.startswith(start + os.sep):
+            stored[os.path.relpath(resolved, DATA_DIR)] = (rid, name, relpath, size, mtime_ns, content_hash)
+
+    added: List[str] = []
+    modified: List[str] = []
+    touched: List[tuple] = []
+    unchanged = 0
+    for full_path, st in _iter_tracked_files(start):
+        rel = os.path.relpath(full_path, DATA_DIR)
+        row = stored.pop(rel, None)
+        if row is None:
+            added.append(full_path)
+            continue
+        _, _, _, size, mtime_ns, content_hash = row
+        if not full and size == st.st_size and mtime_ns == st.st_mtime_ns:
+            unchanged += 1
+            continue
+        if not full and use_hash and content_hash and size == st.st_size:
+            try:
+                same = hash_file(full_path) == content_hash
+            except OSError:
+                same = False
+            if same:
+                touched.append((_upload_date(full_path, st), st.st_mtime_ns, row[0]))
+                continue
+        modified.append(full_path)
+
+    records = _upsert_file_records(added + modified, with_hash=use_hash)
+    with _db.transaction() as conn:
+        if touched:
+            conn.executemany('UPDATE files SET uploadDate = ?, mtime_ns = ? WHERE id = ?', touched)
+        # guard on the stored path: an upsert above may have re-pointed a row with
+        # the same name at a file in another folder
+        removed = [(rid, relpath) for rid, _, relpath, _, _, _ in stored.values()]
+        if removed:
+            conn.executemany('DELETE FROM files WHERE id = ? AND path = ?', removed)
+
+    def _rel(paths: List[str]) -> List[str]:
+        return [os.path.relpath(p, DATA_DIR) for p in paths]
+
+    return {
+        "files": records,
+        "added": _rel(added),
+        "modified": _rel(modified),
+        "removed": [row[2] for row in stored.values()],
+        "touched": len(touched),
+        "unchanged": unchanged,
+    }
+
+
+def _sync_changed_paths(files: set, dirs: set) -> None:
+    """Apply filesystem changes reported by the watcher to the files table.
+
+    Directories get an incremental rescan (from the nearest folder that still
+    exists); single files are upserted or deleted, skipping those whose
+    size/mtime already match their row (e.g. files just written by the API).
+    """
+    root = os.path.normpath(FILES_ROOT)
+    starts = set()
+    for d in dirs:
+        d = os.path.normpath(d)
+        while d != root and not os.path.isdir(d):
+            d = os.path.dirname(d)
+        if d == root or d.startswith(root + os.sep):
+            starts.add(d)
+    # nested folders are covered by their ancestors
+    starts = {d for d in starts if not any(d != o and d.startswith(o + os.sep) for o in starts)}
+    for start in starts:
+        documents.invalidate_tree(start)
+        _rescan_files(start)
+
+    to_upsert = []
+    for path in files:
+        path = os.path.normpath(path)
+        if os.path.splitext(path)[1].lower() not in ALLOWED_EXTS or any(path.startswith(s + os.sep) for s in starts):
+            continue
+        rel = os.path.relpath(path, DATA_DIR)
+        row = _db.query_one('SELECT id, size, mtime_ns FROM files WHERE path = ?', (rel,))
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if row is not None:
+                _db.execute('DELETE FROM files WHERE id = ? AND path = ?', (row[0], rel))
+            documents.invalidate(path)
+            continue
+        if row is not None and row[1] == st.st_size and row[2] == st.st_mtime_ns:
+            continue
+        to_upsert.append(path)
+    if to_upsert:
+        _upsert_file_records(to_upsert)
+    if starts or to_upsert:
+        logger.info(f"files watcher: rescanned {len(starts)} folder(s), upserted {len(to_upsert)} file(s)")
+
+
+_watcher: Optional[FilesWatcher] = None
+
+
+def _start_watcher() -> None:
+    global _watcher
+    if os.getenv('FS_WATCHER', '0').lower() not in ('1', 'true', 'yes'):
+        return
+    _watcher = FilesWatcher(
+        FILES_ROOT,
+        _sync_changed_paths,
+        mode=os.getenv('FS_WATCHER_MODE', 'auto'),
+        debounce=float(os.getenv('FS_WATCHER_DEBOUNCE', '0.5')),
+        poll_interval=float(os.getenv('FS_WATCHER_POLL_INTERVAL', '5')),
+    )
+    _watcher.start()
+
 
+def _recover_patch_journals() -> None:
+    recovered = journals.recover(FILES_ROOT)
+    if recovered:
+        logger.info(f"patch journal: compacted {recovered} journal(s) left by a previous run")
 
-# initialize DB on startup
-_init_db()
+
+def _startup() -> None:
+    """Run once per worker before it serves requests (see _lifespan)."""
+    started = time.perf_counter()
+    if not os.path.exists(FILES_ROOT):
+        os.makedirs(FILES_ROOT, exist_ok=True)
+        # Log when we create the folder so startup logs contain useful info
+        logger.error(f"Created FILES_ROOT directory at: {FILES_ROOT}")
+    else:
+        logger.info(f"Using existing FILES_ROOT: {FILES_ROOT}")
+    logger.info(f"BACKEND_DIR={BACKEND_DIR} FILES_ROOT={FILES_ROOT} DB_PATH={DB_PATH}")
+    # open this thread's connection now so the schema check does not delay the first request
+    _db.connection()
+    _recover_patch_journals()
+    _start_watcher()
+    logger.info(f"startup completed in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+def _shutdown() -> None:
+    if _watcher is not None:
+        _watcher.stop()
+    journals.flush_all()
+    _db.close_all()
+    response_cache.close()
+    shutdown_pool()
 
 # Allow frontend (Vue) to talk to backend
 app.add_middleware(
@@ -234,13 +501,17 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
+    expose_headers=["X-Next-Cursor", "X-Document-Version"],
     allow_headers=["*"],
 )
+# request latency/size metrics for GET /metrics (outermost, so CORS is included)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # mount files_root for direct static serving (useful for images/graphics)
-app.mount("/files", StaticFiles(directory=FILES_ROOT), name="files")
+# (check_dir=False: files_root is created at startup, not at import)
+app.mount("/files", StaticFiles(directory=FILES_ROOT, check_dir=False), name="files")
 # keep original backend static mount as well
-app.mount("/static-backend", StaticFiles(directory=BACKEND_DIR), name="static-backend")
+app.mount("/static-backend", StaticFiles(directory=DATA_DIR, check_dir=False), name="static-backend")
 
 
 def _safe_path(rel_path: str) -> str:
@@ -275,8 +546,8 @@ def _resolve_stored_relpath(relpath: str) -> str:
         stripped = rp[len(prefix):]
         candidate = os.path.normpath(os.path.join(FILES_ROOT, stripped))
         return candidate
-    # fallback: if stored path looks like an absolute path under BACKEND_DIR, join with BACKEND_DIR
-    candidate_backend = os.path.normpath(os.path.join(BACKEND_DIR, rp))
+    # fallback: if stored path looks like an absolute path under DATA_DIR, join with DATA_DIR
+    candidate_backend = os.path.normpath(os.path.join(DATA_DIR, rp))
     if os.path.exists(candidate_backend):
         return candidate_backend
     # final fallback: interpret as path under FILES_ROOT
@@ -289,17 +560,26 @@ def _resolve_stored_relpath(relpath: str) -> str:
 def _atomic_write_json(full_path: str, data: any, ensure_ascii: bool = False) -> None:
     """Write JSON to disk atomically (write to temp file then replace).
 
-    Raises the original exception on failure. Caller may wrap in HTTPException.
+    `data` replaces the whole document, so JSON patches of the file that were
+    not compacted yet are dropped. Raises the original exception on failure.
+    Caller may wrap in HTTPException.
     """
+    journals.discard(full_path)
+    _replace_json_file(full_path, data, ensure_ascii)
+
+
+def _replace_json_file(full_path: str, data: any, ensure_ascii: bool = False) -> None:
     tmp = full_path + '.tmp'
     try:
         # ensure parent dir exists
         parent = os.path.dirname(full_path)
         if parent:
             os.makedirs(parent, exist_ok=True)
-        with open(tmp, 'w', encoding='utf-8') as fh:
-            json.dump(data, fh, indent=2, ensure_ascii=ensure_ascii)
+        with open(tmp, 'wb') as fh:
+            json_codec.dump_file(fh, data, ensure_ascii=ensure_ascii)
         os.replace(tmp, full_path)
+        documents.invalidate(full_path)
+        blobs.track(full_path)
     except Exception:
         # best-effort cleanup of tmp file
         try:
@@ -310,16 +590,119 @@ def _atomic_write_json(full_path: str, data: any, ensure_ascii: bool = False) ->
         raise
 
 
+def _compact_document(full_path: str, data: Any) -> None:
+    """Write a document with its journaled patches applied and refresh its DB record."""
+    _replace_json_file(full_path, data)
+    _upsert_file_record(full_path)
+
+
+# JSON patches saved through the PATCH endpoints, compacted into the files later
+journals = PatchJournal(
+    _compact_document,
+    _db,
+    # byte-range locks on this file keep the workers of one deployment from racing on a journal
+    lock_path=os.path.join(DATA_DIR, '.patchlog.lock'),
+)
+
+# gzip bodies of large JSON files, per file version
+_gzip_bodies = CompressedBodyCache()
+
+metrics.register_cache('documents', documents.stats)
+metrics.register_cache('gzip', _gzip_bodies.stats)
+metrics.register_cache('llm', response_cache.stats)
+# versions (path, size, mtime_ns) already parsed successfully by _json_file_response
+_valid_json_versions: Dict[str, Tuple[int, int]] = {}
+
+
+def _json_file_response(request: Request, full: str) -> Response:
+    """Serve a JSON file with ETag/Last-Modified validation and optional gzip.
+
+    Once a version of the file is known to be valid JSON (classified as a valid
+    tree/draft in the DB, or parsed here before) its bytes are sent as they are
+    instead of being parsed and re-serialised. Headers and body come from the
+    same open file, so a write racing with the request cannot pair the headers
+    of one version with the bytes of another.
+    """
+    journals.flush(full)
+    fh = open(full, 'rb')
+    try:
+        st = os.fstat(fh.fileno())
+        row = _db.query_one('SELECT structure_ok, size, mtime_ns, content_hash FROM files WHERE path = ?', (os.path.relpath(full, DATA_DIR),))
+        current = row is not None and row[1] == st.st_size and row[2] == st.st_mtime_ns
+        gzipped = st.st_size >= GZIP_MIN_BYTES and accepts_gzip(request.headers)
+        etag = etag_for(st, row[3] if current else None)
+        if gzipped:
+            etag = gzip_etag(etag)
+        headers = {
+            "ETag": etag, "Last-Modified": last_modified(st), "Cache-Control": "no-cache", "Vary": "Accept-Encoding",
+            # base version for JSON patches sent to the PATCH endpoints
+            "X-Document-Version": journals.version(full),
+        }
+        if is_not_modified(request.headers, etag, st):
+            fh.close()
+            return Response(status_code=304, headers=headers)
+
+        version = file_version(full, st)
+        known_valid = (current and row[0] == 1) or _valid_json_versions.get(full) == version[1:]
+        if not known_valid:
+            try:
+                json_codec.loads(fh.read())
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Failed to parse JSON: {e}")
+            fh.seek(0)
+            _valid_json_versions[full] = version[1:]
+
+        if not gzipped:
+            return StreamingResponse(iter_file(fh), media_type='application/json', headers={**headers, "Content-Length": str(st.st_size)})
+        headers["Content-Encoding"] = "gzip"
+        if not _gzip_bodies.fits(st.st_size):
+            # larger than the whole cache: compress while sending rather than in memory
+            return StreamingResponse(iter_gzip(fh), media_type='application/json', headers=headers)
+        body = _gzip_bodies.get(version, fh)
+        fh.close()
+        return Response(content=body, media_type='application/json', headers=headers)
+    except BaseException:
+        fh.close()
+        raise
+
+
+def _encode_cursor(value: Any, rid: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, rid]).encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor: str) -> Tuple[Any, int]:
+    try:
+        value, rid = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return value, int(rid)
+    except Exception:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
 @app.get("/api/files")
-def list_files(folder: Optional[str] = None) -> List[Dict[str, Any]]:
+def list_files(
+    response: Response,
+    folder: Optional[str] = None,
+    category: Optional[str] = None,
+    structure_ok: Optional[int] = None,
+    sort: str = 'id',
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> List[Dict[str, Any]]:
     """List available files from the SQLite metadata table.
 
-    If folder is provided it filters results to that subfolder (relative to files_root).
+    If folder is provided it filters results to that subfolder (relative to files_root),
+    including nested folders; otherwise only top-level files are listed.
     If DB is empty it will scan FILES_ROOT (or the provided folder) to populate the DB.
+
+    Optional filters, all evaluated in SQL:
+      - category: one category or a comma-separated list (discussion,draft,invalid)
+      - structure_ok: 0 or 1
+      - sort: id | name | size | uploadDate | category, prefix with '-' for descending
+      - limit + cursor: keyset pagination; when more rows are available the
+        cursor for the next page is returned in the X-Next-Cursor header
     """
     import os
     from datetime import datetime
-    rows = _list_files_db()
     def fill_defaults(file_row):
         # Always set type to 'json' if missing or None
         if not file_row.get('type'):
@@ -333,59 +716,57 @@ def list_files(folder: Optional[str] = None) -> List[Dict[str, Any]]:
             else:
                 file_row['uploadDate'] = datetime.now().isoformat()
         return file_row
-    if rows:
-        if folder:
-            folder_prefix = os.path.normpath(os.path.join('files_root', folder))
-            def in_folder(relpath: str) -> bool:
-                rp = os.path.normpath(relpath)
-                if rp == folder_prefix:
-                    return True
-                return rp.startswith(folder_prefix + os.sep)
-
-            filtered = [fill_defaults(r) for r in rows if in_folder(r['path'])]
-            return filtered
-
-        top_level = []
-        for r in rows:
-            rp = os.path.normpath(r.get('path', ''))
-            prefix = os.path.normpath('files_root') + os.sep
-            if rp.startswith(prefix):
-                rel = rp[len(prefix):]
-            else:
-                rel = rp
-            if rel and os.sep not in rel:
-                top_level.append(fill_defaults(r))
-        return top_level
-
-    # fallback: walk FILES_ROOT and populate DB (respect folder if provided)
-    allowed_exts = {'.json', '.pkl', '.csv'}
-    entries = []
+
+    descending = sort.startswith('-')
+    sort_expr = FILE_SORT_KEYS.get(sort.lstrip('-'))
+    if sort_expr is None:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(FILE_SORT_KEYS)}")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail='limit must be a positive integer')
+
+    if _db.query_one('SELECT 1 FROM files LIMIT 1') is None:
+        # fallback: scan FILES_ROOT and populate DB (respect folder if provided)
+        start = _safe_path(folder) if folder else FILES_ROOT
+        _rescan_files(start)
+
+    where: List[str] = []
+    params: List[Any] = []
     if folder:
-        start = _safe_path(folder)
-        for root, _, files in os.walk(start):
-            for name in files:
-                if os.path.splitext(name)[1].lower() in allowed_exts:
-                    full = os.path.join(root, name)
-                    rec = _upsert_file_record(full)
-                    entries.append(rec)
+        # everything under the folder: a range scan on the path index
+        prefix = os.path.relpath(_safe_path(folder), DATA_DIR)
+        where.append('(path = ? OR (path >= ? AND path < ?))')
+        params += [prefix, prefix + '/', prefix + chr(ord('/') + 1)]
     else:
-        for root, _, files in os.walk(FILES_ROOT):
-            for name in files:
-                if os.path.splitext(name)[1].lower() in allowed_exts:
-                    full = os.path.join(root, name)
-                    rec = _upsert_file_record(full)
-                    entries.append(rec)
-    return entries
+        where.append("folder = '' AND path != ''")
+    if category:
+        cats = [c.strip() for c in category.split(',') if c.strip()]
+        where.append(f"category IN ({','.join('?' * len(cats))})")
+        params += cats
+    if structure_ok is not None:
+        where.append('structure_ok = ?')
+        params.append(structure_ok)
+    op = '<' if descending else '>'
+    if cursor:
+        value, rid = _decode_cursor(cursor)
+        where.append(f'({sort_expr}, id) {op} (?, ?)')
+        params += [value, rid]
+    order = 'DESC' if descending else 'ASC'
+    sql = f"SELECT {FILE_COLUMNS}, {sort_expr} FROM files WHERE {' AND '.join(where)} ORDER BY {sort_expr} {order}, id {order}"
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+    rows = _db.query_all(sql, params)
+
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers['X-Next-Cursor'] = _encode_cursor(rows[-1][-1], rows[-1][0])
+    return [fill_defaults(_row_to_record(r)) for r in rows]
 
 
 @app.get('/api/files/id/{file_id}')
-def get_file_by_id(file_id: int, download: bool = False):
+def get_file_by_id(request: Request, file_id: int, download: bool = False):
     """Return file metadata or JSON content when targeting by numeric id."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute('SELECT name, path FROM files WHERE id = ?', (file_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = _db.query_one('SELECT name, path FROM files WHERE id = ?', (file_id,))
     # Debug: log DB lookup results to help diagnose missing files
     logger = logging.getLogger('uvicorn.error')
     if not row:
@@ -402,23 +783,129 @@ def get_file_by_id(file_id: int, download: bool = False):
         raise HTTPException(status_code=404, detail='File not found')
     
     if download:
+        journals.flush(full)
         return FileResponse(full, media_type='application/octet-stream', filename=os.path.basename(full))
 
     ext = os.path.splitext(full)[1].lower()
     if ext == '.json':
-        with open(full, 'r', encoding='utf-8') as f:
-            try:
-                return JSONResponse(content=json.load(f))
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Failed to parse JSON: {e}")
+        return _json_file_response(request, full)
     elif ext == '.pkl':
         return {"message": "This is a Python pickle file. Use the download endpoint to retrieve it or process it on the server."}
     else:
         return FileResponse(full, media_type='application/octet-stream', filename=os.path.basename(full))
 
 
+def _indexed_tree_file(file_id: int) -> str:
+    """Resolve a file id to its path and make sure its tree index is current."""
+    row = _db.query_one('SELECT path FROM files WHERE id = ?', (file_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail='File not found')
+    full = _resolve_stored_relpath(row[0])
+    files_root_norm = os.path.normpath(FILES_ROOT)
+    if not (full == files_root_norm or full.startswith(files_root_norm + os.sep)):
+        raise HTTPException(status_code=400, detail='Invalid file path stored in DB')
+    if not os.path.isfile(full):
+        raise HTTPException(status_code=404, detail='File not found')
+    if os.path.splitext(full)[1].lower() != '.json':
+        raise HTTPException(status_code=400, detail='Only JSON files have a tree index')
+    journals.flush(full)
+    tree_index.ensure_index(_db, file_id, full)
+    return full
+
+
+@app.get('/api/files/id/{file_id}/nodes/{node_id}')
+def get_tree_node(file_id: int, node_id: str):
+    """Return one node of a discussion tree without loading the whole file.
+
+    Response: { id, parent_id, depth, speaker, text, child_ids, descendants, path }
+    where `path` lists the node ids from the root down to this node.
+    """
+    full = _indexed_tree_file(file_id)
+    node = tree_index.get_node(_db, file_id, node_id)
+    if node is None:
+        raise HTTPException(status_code=404, detail=f'Node {node_id} not found')
+    return {
+        "id": node["id"],
+        "parent_id": node["parent_id"],
+        "depth": node["depth"],
+        "speaker": node["speaker"],
+        "text": tree_index.read_text(full, node),
+        "child_ids": node["child_ids"],
+        "descendants": node["descendants"],
+        "path": [n["id"] for n in tree_index.get_ancestors(_db, file_id, node_id)],
+    }
+
+
+def _lookup_tree_node(file_id: int, node_id: Optional[str]) -> Dict[str, Any]:
+    node = tree_index.get_node(_db, file_id, node_id) if node_id is not None else tree_index.get_root(_db, file_id)
+    if node is None:
+        raise HTTPException(status_code=404, detail=f'Node {node_id} not found' if node_id is not None else 'File has no indexed tree')
+    return node
+
+
+def _graph_node(node: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape an index entry like a tree node; `child_count` tells truncated nodes apart from leaves."""
+    return {
+        "id": node["id"],
+        "speaker": node["speaker"],
+        "text": node["text"],
+        "depth": node["depth"],
+        "child_count": len(node["child_ids"]),
+        "descendants": node["descendants"],
+        "children": [],
+    }
+
+
+@app.get('/api/files/id/{file_id}/subtree')
+def get_tree_subtree(file_id: int, node: Optional[str] = None, depth: int = 2):
+    """Return the subtree under `node` (the root by default), cut `depth` levels below it.
+
+    Nodes keep the discussion tree shape ({id, speaker, text, children}) and add
+    `child_count`/`descendants`; a node whose `children` is empty while
+    `child_count` > 0 was truncated and can be expanded with another call.
+    """
+    if depth < 0:
+        raise HTTPException(status_code=400, detail='depth must be >= 0')
+    full = _indexed_tree_file(file_id)
+    start = _lookup_tree_node(file_id, node)
+    nodes = tree_index.get_subtree(_db, file_id, start, depth)
+    tree_index.read_texts(full, nodes)
+    shaped: Dict[str, Dict[str, Any]] = {}
+    for n in nodes:
+        item = shaped.setdefault(n["id"], _graph_node(n))
+        parent = None if n["id"] == start["id"] else shaped.get(n["parent_id"])
+        if parent is not None:
+            parent["children"].append(item)
+    return {
+        "file_id": file_id,
+        "node": start["id"],
+        "depth": depth,
+        "path": [n["id"] for n in tree_index.get_ancestors(_db, file_id, start["id"])],
+        "tree": shaped[start["id"]],
+    }
+
+
+@app.get('/api/files/id/{file_id}/branch')
+def get_tree_branch(file_id: int, node: Optional[str] = None):
+    """Return the root-to-leaf branch through `node`.
+
+    The branch runs from the root down to `node`, then follows the first child
+    until a leaf. Each entry carries `child_count` so the caller can see where
+    the discussion forks.
+    """
+    full = _indexed_tree_file(file_id)
+    target = _lookup_tree_node(file_id, node)
+    branch = tree_index.get_ancestors(_db, file_id, target["id"]) + tree_index.get_first_descendants(_db, file_id, target)
+    tree_index.read_texts(full, branch)
+    return {
+        "file_id": file_id,
+        "node": target["id"],
+        "branch": [{k: v for k, v in _graph_node(n).items() if k != "children"} for n in branch],
+    }
+
+
 @app.get("/api/files/{filename:path}")
-def get_file(filename: str, download: bool = False):
+def get_file(request: Request, filename: str, download: bool = False):
     """Return file content for JSON files, a message for PKL, otherwise provide a download.
 
     Frontend can use this to preview JSON, download binaries, or receive a helpful message for pickle files.
@@ -434,12 +921,8 @@ def get_file(filename: str, download: bool = False):
     # in the DB (files may live in subfolders created by the app and the UI may
     # request them by filename only).
     if not os.path.exists(full):
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
         # Try to find a DB entry where the stored name or path matches the requested value
-        cur.execute('SELECT path FROM files WHERE name = ? OR path = ?', (filename, filename))
-        row = cur.fetchone()
-        conn.close()
+        row = _db.query_one('SELECT path FROM files WHERE name = ? OR path = ?', (filename, filename))
         if row:
             relpath = row[0]
             # Resolve a stored DB path robustly
@@ -458,15 +941,12 @@ def get_file(filename: str, download: bool = False):
             raise HTTPException(status_code=404, detail="File not found")
 
     if download:
+        journals.flush(full)
         return FileResponse(full, media_type='application/octet-stream', filename=os.path.basename(full))
 
     ext = os.path.splitext(filename)[1].lower()
     if ext == '.json':
-        with open(full, 'r', encoding='utf-8') as f:
-            try:
-                return JSONResponse(content=json.load(f))
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Failed to parse JSON: {e}")
+        return _json_file_response(request, full)
     elif ext == '.pkl':
         # Pickle files cannot be safely deserialized in the browser; provide a helpful message
         return {"message": "This is a Python pickle file. Use the download endpoint to retrieve it or process it on the server."}
@@ -475,14 +955,62 @@ def get_file(filename: str, download: bool = False):
         return FileResponse(full, media_type='application/octet-stream', filename=filename)
     
 
+def _patch_request(request: Request, body: Any) -> Optional[Tuple[list, Optional[str]]]:
+    """Return (patch, base version) if the body is a JSON Patch save, else None.
+
+    Two forms are accepted: an RFC 6902 array sent as application/json-patch+json
+    (base version in If-Match), or {"patch": [...], "baseVersion": "..."}.
+    Bodies that look like a patch but are not a valid one (an array sent with
+    another content type, a `patch` key that is not a list of operations, extra
+    keys next to `patch`) are rejected with 400 rather than saved as the
+    document: only a JSON object without a `patch` key is a full save.
+    """
+    def operations(patch: Any) -> list:
+        if not isinstance(patch, list) or not all(isinstance(op, dict) for op in patch):
+            raise HTTPException(status_code=400, detail='A JSON patch must be a list of operation objects')
+        return patch
+
+    if request.headers.get('content-type', '').startswith('application/json-patch+json'):
+        base = request.headers.get('if-match')
+        return operations(body), base.strip().strip('"') if base else None
+    if isinstance(body, list):
+        raise HTTPException(status_code=400, detail='Send JSON patch arrays as application/json-patch+json; a document must be a JSON object')
+    if isinstance(body, dict) and 'patch' in body:
+        extra = set(body) - {'patch', 'baseVersion'}
+        if extra:
+            raise HTTPException(status_code=400, detail=f"Unexpected keys next to 'patch': {', '.join(sorted(extra))}")
+        base = body.get('baseVersion')
+        if base is not None and not isinstance(base, str):
+            raise HTTPException(status_code=400, detail='baseVersion must be a string')
+        return operations(body['patch']), base
+    return None
+
+
+def _save_json_patch(full: str, patch: list, base_version: Optional[str]) -> dict:
+    """Apply a JSON patch to a file through its journal and return the new version."""
+    try:
+        version = journals.apply(full, patch, base_version)
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail={"error": "The file changed since baseVersion", "currentVersion": e.current})
+    except InvalidPatch as e:
+        raise HTTPException(status_code=400, detail=f'Invalid JSON patch: {e}')
+    except PatchTestFailed as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except JsonPatchError as e:
+        raise HTTPException(status_code=422, detail=f'JSON patch does not apply: {e}')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f'Target is not valid JSON: {e}')
+    row = _db.query_one(f'SELECT {FILE_COLUMNS} FROM files WHERE path = ?', (os.path.relpath(full, DATA_DIR),))
+    return {"message": "Patched", "version": version, "file": _row_to_record(row) if row else None}
+
+
 @app.patch('/api/files/id/{file_id}')
 async def save_changes_file_by_id(file_id: int, request: Request):
-    """Save changes to a JSON file identified by numeric id."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute('SELECT name, path FROM files WHERE id = ?', (file_id,))
-    row = cur.fetchone()
-    conn.close()
+    """Save changes to a JSON file identified by numeric id.
+
+    The body is either the whole new document or a JSON patch (see `_patch_request`).
+    """
+    row = _db.query_one('SELECT name, path FROM files WHERE id = ?', (file_id,))
     if not row:
         raise HTTPException(status_code=404, detail='File not found')
     name = row[0]
@@ -507,6 +1035,9 @@ async def save_changes_file_by_id(file_id: int, request: Request):
         data = await request.json()
     except Exception as e:
         raise HTTPException(status_code=400, detail=f'Invalid JSON body: {e}')
+    patch_request = _patch_request(request, data)
+    if patch_request is not None:
+        return _save_json_patch(full, *patch_request)
     try:
         _atomic_write_json(full, data)
     except Exception as e:
@@ -529,6 +1060,7 @@ async def save_changes_file_by_name(filename: str, request: Request):
     - If the target does not exist, the endpoint will create a new JSON file of the form
       {"users": [...]} when the caller provides a 'users' array.
     - Only JSON files are allowed for modification via this endpoint.
+    - A JSON patch body (see `_patch_request`) is applied to the existing file instead.
     """
     logger = logging.getLogger('uvicorn.error')
     try:
@@ -551,20 +1083,26 @@ async def save_changes_file_by_name(filename: str, request: Request):
         logger.error(f"save_changes_file_by_name: invalid JSON for {filename}: {e}")
         raise HTTPException(status_code=400, detail=f'Invalid JSON body: {e}')
 
+    patch_request = _patch_request(request, body)
+    if patch_request is not None:
+        if not os.path.isfile(full):
+            raise HTTPException(status_code=404, detail='File not found')
+        return _save_json_patch(full, *patch_request)
+
     users = body.get('users') if isinstance(body, dict) else None
 
     # Determine what to write
     if os.path.exists(full):
         # If file exists, try to parse it and merge/replace 'users'
         try:
-            with open(full, 'r', encoding='utf-8') as fh:
-                data = json.load(fh)
+            data = journals.load(full)
         except Exception:
             # avoid clobbering non-JSON content
             raise HTTPException(status_code=400, detail='Target exists but is not valid JSON')
         if isinstance(data, dict):
             if users is not None:
-                data['users'] = users
+                # the cached document is shared: replace the key on a copy
+                data = {**data, 'users': users}
                 to_write = data
             else:
                 # No users key provided: interpret request as full-replace of object
@@ -581,7 +1119,7 @@ async def save_changes_file_by_name(filename: str, request: Request):
         to_write = {'users': users}
 
     try:
-        logger.info(f"save_changes_file_by_name: writing to {full} (exists={os.path.exists(full)}) size={len(json.dumps(to_write)) if to_write is not None else 0}")
+        logger.info(f"save_changes_file_by_name: writing to {full} (exists={os.path.exists(full)})")
         _atomic_write_json(full, to_write)
     except Exception as e:
         logger.error(f"save_changes_file_by_name: failed to write {full}: {e}")
@@ -593,11 +1131,7 @@ async def save_changes_file_by_name(filename: str, request: Request):
 
 @app.delete('/api/files/id/{file_id}')
 def delete_file_by_id(file_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute('SELECT name, path FROM files WHERE id = ?', (file_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = _db.query_one('SELECT name, path FROM files WHERE id = ?', (file_id,))
     if not row:
         raise HTTPException(status_code=404, detail='File not found')
     name = row[0]
@@ -609,44 +1143,175 @@ def delete_file_by_id(file_id: int):
             os.remove(full)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f'Failed to remove file: {e}')
+        journals.discard(full)
+        documents.invalidate(full)
+        blobs.release(full)
     # remove db record
     _delete_file_record(name)
     return {"message": "Deleted", "file": name, "id": file_id}
 
 
-@app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...), path: Optional[str] = Form(None)):
-    """Upload a file into the backend directory. Overwrites if name exists."""
-    # For uploads we only accept a single filename (no nested paths within file.filename)
-    if os.path.basename(file.filename) != file.filename:
-        raise HTTPException(status_code=400, detail="Invalid upload filename")
-    filename = file.filename
-    if path:
-        # ensure the folder is safe and exists (create if missing)
-        folder_full = _safe_path(path)
-        os.makedirs(folder_full, exist_ok=True)
-        dest = os.path.join(folder_full, filename)
-    else:
-        dest = os.path.join(FILES_ROOT, filename)
+class _UploadReceiver:
+    """Streaming multipart/form-data parser for POST /api/upload.
+
+    The body is parsed as it arrives: the `file` part is written to a temp file
+    in FILES_ROOT (the '.tmp' suffix keeps it out of rescans) and hashed and
+    classified chunk by chunk, and MAX_UPLOAD_BYTES is enforced while receiving.
+    Other parts are kept as small text fields (e.g. `path`).
+    """
+
+    MAX_FIELD_BYTES = 64 * 1024
+
+    def __init__(self, boundary: bytes) -> None:
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.tmp: Optional[str] = None
+        self.digest: Optional[StreamingDigest] = None
+        self._out = None
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b''
+        self._header_value = b''
+        self._field: Optional[str] = None
+        self._value = bytearray()
+        self.complete = False
+        self.parser = MultipartParser(boundary, {
+            'on_part_begin': self._part_begin,
+            'on_header_field': self._header_field_data,
+            'on_header_value': self._header_value_data,
+            'on_header_end': self._header_end,
+            'on_headers_finished': self._headers_finished,
+            'on_part_data': self._part_data,
+            'on_part_end': self._part_end,
+            'on_end': self._end,
+        })
+
+    def _part_begin(self) -> None:
+        self._headers = {}
+        self._field = None
+        self._value = bytearray()
+
+    def _header_field_data(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _header_value_data(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b''
+        self._header_value = b''
+
+    def _headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        name = options.get(b'name', b'').decode('utf-8', 'replace')
+        filename = options.get(b'filename')
+        if name != 'file' or filename is None:
+            self._field = name
+            return
+        if self.tmp is not None:
+            raise HTTPException(status_code=400, detail="Only one file can be uploaded per request")
+        filename = filename.decode('utf-8', 'replace')
+        # For uploads we only accept a single filename (no nested paths within the filename)
+        if not filename or os.path.basename(filename) != filename:
+            raise HTTPException(status_code=400, detail="Invalid upload filename")
+        self.filename = filename
+        self.digest = StreamingDigest(filename)
+        self.tmp = os.path.join(FILES_ROOT, f'.{filename}.{uuid.uuid4().hex}.tmp')
+        self._out = open(self.tmp, 'xb')
+
+    def _part_data(self, data: bytes, start: int, end: int) -> None:
+        chunk = data[start:end]
+        if self._field is not None:
+            if len(self._value) + len(chunk) > self.MAX_FIELD_BYTES:
+                raise HTTPException(status_code=400, detail=f"Form field {self._field!r} is too large")
+            self._value += chunk
+            return
+        if MAX_UPLOAD_BYTES and self.digest.size + len(chunk) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"File exceeds the upload limit of {MAX_UPLOAD_BYTES} bytes")
+        self._out.write(chunk)
+        self.digest.update(chunk)
+
+    def _part_end(self) -> None:
+        if self._field is not None:
+            self.fields[self._field] = self._value.decode('utf-8', 'replace')
+        elif self._out is not None:
+            self._out.close()
+
+    def _end(self) -> None:
+        self.complete = True
+
+    def close(self) -> None:
+        """Close the temp file and remove it unless it was moved into place."""
+        if self._out is not None:
+            self._out.close()
+        if self.tmp is not None:
+            try:
+                os.remove(self.tmp)
+            except OSError:
+                pass
+
+
+@app.post("/api/upload", openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"],
+    "properties": {"file": {"type": "string", "format": "binary"}, "path": {"type": "string"}},
+}}}}})
+async def upload_file(request: Request):
+    """Upload a file (multipart field `file`, optional folder `path`). Overwrites if name exists.
+
+    The body is read from the request stream as it arrives (_UploadReceiver)
+    rather than through UploadFile, which spools the whole body before the
+    handler runs: the size limit stops an oversized upload early and the file is
+    read once.
+    """
+    content_type, options = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or not options.get(b'boundary'):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+    receiver = _UploadReceiver(options[b'boundary'])
     try:
-        with open(dest, 'wb') as out:
-            content = await file.read()
-            out.write(content)
+        try:
+            async for chunk in request.stream():
+                receiver.parser.write(chunk)
+            receiver.parser.finalize()
+            if not receiver.complete:
+                # e.g. the client disconnected: never keep a partial file
+                raise HTTPException(status_code=400, detail="Incomplete multipart body")
+        except (HTTPException, OSError):
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Malformed multipart body: {e}")
+        if receiver.tmp is None:
+            raise HTTPException(status_code=422, detail="Missing file")
+        filename = receiver.filename
+        path = receiver.fields.get('path') or None
+        if path:
+            # ensure the folder is safe and exists (create if missing)
+            folder_full = _safe_path(path)
+            os.makedirs(folder_full, exist_ok=True)
+            dest = os.path.join(folder_full, filename)
+        else:
+            dest = os.path.join(FILES_ROOT, filename)
+        journals.discard(dest)
+        # the temp file is in FILES_ROOT, on the same filesystem as every folder: the move is atomic
+        os.replace(receiver.tmp, dest)
+        receiver.tmp = None
+        digest = receiver.digest
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {e}")
-    # update DB record
-    # Update DB record for the uploaded file and scan the containing folder so
-    # newly uploaded files inside nested folders are all processed.
-    rec = _upsert_file_record(dest)
-    # If a folder was provided, also scan other files in the same folder to
-    # ensure the DB is up-to-date for that directory.
+    finally:
+        receiver.close()
+    documents.invalidate(dest)
+    classified = digest.result()
+    # identical uploads share a single blob
+    blobs.track(dest, classified[2])
+    # update DB record with the classification and hash computed while streaming
+    rec = _upsert_file_record(dest, classified)
+    # If a folder was provided, also bring the rest of that folder up to date
+    # (only files that changed since they were last seen are reclassified).
     if path:
         try:
-            folder_full = os.path.normpath(folder_full)
-            for name in os.listdir(folder_full):
-                full = os.path.join(folder_full, name)
-                if os.path.isfile(full) and os.path.splitext(name)[1].lower() in {'.json', '.pkl', '.csv'}:
-                    _upsert_file_record(full)
+            _rescan_files(folder_full)
         except Exception:
             # non-fatal: we've already updated the uploaded file record; ignore folder-scan errors
             pass
@@ -660,18 +1325,16 @@ def delete_file(filename: str):
     if not os.path.exists(full):
         raise HTTPException(status_code=404, detail="File not found")
     os.remove(full)
+    journals.discard(full)
+    documents.invalidate(full)
+    blobs.release(full)
     # delete DB record if present, return id if available
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        rel = os.path.relpath(full, BACKEND_DIR)
-        cur.execute('SELECT id FROM files WHERE path = ?', (rel,))
-        row = cur.fetchone()
+        rel = os.path.relpath(full, DATA_DIR)
+        row = _db.query_one('SELECT id FROM files WHERE path = ?', (rel,))
         if not row:
-            cur.execute('SELECT id FROM files WHERE name = ?', (os.path.basename(filename),))
-            row = cur.fetchone()
+            row = _db.query_one('SELECT id FROM files WHERE name = ?', (os.path.basename(filename),))
         file_id = row[0] if row else None
-        conn.close()
         # delete by name to keep compatibility
         _delete_file_record(os.path.basename(filename))
     except Exception:
@@ -680,17 +1343,15 @@ def delete_file(filename: str):
 
 
 @app.post('/api/migrate-files')
-def migrate_files():
-    """Scan backend directory for allowed files and populate/update the SQLite metadata table."""
-    allowed_exts = {'.json', '.pkl', '.csv'}
-    entries = []
-    for root, _, files in os.walk(FILES_ROOT):
-        for name in files:
-            if os.path.splitext(name)[1].lower() in allowed_exts:
-                full = os.path.join(root, name)
-                rec = _upsert_file_record(full)
-                entries.append(rec)
-    return {"migrated": len(entries), "files": entries}
+def migrate_files(full: bool = False, hash: bool = False):
+    """Scan backend directory for allowed files and populate/update the SQLite metadata table.
+
+    The rescan is incremental: only new or modified files (by size/mtime, or by
+    content hash when `hash` is set) are reclassified and rows for vanished files
+    are removed. Pass `full=true` to reclassify every file.
+    """
+    diff = _rescan_files(FILES_ROOT, full=full, use_hash=hash)
+    return {"migrated": len(diff["files"]), **diff}
 
 
 @app.post('/api/files/save-draft/{filename:path}')
@@ -743,12 +1404,65 @@ async def save_draft_file(filename: str, request: Request):
     return {"message": "Draft saved", "file": rec or os.path.basename(full)}
 
 
+def _resolve_move_targets(targets: list) -> Tuple[List[tuple], List[dict]]:
+    """Resolve move targets (ids, stored paths or names) to (target, id, name, relpath) rows.
+
+    All targets are looked up with one query per 500 ids/paths/names instead
+    of one SELECT each. Returns the resolved rows and the per-target errors.
+    """
+    ids, keys = set(), set()
+    for t in targets:
+        try:
+            ids.add(int(t))
+        except (TypeError, ValueError):
+            keys.add(str(t))
+            keys.add(os.path.basename(str(t)))
+    by_id: Dict[int, tuple] = {}
+    by_path: Dict[str, tuple] = {}
+    by_name: Dict[str, tuple] = {}
+    for column, values in (('id', sorted(ids)), ('path', sorted(keys)), ('name', sorted(keys))):
+        for i in range(0, len(values), 500):
+            chunk = values[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for row in _db.query_all(f'SELECT id, name, path FROM files WHERE {column} IN ({placeholders})', chunk):
+                by_id[row[0]] = row
+                by_path[row[2]] = row
+                by_name[row[1]] = row
+    resolved, errors = [], []
+    for t in targets:
+        try:
+            row = by_id.get(int(t))
+        except (TypeError, ValueError):
+            row = by_path.get(str(t)) or by_name.get(os.path.basename(str(t)))
+        if row is None:
+            errors.append({'target': t, 'error': 'not found in DB'})
+        else:
+            resolved.append((t,) + tuple(row))
+    return resolved, errors
+
+
+def _move_path(src: str, dest: str) -> None:
+    """Rename `src` to `dest`, copying across filesystems when a rename is impossible."""
+    try:
+        os.rename(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dest)
+
+
 @app.post('/api/files/move')
 def move_files_endpoint(data: dict):
     """Move files listed in `targets` to the `dest` folder (relative to files_root).
 
     Accepts JSON body: { targets: [...], dest: 'path' }
     Targets can be numeric ids (int or string digits) or stored names/paths.
+
+    Targets that cannot be resolved are reported in `errors` and skipped. The
+    others are moved as a whole: their rows are re-pointed in one transaction
+    (content is unchanged, so nothing is reclassified) and if any rename or the
+    DB update fails, the files already moved are put back and the request
+    fails with 500.
     """
     targets = data.get('targets') if isinstance(data, dict) else None
     dest = data.get('dest') if isinstance(data, dict) else ''
@@ -756,71 +1470,83 @@ def move_files_endpoint(data: dict):
         raise HTTPException(status_code=400, detail='Missing or invalid targets')
 
     # destination folder (empty means root)
-    try:
-        dest_full = _safe_path(dest) if dest else FILES_ROOT
-    except HTTPException as e:
-        raise e
-
+    dest_full = _safe_path(dest) if dest else FILES_ROOT
     os.makedirs(dest_full, exist_ok=True)
 
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    resolved, errors = _resolve_move_targets(targets)
+    files_root_norm = os.path.normpath(FILES_ROOT)
+    # planned moves: (target, id, src, dest); one per file and per destination name
+    plan = []
+    seen_ids = set()
+    dest_names = set()
     moved = []
-    errors = []
-
-    for t in targets:
-        # resolve target to stored path and name
-        row = None
-        try:
-            tid = int(t)
-            cur.execute('SELECT name, path FROM files WHERE id = ?', (tid,))
-            row = cur.fetchone()
-        except Exception:
-            # try by path or name
-            cur.execute('SELECT id, name, path FROM files WHERE path = ? OR name = ?', (t, os.path.basename(str(t))))
-            row = cur.fetchone()
-
-        if not row:
-            errors.append({'target': t, 'error': 'not found in DB'})
-            continue
-
-        # row may be (name,path) or (id,name,path)
-        if len(row) == 2:
-            name, relpath = row
-        else:
-            _, name, relpath = row
-
-        # Resolve stored path robustly. Newer records store a path relative to BACKEND_DIR
+    for t, file_id, name, relpath in resolved:
+        # Resolve stored path robustly. Newer records store a path relative to DATA_DIR
         # (e.g. 'files_root/..'), older/legacy records may store just the filename or a
         # path relative to FILES_ROOT. Try both interpretations.
-        try:
-            src_full = _resolve_stored_relpath(relpath)
-        except Exception:
-            errors.append({'target': t, 'error': 'invalid stored path'})
-            continue
-
+        src_full = _resolve_stored_relpath(relpath)
         # ensure the resolved file is inside FILES_ROOT
-        files_root_norm = os.path.normpath(FILES_ROOT)
         if not (src_full == files_root_norm or src_full.startswith(files_root_norm + os.sep)):
             errors.append({'target': t, 'error': 'invalid stored path'})
             continue
         if not os.path.exists(src_full):
             errors.append({'target': t, 'error': 'source file missing'})
             continue
-
         dest_full_path = os.path.join(dest_full, os.path.basename(src_full))
-        try:
-            # overwrite if exists
-            if os.path.exists(dest_full_path):
-                os.remove(dest_full_path)
-            shutil.move(src_full, dest_full_path)
-            # update DB record for new path
-            rec = _upsert_file_record(dest_full_path)
-            moved.append({'target': t, 'moved_to': rec.get('path'), 'id': rec.get('id')})
-        except Exception as e:
-            errors.append({'target': t, 'error': str(e)})
+        if file_id in seen_ids:
+            continue
+        seen_ids.add(file_id)
+        if os.path.normpath(dest_full_path) == src_full:
+            # already there
+            moved.append({'target': t, 'moved_to': relpath, 'id': file_id})
+            continue
+        if dest_full_path in dest_names:
+            errors.append({'target': t, 'error': 'another target with the same name is moved to this folder'})
+            continue
+        dest_names.add(dest_full_path)
+        plan.append((t, file_id, src_full, dest_full_path))
 
-    conn.close()
+    # (src, dest) renames done so far, and existing destination files set aside
+    done: List[Tuple[str, str]] = []
+    replaced: List[Tuple[str, str]] = []
+    try:
+        for _, _, src_full, dest_full_path in plan:
+            journals.flush(src_full)
+            journals.discard(dest_full_path)
+            # overwrite if exists, but keep the old file until everything succeeded
+            if os.path.lexists(dest_full_path):
+                aside = os.path.join(dest_full, f'.{os.path.basename(dest_full_path)}.{uuid.uuid4().hex}.tmp')
+                os.rename(dest_full_path, aside)
+                replaced.append((aside, dest_full_path))
+            _move_path(src_full, dest_full_path)
+            done.append((src_full, dest_full_path))
+        with _db.transaction() as conn:
+            conn.executemany(
+                'UPDATE files SET path = ? WHERE id = ?',
+                [(os.path.relpath(d, DATA_DIR), file_id) for _, file_id, _, d in plan],
+            )
+    except Exception as e:
+        for src_full, dest_full_path in reversed(done):
+            try:
+                _move_path(dest_full_path, src_full)
+            except OSError as undo_error:
+                logger.error(f"move rollback: could not restore {src_full}: {undo_error}")
+        for aside, dest_full_path in reversed(replaced):
+            try:
+                os.rename(aside, dest_full_path)
+            except OSError as undo_error:
+                logger.error(f"move rollback: could not restore {dest_full_path}: {undo_error}")
+        raise HTTPException(status_code=500, detail=f'Move failed, no file was moved: {e}')
+
+    for aside, _ in replaced:
+        try:
+            os.remove(aside)
+        except OSError:
+            pass
+    for t, file_id, src_full, dest_full_path in plan:
+        documents.invalidate(src_full)
+        blobs.rename(src_full, dest_full_path)
+        moved.append({'target': t, 'moved_to': os.path.relpath(dest_full_path, DATA_DIR), 'id': file_id})
     return {'moved': moved, 'errors': errors}
 
 
@@ -870,15 +1596,14 @@ def delete_folder(folder_path: str):
         shutil.rmtree(full)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to remove folder: {e}')
+    journals.discard_tree(full)
+    documents.invalidate_tree(full)
+    blobs.release_tree(full)
 
     # Remove DB records for files that lived under this folder
     relprefix = os.path.normpath(os.path.join('files_root', folder_path))
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM files WHERE path LIKE ?", (relprefix + '%',))
+    cur = _db.execute("DELETE FROM files WHERE path LIKE ?", (relprefix + '%',))
     removed = cur.rowcount
-    conn.commit()
-    conn.close()
 
     return {"deleted": True, "path": folder_path, "db_files_removed": removed}
 
@@ -901,8 +1626,7 @@ def get_users(discussion_file: Optional[str] = None):
         if not os.path.exists(full_path):
             return None
         try:
-            with open(full_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = journals.load(full_path)
             if isinstance(data, dict) and isinstance(data.get('users'), list):
                 return data.get('users')
         except Exception:
@@ -942,16 +1666,37 @@ def llm_health_check():
         return {"status": "error", "message": str(e), "traceback": traceback.format_exc()}
 
 
-@app.post('/api/llm/generate-bio')
-async def api_generate_bio(request: Request):
-    """Generate a concise user biography paragraph from provided inputs.
+@app.get("/metrics")
+def metrics_endpoint():
+    """Counters and histograms of scripts/metrics.py in the Prometheus text format."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
-    Expects JSON body with:
-      - existing_bio: (optional) string with prior biographical description
-      - messages: list of strings with the user's chat messages
 
-    Returns JSON: { success: True, bio: <string> }
-    """
+@app.get("/api/cache/stats")
+def cache_stats():
+    """Return the counters of the in-process caches (parsed documents, gzip bodies) and the LLM cache."""
+    return {"documents": documents.stats(), "gzip": _gzip_bodies.stats(), "llm": response_cache.stats()}
+
+
+@app.get("/api/blobs")
+def blob_store_stats():
+    """Return the size of the content-addressed blob store and the space deduplication saves."""
+    return blobs.stats()
+
+
+@app.post("/api/blobs/gc")
+def blob_store_gc():
+    """Drop stale blob references (files changed or removed outside the API) and free unused blobs."""
+    return {"gc": blobs.gc(), "stats": blobs.stats()}
+
+
+@app.get("/api/llm/cache")
+def llm_cache_stats():
+    """Return hit/miss counters and size of the LLM response cache."""
+    return response_cache.stats()
+
+
+async def _json_object_body(request: Request) -> Dict[str, Any]:
     try:
         body = await request.json()
     except Exception:
@@ -959,7 +1704,11 @@ async def api_generate_bio(request: Request):
 
     if not isinstance(body, dict):
         raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+    return body
 
+
+def _bio_args(body: Dict[str, Any]) -> Tuple[str, List[str], Dict[str, Any]]:
+    """Validate a generate-bio body; returns (existing_bio, messages, keyword args)."""
     existing_bio = body.get('existing_bio') or body.get('existing') or body.get('bio') or ""
     messages = body.get('messages') or body.get('chat_messages') or None
 
@@ -971,8 +1720,83 @@ async def api_generate_bio(request: Request):
         if not isinstance(m, str):
             raise HTTPException(status_code=400, detail=f"messages[{i}] must be a string")
 
+    return existing_bio, messages, {"use_cache": not body.get('bypassCache', False)}
+
+
+def _rewrite_args(body: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Validate a rewrite-message body; returns (message, keyword args)."""
+    message = body.get('messageToRewrite') or body.get('message') or None
+    speaker_profile = body.get('speakerProfile') or None
+    chat_msgs = body.get('messagesInTheChat') or body.get('messages') or None
+
+    if message is None or not isinstance(message, dict):
+        raise HTTPException(status_code=400, detail="'messageToRewrite' must be provided as an object with a 'text' field")
+
+    text = message.get('text')
+    if text is None or not isinstance(text, str):
+        raise HTTPException(status_code=400, detail="message.text must be a string")
+
+    # Validate optional arrays
+    if speaker_profile is not None and not isinstance(speaker_profile, dict):
+        raise HTTPException(status_code=400, detail="speakerProfile must be an object if provided")
+    if chat_msgs is not None and not isinstance(chat_msgs, list):
+        raise HTTPException(status_code=400, detail="messagesInTheChat must be a list of strings if provided")
+
+    return message, dict(
+        speaker_profile=speaker_profile,
+        messages_in_chat=chat_msgs,
+        # Optional rewriting parameters
+        temperament=body.get('temperament') or None,
+        style=body.get('style') or None,
+        length=body.get('length') or None,
+        use_cache=not body.get('bypassCache', False),
+    )
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json_codec.dumps_text(data)}\n\n"
+
+
+def _sse_response(events, result_key: str) -> StreamingResponse:
+    """Forward ("token", text) / ("done", text) events from llm_calls as Server-Sent Events.
+
+    Emits `token` events ({"text": ...}), then one `done` event
+    ({"success": true, <result_key>: <full cleaned text>}) or an `error` event
+    ({"detail": ...}) if the LLM call fails midway.
+    """
+    async def gen():
+        try:
+            async for kind, text in events:
+                if kind == "done":
+                    yield _sse("done", {"success": True, result_key: text})
+                else:
+                    yield _sse("token", {"text": text})
+        except Exception as e:
+            yield _sse("error", {"detail": f"LLM error: {str(e)}"})
+
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post('/api/llm/generate-bio')
+async def api_generate_bio(request: Request):
+    """Generate a concise user biography paragraph from provided inputs.
+
+    Expects JSON body with:
+      - existing_bio: (optional) string with prior biographical description
+      - messages: list of strings with the user's chat messages
+      - bypassCache: (optional) true to skip the LLM response cache
+
+    Returns JSON: { success: True, bio: <string> }
+    """
+    body = await _json_object_body(request)
+    existing_bio, messages, options = _bio_args(body)
+
     try:
-        bio = generate_user_bio(existing_bio, messages)
+        bio = await generate_user_bio_async(existing_bio, messages, **options)
     except ValueError as e:
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
@@ -982,6 +1806,18 @@ async def api_generate_bio(request: Request):
     return JSONResponse({"success": True, "bio": bio})
 
 
+@app.post('/api/llm/generate-bio/stream')
+async def api_generate_bio_stream(request: Request):
+    """Streaming variant of /api/llm/generate-bio (same body).
+
+    Responds with Server-Sent Events: `token` events as the text is generated,
+    then `done` with { success: True, bio: <string> } (or `error`).
+    """
+    body = await _json_object_body(request)
+    existing_bio, messages, options = _bio_args(body)
+    return _sse_response(stream_user_bio_async(existing_bio, messages, **options), "bio")
+
+
 @app.post('/api/llm/rewrite-message')
 async def api_rewrite_message(request: Request):
     """Rewrite a single chat message using the LLM.
@@ -990,68 +1826,175 @@ async def api_rewrite_message(request: Request):
       - messageToRewrite: object with at least `text` (and optionally `speaker`, `addressees`)
       - treeUserMessages: optional list of strings (other messages by same speaker)
       - messagesInTheChat: optional list of strings for wider context
+      - bypassCache: optional, true to skip the LLM response cache
 
     Returns JSON: { success: True, rewritten: <string> }
     """
+    body = await _json_object_body(request)
+    message, options = _rewrite_args(body)
+
     try:
-        body = await request.json()
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid JSON body")
+        rewritten = await generate_message_rewrite_async(message, **options)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        # treat upstream LLM errors as 502
+        raise HTTPException(status_code=502, detail=f"LLM error: {str(e)}")
 
-    if not isinstance(body, dict):
-        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+    return JSONResponse({"success": True, "rewritten": rewritten})
 
-    message = body.get('messageToRewrite') or body.get('message') or None
-    speaker_profile = body.get('speakerProfile') or None
-    chat_msgs = body.get('messagesInTheChat') or body.get('messages') or None
-    # Optional rewriting parameters
-    temperament = body.get('temperament') or None
-    style = body.get('style') or None
-    length = body.get('length') or None
 
-    if message is None or not isinstance(message, dict):
-        raise HTTPException(status_code=400, detail="'messageToRewrite' must be provided as an object with a 'text' field")
+@app.post('/api/llm/rewrite-message/stream')
+async def api_rewrite_message_stream(request: Request):
+    """Streaming variant of /api/llm/rewrite-message (same body).
 
-    text = message.get('text')
-    if text is None or not isinstance(text, str):
-        raise HTTPException(status_code=400, detail="message.text must be a string")
+    Responds with Server-Sent Events: `token` events as the text is generated,
+    then `done` with { success: True, rewritten: <string> } (or `error`).
+    """
+    body = await _json_object_body(request)
+    message, options = _rewrite_args(body)
+    return _sse_response(stream_message_rewrite_async(message, **options), "rewritten")
+
+
+REWRITE_OPTION_KEYS = ('temperament', 'style', 'length')
 
-    # Validate optional arrays
-    if speaker_profile is not None and not isinstance(speaker_profile, dict):
-        raise HTTPException(status_code=400, detail="speakerProfile must be an object if provided")
-    if chat_msgs is not None and not isinstance(chat_msgs, list):
-        raise HTTPException(status_code=400, detail="messagesInTheChat must be a list of strings if provided")
 
+def _find_profile(users: Any, speaker: Any) -> Optional[Dict[str, Any]]:
+    if not isinstance(users, list):
+        return None
+    for u in users:
+        if isinstance(u, dict) and speaker is not None and (u.get('speaker') == speaker or u.get('name') == speaker):
+            return u
+    return None
+
+
+@app.post('/api/llm/rewrite-draft/{file_id}')
+async def api_rewrite_draft(file_id: int, request: Request):
+    """Rewrite every message of a draft's `discussion` list in one request.
+
+    Expects an (optional) JSON body with:
+      - temperament / style / length: optional global rewriting parameters
+      - overrides: optional object mapping a message id to its own
+        { temperament, style, length } (overrides the global values)
+      - messageIds: optional list of message ids to rewrite (default: all)
+      - concurrency: optional cap on parallel LLM calls
+      - writeBack: optional, true to save the rewritten texts into the draft
+      - bypassCache: optional, true to skip the LLM response cache
+
+    Each message is rewritten with the speaker's entry from the draft's `users`
+    as profile and the preceding messages as chat context, exactly like a
+    single /api/llm/rewrite-message call. Rate-limited calls are retried with
+    backoff. Returns per-message results:
+    { success, total, ok, failed, written, results: [{ id, referenceId, status, rewritten | error, attempts }] }
+    """
     try:
-        rewritten = generate_message_rewrite(
-            message,
-            speaker_profile=speaker_profile,
-            messages_in_chat=chat_msgs,
-            temperament=temperament,
-            style=style,
-            length=length,
-        )
-    except ValueError as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        body = await request.json()
+    except Exception:
+        body = {}
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+
+    row = _db.query_one('SELECT name, path FROM files WHERE id = ?', (file_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail='File not found')
+    full = _resolve_stored_relpath(row[1])
+    if not os.path.isfile(full):
+        raise HTTPException(status_code=404, detail='File not found')
+    try:
+        draft = journals.load(full)
     except Exception as e:
-        # treat upstream LLM errors as 502
-        raise HTTPException(status_code=502, detail=f"LLM error: {str(e)}")
+        raise HTTPException(status_code=400, detail=f'Failed to read draft: {e}')
+    if not isinstance(draft, dict) or not isinstance(draft.get('discussion'), list):
+        raise HTTPException(status_code=400, detail="File is not a draft (missing 'discussion' list)")
+
+    overrides = body.get('overrides') or {}
+    if not isinstance(overrides, dict):
+        raise HTTPException(status_code=400, detail="overrides must be an object keyed by message id")
+    wanted = body.get('messageIds')
+    if wanted is not None and not isinstance(wanted, list):
+        raise HTTPException(status_code=400, detail="messageIds must be a list if provided")
+    wanted = None if wanted is None else {str(w) for w in wanted}
+    concurrency = body.get('concurrency')
+    if concurrency is not None and (not isinstance(concurrency, int) or concurrency < 1):
+        raise HTTPException(status_code=400, detail="concurrency must be a positive integer")
+    defaults = {k: body.get(k) or None for k in REWRITE_OPTION_KEYS}
+
+    discussion = draft['discussion']
+    targets, jobs = [], []
+    # context is built from the original texts so every job is independent
+    history = [(m.get('text') or '') if isinstance(m, dict) else '' for m in discussion]
+    for i, msg in enumerate(discussion):
+        if not isinstance(msg, dict) or not isinstance(msg.get('text'), str):
+            continue
+        mid = str(msg.get('id'))
+        if wanted is not None and mid not in wanted:
+            continue
+        override = overrides.get(mid) if isinstance(overrides.get(mid), dict) else {}
+        options = {k: override.get(k) or defaults[k] for k in REWRITE_OPTION_KEYS}
+        targets.append(i)
+        jobs.append(dict(
+            message_obj=msg,
+            speaker_profile=_find_profile(draft.get('users'), msg.get('speaker')),
+            messages_in_chat=history[:i],
+            **options,
+        ))
 
-    return JSONResponse({"success": True, "rewritten": rewritten})
+    outcomes = await generate_message_rewrites_async(
+        jobs,
+        max_concurrency=concurrency,
+        use_cache=not body.get('bypassCache', False),
+    )
+
+    results = []
+    rewritten_by_id = {}
+    for i, outcome in zip(targets, outcomes):
+        msg = discussion[i]
+        results.append({"id": msg.get('id'), "referenceId": msg.get('referenceId'), **outcome})
+        if outcome["status"] == "ok":
+            rewritten_by_id[str(msg.get('id'))] = outcome["rewritten"]
+
+    written = 0
+    rec = None
+    if body.get('writeBack') and rewritten_by_id:
+        # re-read the draft: it may have been edited while the LLM calls ran
+        try:
+            journals.flush(full)
+            current = json_codec.load_file(full)
+            for msg in current.get('discussion') or []:
+                if isinstance(msg, dict) and str(msg.get('id')) in rewritten_by_id:
+                    msg['text'] = rewritten_by_id[str(msg.get('id'))]
+                    written += 1
+            _atomic_write_json(full, current)
+        except Exception as e:
+            logger.error(f"api_rewrite_draft: failed to write {full}: {e}")
+            raise HTTPException(status_code=500, detail=f'Failed to save draft: {e}')
+        rec = _upsert_file_record(full)
+
+    ok = sum(1 for r in results if r["status"] == "ok")
+    return {
+        "success": ok == len(results),
+        "file_id": file_id,
+        "total": len(results),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "written": written,
+        "file": rec,
+        "results": results,
+    }
 
 
 @app.post("/api/files/fix/{file_id}/preview")
-async def preview_file_fix(file_id: int):
+async def preview_file_fix(file_id: int, bypass_cache: bool = False, force_llm: bool = False):
     """
-    Preview the LLM-suggested fix without applying it.
+    Preview the suggested fix without applying it.
     Returns both the original and fixed data for user review.
+
+    Flat message lists are converted locally by build_discussion_tree; other
+    shapes (or `force_llm=true`) go through the LLM. Pass `bypass_cache=true`
+    to force a fresh LLM call.
     """
     # Get file info from database
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT name, path FROM files WHERE id = ?", (file_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = _db.query_one("SELECT name, path FROM files WHERE id = ?", (file_id,))
     
     if not row:
         raise HTTPException(status_code=404, detail=f"File with id {file_id} not found")
@@ -1069,18 +2012,21 @@ async def preview_file_fix(file_id: int):
     
     # Read the current file
     try:
-        with open(full_path, 'r', encoding='utf-8') as f:
-            input_data = json.load(f)
+        input_data = journals.load(full_path)
     except json.JSONDecodeError as e:
         raise HTTPException(status_code=400, detail=f"File is not valid JSON: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading file: {str(e)}")
     
-    # Transform using LLM
-    try:
-        fixed_data = transform_discussion_json(input_data)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"LLM transformation failed: {str(e)}")
+    fixed_data = None if force_llm else build_discussion_tree(input_data)
+    method = "local"
+    if fixed_data is None:
+        # Transform using LLM
+        method = "llm"
+        try:
+            fixed_data = await transform_discussion_json_async(input_data, use_cache=not bypass_cache)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"LLM transformation failed: {str(e)}")
     
     # Return both versions for comparison
     return {
@@ -1089,6 +2035,7 @@ async def preview_file_fix(file_id: int):
         "file_name": name,
         "original": input_data,
         "fixed": fixed_data,
+        "method": method,
         "changes_count": len(fixed_data) if isinstance(fixed_data, list) else 1
     }
 
@@ -1110,11 +2057,7 @@ async def apply_file_fix(file_id: int, request: Request):
     Creates a backup before overwriting the original file.
     """
     # Get file info from database
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT name, path FROM files WHERE id = ?", (file_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = _db.query_one("SELECT name, path FROM files WHERE id = ?", (file_id,))
     
     if not row:
         raise HTTPException(status_code=404, detail=f"File with id {file_id} not found")
@@ -1134,29 +2077,24 @@ async def apply_file_fix(file_id: int, request: Request):
     backup_created = False
     new_file_id = file_id
     if overwrite:
-        # Create backup of original file
+        # Create backup of original file (including its journaled edits)
+        journals.flush(full_path)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         backup_path = full_path + f'.backup_{timestamp}'
         try:
-            shutil.copy2(full_path, backup_path)
+            # a reflink (or copy) of the original's blob when the blob store is enabled, never a hard link
+            blobs.copy(full_path, backup_path)
             backup_created = True
         except Exception as e:
             logging.warning(f"Could not create backup: {e}")
-        # Save the fixed file (overwrite)
+        # Save the fixed file (overwrite); the atomic replace leaves the original
+        # untouched if writing fails
         try:
-            with open(full_path, 'w', encoding='utf-8') as f:
-                json.dump(fixed_data, f, indent=2, ensure_ascii=False)
+            _atomic_write_json(full_path, fixed_data)
         except Exception as e:
-            # Restore from backup if save failed
-            if backup_created:
-                shutil.copy2(backup_path, full_path)
             raise HTTPException(status_code=500, detail=f"Error saving fixed file: {str(e)}")
-        # Update the database to mark structure as OK
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        cur.execute("UPDATE files SET structure_ok = 1 WHERE id = ?", (file_id,))
-        conn.commit()
-        conn.close()
+        # Update the database record (size, mtime, classification)
+        _upsert_file_record(full_path)
     else:
         # Save as new file with _fix suffix
         base, ext = os.path.splitext(name)
@@ -1166,25 +2104,11 @@ async def apply_file_fix(file_id: int, request: Request):
         try:
             # Only write an empty object if fixed_data is truly empty or None
             to_write = fixed_data if fixed_data not in (None, "", []) else {}
-            with open(new_full_path, 'w', encoding='utf-8') as f:
-                json.dump(to_write, f, indent=2, ensure_ascii=False)
+            _atomic_write_json(new_full_path, to_write)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error saving fixed file: {str(e)}")
-        # Insert new file into DB
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        cur.execute("INSERT INTO files (name, size, uploadDate, type, path, structure_ok, category) VALUES (?, ?, ?, ?, ?, ?, ?)", (
-            new_name,
-            os.path.getsize(new_full_path),
-            datetime.now().isoformat(),
-            'json',
-            f'files_root/{new_rel_path}',
-            1,
-            'discussion'
-        ))
-        conn.commit()
-        new_file_id = cur.lastrowid
-        conn.close()
+        # Insert (or refresh) the new file's DB record
+        new_file_id = _upsert_file_record(new_full_path).get('id')
     return {
         "success": True,
         "message": "File successfully fixed and saved",
@@ -1224,6 +2148,7 @@ async def delete_backup_file(request: dict):
     try:
         if os.path.exists(backup_path):
             os.remove(backup_path)
+            blobs.release(backup_path)
             logging.info(f"Deleted backup file: {backup_path}")
             return {"success": True, "message": f"Backup file deleted: {backup_path}"}
         else:
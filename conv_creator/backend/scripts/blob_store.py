@@ -0,0 +1,391 @@
+"""
+Content-addressed store for the files written by the backend.
+
+Every tracked file is also reachable as a blob named after its sha256
+(BLOB_STORE_DIR/ab/abcdef...). Blobs share their data with the working files,
+so storing a file costs no extra disk space, and:
+
+  - identical contents (duplicate uploads, unchanged fixes) are stored once;
+  - a backup or copy is a reflink of the blob where the filesystem supports
+    it, i.e. a metadata-only operation.
+
+How a path is linked to a blob, in order of preference:
+
+  - a reflink (copy-on-write clone, FICLONE on btrfs/XFS/...): the path gets
+    its own inode sharing the blob's extents, so writing to it never changes
+    the blob or the other copies, and it keeps its own timestamps;
+  - a hard link (BLOB_STORE_HARDLINKS=0 disables them): the path and the blob
+    are one inode. Such files must only ever be replaced through a rename
+    (write a temp file, then os.replace), as the backend does; a program
+    writing into one of them in place changes every duplicate and the blob.
+    `gc()` and `track()` detect such blobs by their size/mtime and drop them.
+    Copies made with `copy()` (backups) are never hard links: a backup sharing
+    its inode with the live file would not survive an in-place edit of it;
+  - a plain copy (other filesystem, no link support): no space is shared.
+
+The `blobs` table lists the stored blobs and `blob_refs` maps every path that
+points at a blob to its hash, together with the size/mtime the path had when it
+was linked and its own mtime from before (a hard link takes the blob's, see
+`modified_ns`). Triggers keep `blobs.refcount` equal to the number of
+references; when the last reference is released the blob is unlinked. `gc()`
+drops references whose file changed or vanished behind our back (edited in
+place, deleted outside the API...), blobs whose content no longer matches their
+hash and blob files without a row, then frees unreferenced blobs.
+
+Disabled unless BLOB_STORE=1; BLOB_STORE_DIR sets the blob directory.
+"""
+
+import os
+import time
+import shutil
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None
+
+from scripts.db import SQLitePool
+from scripts.classify import hash_file
+
+logger = logging.getLogger('uvicorn.error')
+
+# ioctl(dest_fd, FICLONE, src_fd): share all extents of src with dest (Linux)
+FICLONE = 0x40049409
+
+
+def ensure_schema(conn) -> None:
+    """Create the blob tables and the refcount triggers if missing."""
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL
+        )
+        '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS blob_refs (
+            path TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            own_mtime_ns INTEGER
+        )
+        '''
+    )
+    if 'own_mtime_ns' not in [r[1] for r in conn.execute('PRAGMA table_info(blob_refs)')]:
+        conn.execute('ALTER TABLE blob_refs ADD COLUMN own_mtime_ns INTEGER')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_blob_refs_hash ON blob_refs(hash)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_blobs_refcount ON blobs(refcount)')
+    conn.execute(
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_blob_refs_insert AFTER INSERT ON blob_refs
+        BEGIN
+            UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.hash;
+        END
+        '''
+    )
+    conn.execute(
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_blob_refs_delete AFTER DELETE ON blob_refs
+        BEGIN
+            UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.hash;
+        END
+        '''
+    )
+    conn.execute(
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_blob_refs_update AFTER UPDATE OF hash ON blob_refs
+        BEGIN
+            UPDATE blobs SET refcount = refcount - 1 WHERE hash = OLD.hash;
+            UPDATE blobs SET refcount = refcount + 1 WHERE hash = NEW.hash;
+        END
+        '''
+    )
+
+
+def _clone(src: str, dest: str) -> bool:
+    """Create `dest` as a reflink of `src`; False if the filesystem cannot clone."""
+    if fcntl is None:
+        return False
+    with open(src, 'rb') as fsrc, open(dest, 'xb') as fdest:
+        try:
+            fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(dest)
+    return False
+
+
+def _link(src: str, dest: str) -> bool:
+    try:
+        os.link(src, dest)
+        return True
+    except OSError:
+        return False
+
+
+def _replace_with_link(blob: str, dest: str, *, hardlink: bool = True, mtime_ns: Optional[int] = None) -> None:
+    """Atomically make `dest` a reflink, hard link or copy of `blob` (in that order of preference).
+
+    `mtime_ns` is given to a reflink or copy, which has its own inode (a hard
+    link shares the blob's).
+    """
+    tmp = dest + '.tmp'
+    try:
+        # a leftover of an interrupted call
+        os.remove(tmp)
+    except FileNotFoundError:
+        pass
+    try:
+        shared = False
+        if not _clone(blob, tmp):
+            shared = hardlink and _link(blob, tmp)
+            if not shared:
+                shutil.copy2(blob, tmp)
+        if not shared and mtime_ns is not None:
+            os.utime(tmp, ns=(time.time_ns(), mtime_ns))
+        os.replace(tmp, dest)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class BlobStore:
+    """Hash-named blobs linked to the working files, with reference counting."""
+
+    def __init__(self, root: str, db: SQLitePool, *, enabled: bool = True, hardlinks: bool = True) -> None:
+        self.root = root
+        self.enabled = enabled
+        self.hardlinks = hardlinks
+        self._db = db
+        self._lock = threading.Lock()
+
+    def blob_path(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash[:2], content_hash)
+
+    def _key(self, path: str) -> str:
+        return os.path.abspath(path)
+
+    def _current_hash(self, path: str, st: os.stat_result) -> Optional[str]:
+        """Hash recorded for `path` if the file has not changed since it was linked."""
+        row = self._db.query_one('SELECT hash, size, mtime_ns FROM blob_refs WHERE path = ?', (self._key(path),))
+        if row is not None and row[1] == st.st_size and row[2] == st.st_mtime_ns:
+            return row[0]
+        return None
+
+    def modified_ns(self, path: str, st: os.stat_result) -> int:
+        """The file's own mtime: the one it had before being hard-linked to a blob.
+
+        Use it instead of `st.st_mtime_ns` for dates shown to users; a hard link
+        carries the mtime of the first file stored with that content.
+        """
+        if not self.enabled:
+            return st.st_mtime_ns
+        row = self._db.query_one('SELECT size, mtime_ns, own_mtime_ns FROM blob_refs WHERE path = ?', (self._key(path),))
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns and row[2] is not None:
+            return row[2]
+        return st.st_mtime_ns
+
+    def _drop_blob(self, content_hash: str) -> None:
+        """Forget a blob whose file no longer matches its row (caller holds the lock)."""
+        logger.warning(f"blob store: blob {content_hash} changed on disk, dropping it")
+        with self._db.transaction() as conn:
+            conn.execute('DELETE FROM blob_refs WHERE hash = ?', (content_hash,))
+            conn.execute('DELETE FROM blobs WHERE hash = ?', (content_hash,))
+        try:
+            os.remove(self.blob_path(content_hash))
+        except FileNotFoundError:
+            pass
+
+    def track(self, path: str, content_hash: Optional[str] = None) -> Optional[str]:
+        """Store the current content of `path` and point its reference at the blob.
+
+        If a blob with the same content exists, `path` is replaced by a link to
+        it (deduplication). Returns the content hash, or None when the store is
+        disabled or the file could not be stored (the file itself is untouched).
+        """
+        if not self.enabled:
+            return None
+        key = self._key(path)
+        try:
+            with self._lock:
+                st = os.stat(key)
+                known = self._current_hash(key, st)
+                if known is not None:
+                    return known
+                own_mtime_ns = st.st_mtime_ns
+                content_hash = content_hash or hash_file(key)
+                blob = self.blob_path(content_hash)
+                row = self._db.query_one('SELECT size, mtime_ns FROM blobs WHERE hash = ?', (content_hash,))
+                try:
+                    blob_st = os.stat(blob)
+                except FileNotFoundError:
+                    blob_st = None
+                if row is not None and blob_st is not None and (blob_st.st_size, blob_st.st_mtime_ns) != tuple(row):
+                    # written in place through a hard link: its content is no longer `content_hash`
+                    self._drop_blob(content_hash)
+                    row = blob_st = None
+                if row is not None and blob_st is not None:
+                    if not os.path.samefile(blob, key):
+                        _replace_with_link(blob, key, hardlink=self.hardlinks, mtime_ns=own_mtime_ns)
+                else:
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    _replace_with_link(key, blob, hardlink=self.hardlinks)
+                blob_st = os.stat(blob)
+                st = os.stat(key)
+                with self._db.transaction() as conn:
+                    conn.execute(
+                        'INSERT INTO blobs(hash, size, mtime_ns, refcount, created_at) VALUES (?, ?, ?, 0, ?)'
+                        ' ON CONFLICT(hash) DO UPDATE SET size=excluded.size, mtime_ns=excluded.mtime_ns',
+                        (content_hash, blob_st.st_size, blob_st.st_mtime_ns, time.time()),
+                    )
+                    self._set_ref(conn, key, content_hash, st, own_mtime_ns)
+                self._free_unreferenced()
+            return content_hash
+        except OSError as e:
+            logger.warning(f"blob store: could not store {path}: {e}")
+            return None
+
+    def copy(self, src: str, dest: str) -> None:
+        """Copy `src` to `dest`; with the store enabled this is a reflink of the blob when possible.
+
+        Never a hard link, even with `hardlinks` on: `dest` is a backup and must
+        keep its content whatever happens to `src` or the blob.
+        """
+        content_hash = self.track(src)
+        if content_hash is None:
+            shutil.copy2(src, dest)
+            return
+        key = self._key(dest)
+        with self._lock:
+            # like shutil.copy2, the copy keeps the modification time of `src`
+            own_mtime_ns = self.modified_ns(src, os.stat(src))
+            _replace_with_link(self.blob_path(content_hash), key, hardlink=False, mtime_ns=own_mtime_ns)
+            with self._db.transaction() as conn:
+                self._set_ref(conn, key, content_hash, os.stat(key), own_mtime_ns)
+            self._free_unreferenced()
+
+    @staticmethod
+    def _set_ref(conn, key: str, content_hash: str, st: os.stat_result, own_mtime_ns: int) -> None:
+        conn.execute(
+            'INSERT INTO blob_refs(path, hash, size, mtime_ns, own_mtime_ns) VALUES (?, ?, ?, ?, ?)'
+            ' ON CONFLICT(path) DO UPDATE SET hash=excluded.hash, size=excluded.size, mtime_ns=excluded.mtime_ns,'
+            ' own_mtime_ns=excluded.own_mtime_ns',
+            (key, content_hash, st.st_size, st.st_mtime_ns, own_mtime_ns),
+        )
+
+    def release(self, path: str) -> None:
+        """Forget the reference held by `path` (call after deleting the file)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._db.execute('DELETE FROM blob_refs WHERE path = ?', (self._key(path),))
+            self._free_unreferenced()
+
+    def release_tree(self, directory: str) -> None:
+        if not self.enabled:
+            return
+        prefix = self._key(directory) + os.sep
+        with self._lock:
+            self._db.execute('DELETE FROM blob_refs WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))
+            self._free_unreferenced()
+
+    def rename(self, src: str, dest: str) -> None:
+        """Move the references of `src` (a file or a folder) to `dest` after a rename."""
+        if not self.enabled:
+            return
+        src_key, dest_key = self._key(src), self._key(dest)
+        prefix = src_key + os.sep
+        with self._lock, self._db.transaction() as conn:
+            conn.execute('DELETE FROM blob_refs WHERE path = ? OR substr(path, 1, ?) = ?', (dest_key, len(dest_key) + 1, dest_key + os.sep))
+            conn.execute(
+                'UPDATE blob_refs SET path = ? || substr(path, ?) WHERE path = ? OR substr(path, 1, ?) = ?',
+                (dest_key, len(src_key) + 1, src_key, len(prefix), prefix),
+            )
+
+    def _free_unreferenced(self) -> int:
+        """Unlink blobs nobody references any more (caller holds the lock)."""
+        freed = 0
+        for (content_hash,) in self._db.query_all('SELECT hash FROM blobs WHERE refcount <= 0'):
+            try:
+                os.remove(self.blob_path(content_hash))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"blob store: could not remove blob {content_hash}: {e}")
+                continue
+            self._db.execute('DELETE FROM blobs WHERE hash = ? AND refcount <= 0', (content_hash,))
+            freed += 1
+        return freed
+
+    def gc(self) -> Dict[str, int]:
+        """Drop stale references, corrupted blobs and stray files; free unreferenced blobs."""
+        if not self.enabled:
+            return {"stale_refs": 0, "corrupt_blobs": 0, "stray_files": 0, "freed_blobs": 0}
+        with self._lock:
+            stale = []
+            for path, size, mtime_ns in self._db.query_all('SELECT path, size, mtime_ns FROM blob_refs'):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    stale.append((path,))
+                    continue
+                if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                    stale.append((path,))
+            corrupt = []
+            known = set()
+            for content_hash, size, mtime_ns in self._db.query_all('SELECT hash, size, mtime_ns FROM blobs'):
+                known.add(content_hash)
+                try:
+                    st = os.stat(self.blob_path(content_hash))
+                except OSError:
+                    corrupt.append((content_hash,))
+                    continue
+                # a working file edited in place shares the inode: the blob changed too
+                if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                    corrupt.append((content_hash,))
+            with self._db.transaction() as conn:
+                conn.executemany('DELETE FROM blob_refs WHERE path = ?', stale)
+                conn.executemany('DELETE FROM blob_refs WHERE hash = ?', corrupt)
+            stray = 0
+            if os.path.isdir(self.root):
+                for sub in os.scandir(self.root):
+                    if not sub.is_dir(follow_symlinks=False):
+                        continue
+                    for entry in os.scandir(sub.path):
+                        if entry.name not in known:
+                            try:
+                                os.remove(entry.path)
+                                stray += 1
+                            except OSError:
+                                pass
+            freed = self._free_unreferenced()
+        return {"stale_refs": len(stale), "corrupt_blobs": len(corrupt), "stray_files": stray, "freed_blobs": freed}
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        blobs, blob_bytes = self._db.query_one('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs')
+        refs, ref_bytes = self._db.query_one('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blob_refs')
+        return {
+            "enabled": True,
+            "root": self.root,
+            "blobs": blobs,
+            "blob_bytes": blob_bytes,
+            "references": refs,
+            "referenced_bytes": ref_bytes,
+            # bytes that would be stored twice or more without the store
+            "saved_bytes": max(0, ref_bytes - blob_bytes),
+        }
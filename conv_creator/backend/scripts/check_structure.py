@@ -49,19 +49,18 @@ import argparse
 from pathlib import Path
 from typing import Any, Dict
 
+# Make the backend package importable when run as a standalone script
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from scripts.classify import STREAMING_THRESHOLD_BYTES, classify_stream
+from scripts.tree_validation import is_valid_tree
+
 
 def is_node_schema(obj: Any) -> bool:
-    """Recursively validate NODE_SCHEMA."""
-    if not isinstance(obj, dict):
-        return False
-    required_keys = {"id", "speaker", "text", "children"}
-    if set(obj.keys()) != required_keys:
-        return False
-    if not all(isinstance(obj[k], str) for k in ("id", "speaker", "text")):
-        return False
-    if not isinstance(obj["children"], list):
-        return False
-    return all(is_node_schema(child) for child in obj["children"])
+    """Validate NODE_SCHEMA for the whole tree (iteratively, see tree_validation)."""
+    return is_valid_tree(obj, schema="strict")
 
 
 def is_discussion_schema(obj: Any) -> bool:
@@ -119,6 +118,11 @@ def check_file(json_file: Path) -> int:
         return -1  # skipped file
 
     try:
+        # large exports are validated while streaming instead of loaded whole
+        if json_file.stat().st_size >= STREAMING_THRESHOLD_BYTES:
+            with open(json_file, "rb") as f:
+                category = classify_stream(f, strict=True)
+            return {"discussion": 0, "draft": 1}.get(category, 2)
         with open(json_file, "r", encoding="utf-8") as f:
             data = json.load(f)
     except Exception as e:
@@ -0,0 +1,315 @@
+"""
+Classification of files tracked in the files table.
+
+`classify_file` decides whether a JSON file is a discussion tree, a draft or
+invalid. `classify_paths` runs it over many files, fanning the work out over a
+process pool for bulk operations (rescans, folder scans, moves) so multi-core
+machines parse large discussion trees in parallel.
+
+The worker count comes from the CLASSIFY_WORKERS environment variable
+(defaults to the number of CPUs; 0 or 1 disables the pool).
+
+Files larger than STREAMING_THRESHOLD_BYTES are classified with
+`StreamingClassifier`, which validates the document while tokenizing it and
+stops at the first structural violation, so memory stays proportional to the
+tree depth instead of the file size.
+"""
+
+import os
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from scripts import json_codec
+from scripts.json_stream import JSONEventParser, JSONStreamError
+from scripts.tree_validation import is_valid_tree
+
+# below this many files the pool start-up/IPC cost outweighs the parallelism
+MIN_PARALLEL_BATCH = 8
+# a full parse is much faster for small files; stream only the large ones
+STREAMING_THRESHOLD_BYTES = int(os.getenv('CLASSIFY_STREAMING_THRESHOLD', str(32 * 1024 * 1024)))
+STREAM_CHUNK_SIZE = 1 << 16
+
+NODE_KEYS = ('id', 'speaker', 'text', 'children')
+DRAFT_KEYS = ('fileRef', 'users', 'tree', 'discussion')
+DISCUSSION_KEYS = ('users', 'tree')
+DISCUSSION_ITEM_TYPES = {'id': ('number', 'boolean'), 'referenceId': ('string',), 'speaker': ('string',), 'text': ('string',), 'addressees': ('start_array',)}
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def classify_workers() -> int:
+    value = os.getenv('CLASSIFY_WORKERS')
+    if value:
+        try:
+            return max(0, int(value))
+        except ValueError:
+            pass
+    return os.cpu_count() or 1
+
+
+# classify JSON files and compute structure_ok for JSON files:
+# struct_flag: 1 = valid tree/draft, 0 = invalid, None = skipped/non-json
+# category: 'discussion' | 'draft' | 'invalid' | None
+def classify_file(full_path: str) -> Tuple[Optional[int], Optional[str]]:
+    if not full_path.lower().endswith('.json'):
+        return None, None
+    # do not skip user files here; upload should classify everything
+    try:
+        if os.path.getsize(full_path) >= STREAMING_THRESHOLD_BYTES:
+            with open(full_path, 'rb') as fh:
+                return _category_flag(classify_stream(fh))
+    except OSError:
+        return 0, 'invalid'
+    try:
+        data = json_codec.load_file(full_path)
+    except Exception:
+        return 0, 'invalid'
+
+    # detect draft: has fileRef, users, tree, discussion
+    if isinstance(data, dict) and all(k in data for k in ('fileRef', 'users', 'tree', 'discussion')):
+        # validate tree and discussion minimally
+        tree_ok = is_valid_tree(data.get('tree'))
+        discussion_ok = isinstance(data.get('discussion'), list)
+        if tree_ok and discussion_ok:
+            return 1, 'draft'
+        return 0, 'invalid'
+
+    # detect discussion tree file: top-level users + tree
+    if isinstance(data, dict) and all(k in data for k in ('users', 'tree')):
+        tree_ok = is_valid_tree(data.get('tree'))
+        users_ok = isinstance(data.get('users'), list)
+        if tree_ok and users_ok:
+            return 1, 'discussion'
+        return 0, 'invalid'
+
+    # fallback: invalid
+    return 0, 'invalid'
+
+
+def _category_flag(category: str) -> Tuple[int, str]:
+    return (0, 'invalid') if category == 'invalid' else (1, category)
+
+
+class StreamingClassifier:
+    """Classify a JSON document as 'discussion', 'draft' or 'invalid' while it is read.
+
+    Feed raw chunks with `feed()`; it returns True as soon as the verdict is
+    known (the first structural violation makes the file invalid, so the rest
+    of the input does not need to be read). Call `result()` at end of input.
+
+    In the default (loose) mode the rules match `classify_file`: nodes need
+    string id/speaker/text and a children list, extra keys are ignored. With
+    `strict=True` the rules of scripts/check_structure.py apply: exact key sets
+    for the top level and for nodes, a string fileRef and a fully validated
+    discussion list for drafts.
+    """
+
+    def __init__(self, strict: bool = False) -> None:
+        self.strict = strict
+        self._parser = JSONEventParser()
+        # container stack: [role, current key, seen keys] per open object/array
+        self._stack: List[list] = []
+        self._top: Dict[str, str] = {}   # top-level key -> kind of its value
+        self._tree_ok = False
+        self._verdict: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self._verdict is not None
+
+    def feed(self, chunk: bytes) -> bool:
+        if self._verdict is None:
+            try:
+                self._handle(self._parser.feed(chunk))
+            except JSONStreamError:
+                self._verdict = 'invalid'
+        return self._verdict is not None
+
+    def result(self) -> str:
+        if self._verdict is None:
+            try:
+                self._handle(self._parser.close())
+            except JSONStreamError:
+                self._verdict = 'invalid'
+        if self._verdict is None:
+            self._verdict = self._decide()
+        return self._verdict
+
+    def _decide(self) -> str:
+        top = self._top
+        if self.strict:
+            keys = set(top)
+            if keys == set(DISCUSSION_KEYS) and top['users'] == 'start_array' and self._tree_ok:
+                return 'discussion'
+            if (keys == set(DRAFT_KEYS) and top['fileRef'] == 'string' and top['users'] == 'start_array'
+                    and top['discussion'] == 'start_array' and self._tree_ok):
+                return 'draft'
+            return 'invalid'
+        if all(k in top for k in DRAFT_KEYS):
+            return 'draft' if self._tree_ok and top['discussion'] == 'start_array' else 'invalid'
+        if all(k in top for k in DISCUSSION_KEYS):
+            return 'discussion' if self._tree_ok and top['users'] == 'start_array' else 'invalid'
+        return 'invalid'
+
+    def _handle(self, events) -> None:
+        stack = self._stack
+        for kind, value, _, _ in events:
+            if kind == 'map_key':
+                stack[-1][1] = value
+                continue
+            if kind == 'end_map' or kind == 'end_array':
+                role, _, seen = stack.pop()
+                if role == 'node':
+                    if not all(k in seen for k in NODE_KEYS):
+                        self._verdict = 'invalid'
+                        return
+                    if not stack or stack[-1][0] == 'top':
+                        self._tree_ok = True
+                elif role == 'item' and not all(k in seen for k in DISCUSSION_ITEM_TYPES):
+                    self._verdict = 'invalid'
+                    return
+                continue
+            # a value starts: decide its role from the enclosing container
+            role = self._child_role(kind)
+            if role is None:
+                self._verdict = 'invalid'
+                return
+            if kind == 'start_map' or kind == 'start_array':
+                stack.append([role, None, set()])
+
+    def _child_role(self, kind: str) -> Optional[str]:
+        """Validate a value against its position; return its role or None on violation."""
+        stack = self._stack
+        if not stack:
+            return 'top' if kind == 'start_map' else None
+        parent = stack[-1]
+        prole, key = parent[0], parent[1]
+        if prole == 'other':
+            return 'other'
+        if prole == 'top':
+            self._top[key] = kind
+            if key == 'tree':
+                self._tree_ok = False
+                return 'node' if kind == 'start_map' else None
+            if self.strict:
+                if key not in DRAFT_KEYS:
+                    return None
+                if key == 'discussion' and kind == 'start_array':
+                    return 'discussion'
+            return 'other'
+        if prole == 'node':
+            parent[2].add(key)
+            if key == 'children':
+                return 'children' if kind == 'start_array' else None
+            if key in NODE_KEYS:
+                return 'leaf' if kind == 'string' else None
+            return None if self.strict else 'other'
+        if prole == 'children':
+            return 'node' if kind == 'start_map' else None
+        if prole == 'discussion':
+            return 'item' if kind == 'start_map' else None
+        if prole == 'item':
+            parent[2].add(key)
+            expected = DISCUSSION_ITEM_TYPES.get(key)
+            if expected is None or kind not in expected:
+                return None
+            return 'addressees' if kind == 'start_array' else 'leaf'
+        if prole == 'addressees':
+            return 'leaf' if kind == 'string' else None
+        return 'other'
+
+
+def classify_stream(fh: BinaryIO, strict: bool = False) -> str:
+    """Classify an open binary file with StreamingClassifier, stopping early when possible."""
+    classifier = StreamingClassifier(strict=strict)
+    while True:
+        chunk = fh.read(STREAM_CHUNK_SIZE)
+        if not chunk or classifier.feed(chunk):
+            break
+    return classifier.result()
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class StreamingDigest:
+    """Hash and classify a file from its chunks, e.g. while an upload is written to disk.
+
+    Gives the same (structure_ok, category, content_hash) triple as
+    `_classify_one(path, with_hash=True)` without reading the file back.
+    """
+
+    def __init__(self, filename: str) -> None:
+        self._hash = hashlib.sha256()
+        self._classifier = StreamingClassifier() if filename.lower().endswith('.json') else None
+        self.size = 0
+
+    def update(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        self._hash.update(chunk)
+        if self._classifier is not None and not self._classifier.done:
+            self._classifier.feed(chunk)
+
+    def result(self) -> Tuple[Optional[int], Optional[str], str]:
+        if self._classifier is None:
+            return None, None, self._hash.hexdigest()
+        struct_flag, category = _category_flag(self._classifier.result())
+        return struct_flag, category, self._hash.hexdigest()
+
+
+def _classify_one(args: Tuple[str, bool]) -> Tuple[Optional[int], Optional[str], Optional[str]]:
+    path, with_hash = args
+    struct_flag, category = classify_file(path)
+    content_hash = None
+    if with_hash:
+        try:
+            content_hash = hash_file(path)
+        except OSError:
+            pass
+    return struct_flag, category, content_hash
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn instead of fork: the server process runs threads (uvicorn's
+            # threadpool, SQLite connections) that must not be duplicated
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def classify_paths(paths: List[str], with_hash: bool = False, workers: Optional[int] = None) -> List[Tuple[Optional[int], Optional[str], Optional[str]]]:
+    """Classify `paths`, returning (struct_flag, category, content_hash) per path in order.
+
+    Large batches are spread over the shared process pool; small ones (or when
+    the pool is disabled or unavailable) run in the calling process.
+    """
+    if workers is None:
+        workers = classify_workers()
+    jobs = [(p, with_hash) for p in paths]
+    if workers > 1 and len(jobs) >= MIN_PARALLEL_BATCH:
+        try:
+            chunksize = max(1, len(jobs) // (workers * 4))
+            return list(_get_executor(workers).map(_classify_one, jobs, chunksize=chunksize))
+        except Exception:
+            # broken pool (e.g. a worker was killed): fall back to in-process classification
+            shutdown_pool()
+    return [_classify_one(job) for job in jobs]
+
+
+def shutdown_pool() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
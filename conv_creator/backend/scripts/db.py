@@ -0,0 +1,145 @@
+"""
+Shared SQLite access layer used by the backend.
+
+Every thread gets its own long-lived connection (FastAPI runs sync endpoints in a
+threadpool, so each worker thread keeps reusing the same handle) instead of paying
+a connect + close for every query. Connections are opened in WAL mode with
+synchronous=NORMAL so readers never block the writer and a commit does not fsync
+the main database file; Python's per-connection statement cache keeps the prepared
+statements of the hot queries around between calls.
+
+Writes that touch many rows should be grouped with `transaction()` so they are
+committed once instead of once per row.
+
+`observe`, when given, is called with the statement kind ('SELECT', 'INSERT'...)
+and the duration of every execute/executemany on the pool's connections (see
+scripts/metrics.py).
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence
+
+
+def _statement_kind(sql: str) -> str:
+    head = sql.split(None, 1)
+    return head[0].upper() if head else ''
+
+
+class _ObservedConnection(sqlite3.Connection):
+    """Connection reporting the duration of execute/executemany to `observe(kind, seconds)`."""
+
+    observe: Callable[[str, float], None]
+
+    def execute(self, sql, parameters=(), /):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.observe(_statement_kind(sql), time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.observe(_statement_kind(sql), time.perf_counter() - started)
+
+
+class SQLitePool:
+    """Per-thread connection manager for a single SQLite database file."""
+
+    def __init__(
+        self,
+        db_path: str,
+        *,
+        busy_timeout_ms: int = 5000,
+        cached_statements: int = 256,
+        on_connect: Optional[Callable[[sqlite3.Connection], None]] = None,
+        observe: Optional[Callable[[str, float], None]] = None,
+    ) -> None:
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.on_connect = on_connect
+        self.observe = observe
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+
+    def _open(self) -> sqlite3.Connection:
+        # isolation_level=None puts the connection in autocommit mode: single
+        # statements commit immediately and multi-statement work is wrapped
+        # explicitly by `transaction()`.
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=_ObservedConnection if self.observe is not None else sqlite3.Connection,
+        )
+        if self.observe is not None:
+            conn.observe = self.observe
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a block of statements in a single write transaction.
+
+        Nested calls join the outermost transaction so helpers can be composed
+        without committing halfway through a batch.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> sqlite3.Cursor:
+        return self.connection().execute(sql, params)
+
+    def executemany(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> sqlite3.Cursor:
+        return self.connection().executemany(sql, seq_of_params)
+
+    def query_one(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        return self.execute(sql, params).fetchone()
+
+    def query_all(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        return self.execute(sql, params).fetchall()
+
+    def close_all(self) -> None:
+        """Close every connection opened by this pool (used on shutdown)."""
+        with self._lock:
+            conns, self._connections = self._connections, []
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
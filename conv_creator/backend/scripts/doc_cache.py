@@ -0,0 +1,119 @@
+"""
+In-process cache of parsed JSON documents.
+
+Discussion files are read by several endpoints (users, previews, merges of
+`users` into an existing file...). `DocumentCache.load` parses a file once per
+version and hands the same object to every caller until the file changes.
+
+Entries are keyed by the resolved path and tagged with (mtime_ns, size): a
+stale entry is never returned, it is simply re-parsed. The write paths also
+call `invalidate` so memory is released as soon as a file changes or goes
+away. Memory use is estimated from the file size (parsed Python objects are
+several times larger than the JSON text) and the least recently used documents
+are evicted once the estimate exceeds DOC_CACHE_MAX_BYTES.
+
+Cached documents are shared: callers must not mutate them (copy first).
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict
+
+from scripts import json_codec
+
+DOC_CACHE_MAX_BYTES = int(os.getenv('DOC_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# rough ratio between the memory of a parsed document and its size on disk
+PARSED_SIZE_FACTOR = 6
+
+
+class DocumentCache:
+    """Bounded LRU of parsed JSON files keyed by (real path, mtime_ns, size)."""
+
+    def __init__(self, max_bytes: int = DOC_CACHE_MAX_BYTES, size_factor: int = PARSED_SIZE_FACTOR) -> None:
+        self.max_bytes = max_bytes
+        self.size_factor = size_factor
+        # real path -> (mtime_ns, size, document, estimated bytes)
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def load(self, path: str) -> Any:
+        """Return the parsed content of `path`; raises like open()/json.loads on failure."""
+        key = os.path.realpath(path)
+        st = os.stat(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        doc = json_codec.load_file(key)
+        self._store(key, st, doc)
+        return doc
+
+    def store(self, path: str, doc: Any) -> None:
+        """Cache `doc` as the content of `path` as it is now on disk (e.g. right after writing it)."""
+        key = os.path.realpath(path)
+        self._store(key, os.stat(key), doc)
+
+    def _store(self, key: str, st: os.stat_result, doc: Any) -> None:
+        estimate = max(1, st.st_size) * self.size_factor
+        with self._lock:
+            self._drop(key)
+            # a single huge document would flush everything else: don't keep it
+            if estimate > self.max_bytes // 2:
+                return
+            self._entries[key] = (st.st_mtime_ns, st.st_size, doc, estimate)
+            self._bytes += estimate
+            while self._bytes > self.max_bytes:
+                _, (_, _, _, size) = self._entries.popitem(last=False)
+                self._bytes -= size
+                self.evictions += 1
+
+    def _drop(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[3]
+        return True
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            if self._drop(os.path.realpath(path)):
+                self.invalidations += 1
+
+    def invalidate_tree(self, directory: str) -> None:
+        """Drop every cached document located under `directory`."""
+        prefix = os.path.realpath(directory) + os.sep
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "estimated_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+documents = DocumentCache()
@@ -0,0 +1,222 @@
+"""
+Background watcher keeping the files table in sync with changes made outside the API.
+
+`FilesWatcher` runs in a daemon thread and reports changes under a root folder
+through a callback `on_change(files, dirs)`:
+
+  - files: paths of files that were created, written, moved or deleted
+  - dirs:  directories whose content must be rescanned (created/moved/deleted
+           folders, or the root itself when a full rescan is needed)
+
+Events are debounced: the callback runs once the tree has been quiet for
+`debounce` seconds (or at the latest MAX_DELAY_FACTOR * debounce after the
+first event, so a steady stream of writes cannot postpone it forever), with
+every path collected in the meantime.
+
+On Linux the watcher uses inotify (through ctypes, no extra dependency) with a
+watch per directory. Elsewhere, or when inotify is unavailable or runs out of
+watches, it falls back to polling: every `poll_interval` seconds it asks for a
+rescan of the root, which the caller implements as the incremental,
+stat-based rescan.
+
+Configuration (read by main.py): FS_WATCHER=1 enables the watcher,
+FS_WATCHER_MODE=auto|inotify|poll, FS_WATCHER_DEBOUNCE (seconds, default 0.5),
+FS_WATCHER_POLL_INTERVAL (seconds, default 5).
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+from typing import Callable, Dict, Optional, Set
+
+logger = logging.getLogger('uvicorn.error')
+
+OnChange = Callable[[Set[str], Set[str]], None]
+
+# inotify event masks (see inotify(7))
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT = struct.Struct('iIII')
+MAX_DELAY_FACTOR = 10
+
+
+class _Inotify:
+    """Minimal inotify binding: one watch per directory, recursive registration."""
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm = libc.inotify_rm_watch
+        self._rm.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs: Dict[int, str] = {}
+
+    def watch_tree(self, top: str) -> None:
+        stack = [top]
+        while stack:
+            current = stack.pop()
+            wd = self._add(self.fd, os.fsencode(current), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise OSError(err, 'inotify watch limit reached (fs.inotify.max_user_watches)')
+                continue  # vanished or unreadable directory
+            self.dirs[wd] = current
+            try:
+                with os.scandir(current) as it:
+                    stack.extend(e.path for e in it if e.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+
+    def read(self):
+        """Yield (directory, name, mask) for every pending event."""
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            directory = self.dirs.get(wd)
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+            yield directory, name, mask
+
+    def close(self) -> None:
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class FilesWatcher:
+    """Debounced change notifications for a directory tree (inotify or polling)."""
+
+    def __init__(self, root: str, on_change: OnChange, *, mode: str = 'auto', debounce: float = 0.5, poll_interval: float = 5.0) -> None:
+        self.root = os.path.normpath(root)
+        self.on_change = on_change
+        self.mode = mode
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._files: Set[str] = set()
+        self._dirs: Set[str] = set()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='files-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _flush(self) -> None:
+        files, dirs = self._files, self._dirs
+        self._files, self._dirs = set(), set()
+        if not files and not dirs:
+            return
+        try:
+            self.on_change(files, dirs)
+        except Exception as e:
+            logger.error(f"files watcher: sync failed: {e}")
+
+    def _run(self) -> None:
+        inotify = None
+        if self.mode in ('auto', 'inotify') and sys.platform.startswith('linux'):
+            try:
+                inotify = _Inotify()
+                inotify.watch_tree(self.root)
+            except (OSError, AttributeError) as e:
+                logger.warning(f"files watcher: inotify unavailable ({e}), falling back to polling")
+                if inotify is not None:
+                    inotify.close()
+                inotify = None
+        try:
+            if inotify is not None:
+                self.backend = 'inotify'
+                logger.info(f"files watcher: watching {self.root} with inotify ({len(inotify.dirs)} directories)")
+                self._run_inotify(inotify)
+            else:
+                self.backend = 'poll'
+                logger.info(f"files watcher: polling {self.root} every {self.poll_interval}s")
+                self._run_poll()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _run_poll(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self._dirs.add(self.root)
+            self._flush()
+
+    def _run_inotify(self, inotify: _Inotify) -> None:
+        deadline = None
+        latest = None
+        while not self._stop.is_set():
+            timeout = 0.5 if deadline is None else max(0.0, min(0.5, deadline - time.monotonic()))
+            ready, _, _ = select.select([inotify.fd], [], [], timeout)
+            now = time.monotonic()
+            if ready:
+                for directory, name, mask in inotify.read():
+                    self._record(inotify, directory, name, mask)
+                if latest is None:
+                    latest = now + self.debounce * MAX_DELAY_FACTOR
+                deadline = min(now + self.debounce, latest)
+            if deadline is not None and now >= deadline:
+                deadline = latest = None
+                self._flush()
+
+    def _record(self, inotify: _Inotify, directory: Optional[str], name: str, mask: int) -> None:
+        if mask & IN_Q_OVERFLOW or directory is None:
+            # events were lost: rescan everything
+            self._dirs.add(self.root)
+            return
+        if mask & IN_IGNORED:
+            return
+        path = os.path.join(directory, name) if name else directory
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if directory == self.root:
+                logger.warning(f"files watcher: {self.root} was removed or moved")
+            self._dirs.add(os.path.dirname(directory))
+            return
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    inotify.watch_tree(path)
+                except OSError as e:
+                    logger.warning(f"files watcher: {e}")
+            self._dirs.add(path)
+            return
+        self._files.add(path)
@@ -0,0 +1,149 @@
+"""
+HTTP caching helpers for serving JSON files.
+
+Files are identified by a version (path, size, mtime_ns). From it we derive an
+ETag and Last-Modified header so browsers can revalidate with If-None-Match /
+If-Modified-Since and get a 304 without a body.
+
+`CompressedBodyCache` keeps gzip-compressed copies of large files per version
+(bounded by total compressed size, least recently used evicted first), so
+repeated opens of a big discussion tree do not re-read or re-compress it.
+Files larger than the whole cache are compressed chunk by chunk while they are
+sent (`iter_gzip`) instead of in memory.
+
+The gzip and identity bodies of a file are different representations, so the
+gzip one gets its own ETag (`gzip_etag`).
+"""
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+# files smaller than this are sent uncompressed
+GZIP_MIN_BYTES = int(os.getenv('JSON_GZIP_MIN_BYTES', str(64 * 1024)))
+GZIP_CACHE_BYTES = int(os.getenv('JSON_GZIP_CACHE_BYTES', str(64 * 1024 * 1024)))
+GZIP_LEVEL = 6
+CHUNK_SIZE = 1 << 16
+
+Version = Tuple[str, int, int]
+
+
+def file_version(path: str, st: os.stat_result) -> Version:
+    return (path, st.st_size, st.st_mtime_ns)
+
+
+def etag_for(st: os.stat_result, content_hash: Optional[str] = None) -> str:
+    if content_hash:
+        return f'"{content_hash[:32]}"'
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def gzip_etag(etag: str) -> str:
+    """ETag of the gzip-encoded body of the file whose identity ETag is `etag`."""
+    return etag[:-1] + '-gzip"'
+
+
+def last_modified(st: os.stat_result) -> str:
+    return formatdate(st.st_mtime, usegmt=True)
+
+
+def is_not_modified(headers, etag: str, st: os.stat_result) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since (If-None-Match wins when present)."""
+    inm = headers.get('if-none-match')
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(',')]
+        # weak comparison, as required for If-None-Match
+        return '*' in tags or etag in [t[2:] if t.startswith('W/') else t for t in tags]
+    ims = headers.get('if-modified-since')
+    if ims:
+        try:
+            return int(st.st_mtime) <= int(parsedate_to_datetime(ims).timestamp())
+        except (TypeError, ValueError, OverflowError):
+            return False
+    return False
+
+
+def accepts_gzip(headers) -> bool:
+    for part in headers.get('accept-encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def _compressor(level: int):
+    # wbits=31: gzip container, with a zero mtime so a file version always compresses to the same bytes
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+def iter_file(fh: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the rest of an open file in chunks, closing it at the end."""
+    try:
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fh.close()
+
+
+def iter_gzip(fh: BinaryIO, level: int = GZIP_LEVEL, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the gzip compression of the rest of an open file, closing it at the end."""
+    compressor = _compressor(level)
+    for chunk in iter_file(fh, chunk_size):
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+class CompressedBodyCache:
+    """LRU of gzip-compressed file bodies keyed by file version."""
+
+    def __init__(self, max_bytes: int = GZIP_CACHE_BYTES, level: int = GZIP_LEVEL) -> None:
+        self.max_bytes = max_bytes
+        self.level = level
+        self._entries: 'OrderedDict[Version, bytes]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def fits(self, size: int) -> bool:
+        """Whether a file of `size` bytes is compressed through the cache (else stream it with iter_gzip)."""
+        return size <= self.max_bytes
+
+    def get(self, version: Version, fh: BinaryIO) -> bytes:
+        """Compressed body of `version`; on a miss it is read from `fh`, the open file of that version."""
+        with self._lock:
+            body = self._entries.get(version)
+            if body is not None:
+                self._entries.move_to_end(version)
+                self.hits += 1
+                return body
+            self.misses += 1
+        compressor = _compressor(self.level)
+        body = compressor.compress(fh.read()) + compressor.flush()
+        self._store(version, body)
+        return body
+
+    def _store(self, version: Version, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            # drop older versions of the same file right away
+            for old in [v for v in self._entries if v[0] == version[0]]:
+                self._bytes -= len(self._entries.pop(old))
+            self._entries[version] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,80 @@
+"""
+JSON encoding/decoding used across the backend.
+
+Every place that parses or writes discussion files (file writes, the parsed
+document cache, classification, API responses, LLM prompts) goes through this
+module, so the cost of JSON can be measured and reduced in one place.
+
+When `orjson` is installed it is used for both directions; otherwise the
+standard library. JSON_BACKEND=stdlib forces the standard library. Both write
+the same 2-space indented layout and parse back to the same values, but the
+bytes are not always identical: orjson formats some floats differently
+(0.00001 and 1e16 where `json` writes 1e-05 and 1e+16). The rare inputs it does
+not handle like `json` (non-string keys, integers beyond 64 bits, NaN/Infinity,
+nesting deeper than 254 levels, e.g. very long reply chains) fall back to the
+standard library.
+
+Files are written indented by default, as before. JSON_COMPACT=1 writes them
+without whitespace, which is smaller and faster to write and parse; files stay
+valid JSON either way.
+
+`python -m benchmarks.json_codec_bench` compares the backends.
+"""
+
+import os
+import json
+import time
+from typing import Any, Union
+
+from scripts import metrics
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None and os.getenv('JSON_BACKEND', 'auto').lower() != 'stdlib' else 'stdlib'
+COMPACT_FILES = os.getenv('JSON_COMPACT', '0').lower() in ('1', 'true', 'yes')
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if BACKEND == 'orjson':
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # e.g. NaN/Infinity, which json accepts; json raises its own error otherwise
+            pass
+    return json.loads(data)
+
+
+def load_file(path: str) -> Any:
+    """Parse a UTF-8 JSON file (raises OSError / ValueError like open + json.load)."""
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    started = time.perf_counter()
+    doc = loads(data)
+    metrics.FILE_PARSE_DURATION.observe(time.perf_counter() - started)
+    metrics.FILE_PARSE_BYTES.inc(amount=len(data))
+    return doc
+
+
+def dumps(obj: Any, *, indent: bool = False, ensure_ascii: bool = False) -> bytes:
+    """Serialise to UTF-8 bytes: compact, or indented by 2 spaces like json.dumps(indent=2)."""
+    if BACKEND == 'orjson' and not ensure_ascii:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+        except (TypeError, orjson.JSONEncodeError):
+            pass
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=ensure_ascii).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=ensure_ascii, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_text(obj: Any, *, indent: bool = False) -> str:
+    """Like `dumps` but returns str (non-ASCII kept as is), e.g. for prompts."""
+    return dumps(obj, indent=indent).decode('utf-8')
+
+
+def dump_file(fh, obj: Any, *, ensure_ascii: bool = False) -> None:
+    """Write a document to a binary file handle in the on-disk layout (see JSON_COMPACT)."""
+    fh.write(dumps(obj, indent=not COMPACT_FILES, ensure_ascii=ensure_ascii))
@@ -0,0 +1,188 @@
+"""
+JSON Patch (RFC 6902) and JSON Pointer (RFC 6901) for parsed documents.
+
+`apply_patch` never mutates its input: the containers on the path of every
+operation are copied (once per patch) and everything else is shared with the
+original document. That keeps an edit of a large discussion tree proportional
+to the depth of the edited node, and lets the input be a shared, read-only
+document from scripts/doc_cache.
+"""
+
+import copy
+from typing import Any, List, Set
+
+OPS = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+
+class JsonPatchError(ValueError):
+    """The patch cannot be applied to the document (e.g. a path does not exist)."""
+
+
+class InvalidPatch(JsonPatchError):
+    """The patch document itself is malformed."""
+
+
+class PatchTestFailed(JsonPatchError):
+    """A `test` operation did not match."""
+
+
+def parse_pointer(pointer: Any) -> List[str]:
+    if not isinstance(pointer, str):
+        raise InvalidPatch(f"JSON pointer must be a string, got {pointer!r}")
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise InvalidPatch(f"JSON pointer must start with '/': {pointer!r}")
+    return [t.replace('~1', '/').replace('~0', '~') for t in pointer[1:].split('/')]
+
+
+def _index(container: list, token: str, pointer: str, allow_end: bool = False) -> int:
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+        raise JsonPatchError(f"invalid array index {token!r} in {pointer!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"array index {index} out of range in {pointer!r}")
+    return index
+
+
+def resolve(doc: Any, tokens: List[str], pointer: str = '') -> Any:
+    """Return the value `tokens` points at; raises JsonPatchError if it does not exist."""
+    value = doc
+    for token in tokens:
+        if isinstance(value, dict):
+            if token not in value:
+                raise JsonPatchError(f"path {pointer!r} does not exist")
+            value = value[token]
+        elif isinstance(value, list):
+            value = value[_index(value, token, pointer)]
+        else:
+            raise JsonPatchError(f"path {pointer!r} does not exist")
+    return value
+
+
+def _json_equal(a: Any, b: Any) -> bool:
+    # JSON has no bool/number equivalence, unlike Python's True == 1
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_json_equal(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_json_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+class _Patcher:
+    """Applies operations with copy-on-write of the containers along each path."""
+
+    def __init__(self, doc: Any) -> None:
+        self.doc = doc
+        # ids of the containers created by this patch, which may be mutated in place
+        self._owned: Set[int] = set()
+
+    def _own(self, value: Any) -> Any:
+        if id(value) in self._owned:
+            return value
+        value = dict(value) if isinstance(value, dict) else list(value)
+        self._owned.add(id(value))
+        return value
+
+    def _parent(self, tokens: List[str], pointer: str) -> Any:
+        """Return a writable copy of the container holding the last token."""
+        if not isinstance(self.doc, (dict, list)):
+            raise JsonPatchError(f"path {pointer!r} does not exist")
+        self.doc = node = self._own(self.doc)
+        for token in tokens[:-1]:
+            if isinstance(node, dict):
+                if token not in node:
+                    raise JsonPatchError(f"path {pointer!r} does not exist")
+                key = token
+            else:
+                key = _index(node, token, pointer)
+            child = node[key]
+            if not isinstance(child, (dict, list)):
+                raise JsonPatchError(f"path {pointer!r} does not exist")
+            node[key] = child = self._own(child)
+            node = child
+        return node
+
+    def add(self, pointer: str, value: Any) -> None:
+        tokens = parse_pointer(pointer)
+        if not tokens:
+            self.doc = value
+            return
+        parent = self._parent(tokens, pointer)
+        if isinstance(parent, dict):
+            parent[tokens[-1]] = value
+        else:
+            parent.insert(_index(parent, tokens[-1], pointer, allow_end=True), value)
+
+    def remove(self, pointer: str) -> Any:
+        tokens = parse_pointer(pointer)
+        if not tokens:
+            raise JsonPatchError("cannot remove the whole document")
+        resolve(self.doc, tokens, pointer)
+        parent = self._parent(tokens, pointer)
+        if isinstance(parent, dict):
+            return parent.pop(tokens[-1])
+        return parent.pop(_index(parent, tokens[-1], pointer))
+
+    def replace(self, pointer: str, value: Any) -> None:
+        tokens = parse_pointer(pointer)
+        resolve(self.doc, tokens, pointer)
+        if not tokens:
+            self.doc = value
+            return
+        parent = self._parent(tokens, pointer)
+        key = tokens[-1] if isinstance(parent, dict) else _index(parent, tokens[-1], pointer)
+        parent[key] = value
+
+    def apply(self, op: Any) -> None:
+        if not isinstance(op, dict) or op.get('op') not in OPS:
+            raise InvalidPatch(f"invalid operation {op!r}")
+        name = op['op']
+        if 'path' not in op:
+            raise InvalidPatch(f"'{name}' operation without 'path'")
+        path = op['path']
+        if name in ('add', 'replace', 'test') and 'value' not in op:
+            raise InvalidPatch(f"'{name}' operation without 'value'")
+        if name in ('move', 'copy') and 'from' not in op:
+            raise InvalidPatch(f"'{name}' operation without 'from'")
+        if name == 'add':
+            self.add(path, op['value'])
+        elif name == 'remove':
+            self.remove(path)
+        elif name == 'replace':
+            self.replace(path, op['value'])
+        elif name == 'move':
+            source = op['from']
+            if path != source and path.startswith(source + '/'):
+                raise JsonPatchError(f"cannot move {source!r} into its own child {path!r}")
+            if path != source:
+                self.add(path, self.remove(source))
+        elif name == 'copy':
+            source = op['from']
+            # a deep copy: the same container must not be reachable (and owned) twice
+            self.add(path, copy.deepcopy(resolve(self.doc, parse_pointer(source), source)))
+        else:
+            actual = resolve(self.doc, parse_pointer(path), path)
+            if not _json_equal(actual, op['value']):
+                raise PatchTestFailed(f"test failed at {path!r}")
+
+
+def apply_patch(doc: Any, patch: Any) -> Any:
+    """Apply an RFC 6902 patch and return the new document; `doc` is left untouched.
+
+    The patch is atomic: on error an exception is raised and nothing is returned.
+    """
+    if not isinstance(patch, list):
+        raise InvalidPatch("a JSON patch must be an array of operations")
+    patcher = _Patcher(doc)
+    for op in patch:
+        patcher.apply(op)
+    return patcher.doc
@@ -0,0 +1,254 @@
+"""
+Incremental JSON tokenizer working on raw bytes.
+
+`JSONEventParser` is fed chunks of a JSON document and returns parse events as
+soon as each token is complete, so callers can inspect a document of any size
+while holding only the current token and the container stack in memory.
+
+Events are tuples `(kind, value, start, end)` where `start`/`end` are absolute
+byte offsets of the token in the input (end exclusive) and `kind` is one of:
+
+    start_map, end_map, start_array, end_array, map_key,
+    string, number, boolean, null
+
+Working on bytes keeps the offsets exact for UTF-8 input: the structural
+characters, quotes and backslashes are ASCII and never occur inside a multi-byte
+sequence, so strings can be delimited without decoding the whole buffer.
+"""
+
+import json
+import re
+from typing import Any, BinaryIO, Iterator, List, Tuple
+
+Event = Tuple[str, Any, int, int]
+
+_WS_RE = re.compile(rb'[ \t\n\r]*')
+# strings without escapes or control characters: the common case, decoded directly
+_SIMPLE_STRING_RE = re.compile(rb'"([^"\\\x00-\x1f]*)"')
+_NUMBER_RE = re.compile(rb'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?')
+_NUMBER_CHARS = b'0123456789+-.eE'
+_CTRL_RE = re.compile(rb'[\x00-\x1f]')
+_LITERALS = {ord('t'): (b'true', 'boolean', True), ord('f'): (b'false', 'boolean', False), ord('n'): (b'null', 'null', None)}
+
+# parser states
+_VALUE = 0            # a value is required (top level, after ':' or ',' in an array)
+_VALUE_OR_END = 1     # right after '['
+_KEY = 2              # after ',' in an object
+_KEY_OR_END = 3       # right after '{'
+_COLON = 4            # after an object key
+_COMMA_OR_END = 5     # after a value inside a container
+_DONE = 6             # top-level value complete
+
+_QUOTE = ord('"')
+_BACKSLASH = ord('\\')
+
+
+class JSONStreamError(ValueError):
+    """Raised when the input is not valid JSON."""
+
+
+class JSONEventParser:
+    """Push parser: call `feed()` with successive chunks, then `close()`."""
+
+    def __init__(self) -> None:
+        self._buf = b''
+        self._offset = 0          # absolute offset of self._buf[0]
+        self._stack: List[int] = []   # container stack: ord('{') or ord('[')
+        self._state = _VALUE
+        self._string_scan = 0     # resume point when a string spans chunks
+        self._closed = False
+
+    @property
+    def depth(self) -> int:
+        return len(self._stack)
+
+    def feed(self, data: bytes) -> List[Event]:
+        if self._closed:
+            raise JSONStreamError('parser already closed')
+        if data:
+            self._buf += data
+        return self._parse(final=False)
+
+    def close(self) -> List[Event]:
+        events = self._parse(final=True)
+        self._closed = True
+        if self._state != _DONE:
+            raise JSONStreamError(f'unexpected end of input at offset {self._offset + len(self._buf)}')
+        return events
+
+    def _error(self, msg: str, pos: int) -> JSONStreamError:
+        return JSONStreamError(f'{msg} at offset {self._offset + pos}')
+
+    def _parse(self, final: bool) -> List[Event]:
+        buf = self._buf
+        n = len(buf)
+        i = 0
+        base = self._offset
+        events: List[Event] = []
+        append = events.append
+        stack = self._stack
+        state = self._state
+        skip_ws = _WS_RE.match
+        simple_string = _SIMPLE_STRING_RE.match
+        while True:
+            i = skip_ws(buf, i).end()
+            if i >= n:
+                break
+            c = buf[i]
+            if state == _DONE:
+                raise self._error('extra data after JSON value', i)
+
+            if state == _COLON:
+                if c != 0x3A:  # ':'
+                    raise self._error("expected ':'", i)
+                state = _VALUE
+                i += 1
+                continue
+
+            if state == _COMMA_OR_END:
+                if c == 0x2C:  # ','
+                    state = _KEY if stack[-1] == 0x7B else _VALUE
+                    i += 1
+                    continue
+                if (c == 0x7D and stack[-1] == 0x7B) or (c == 0x5D and stack[-1] == 0x5B):
+                    stack.pop()
+                    append(('end_map' if c == 0x7D else 'end_array', None, base + i, base + i + 1))
+                    i += 1
+                    state = _COMMA_OR_END if stack else _DONE
+                    continue
+                raise self._error("expected ',' or closing bracket", i)
+
+            if state in (_KEY, _KEY_OR_END):
+                if c == 0x7D and state == _KEY_OR_END:
+                    stack.pop()
+                    append(('end_map', None, base + i, base + i + 1))
+                    i += 1
+                    state = _COMMA_OR_END if stack else _DONE
+                    continue
+                if c != _QUOTE:
+                    raise self._error('expected object key', i)
+                m = simple_string(buf, i)
+                if m is not None:
+                    end = m.end()
+                    value = self._decode_simple(m.group(1), i)
+                else:
+                    end = self._find_string_end(buf, i, final)
+                    if end < 0:
+                        break
+                    value = self._decode_string(buf, i, end)
+                append(('map_key', value, base + i, base + end))
+                i = end
+                state = _COLON
+                continue
+
+            # a value is expected (_VALUE or _VALUE_OR_END)
+            if c == 0x5D and state == _VALUE_OR_END:
+                stack.pop()
+                append(('end_array', None, base + i, base + i + 1))
+                i += 1
+                state = _COMMA_OR_END if stack else _DONE
+                continue
+            if c == 0x7B:  # '{'
+                stack.append(c)
+                append(('start_map', None, base + i, base + i + 1))
+                i += 1
+                state = _KEY_OR_END
+                continue
+            if c == 0x5B:  # '['
+                stack.append(c)
+                append(('start_array', None, base + i, base + i + 1))
+                i += 1
+                state = _VALUE_OR_END
+                continue
+            if c == _QUOTE:
+                m = simple_string(buf, i)
+                if m is not None:
+                    end = m.end()
+                    value = self._decode_simple(m.group(1), i)
+                else:
+                    end = self._find_string_end(buf, i, final)
+                    if end < 0:
+                        break
+                    value = self._decode_string(buf, i, end)
+                append(('string', value, base + i, base + end))
+                i = end
+                state = _COMMA_OR_END if stack else _DONE
+                continue
+            lit = _LITERALS.get(c)
+            if lit is not None:
+                word, kind, value = lit
+                if buf.startswith(word, i):
+                    append((kind, value, base + i, base + i + len(word)))
+                    i += len(word)
+                    state = _COMMA_OR_END if stack else _DONE
+                    continue
+                if not final and word.startswith(buf[i:]):
+                    break  # literal split across chunks
+                raise self._error('invalid literal', i)
+            m = _NUMBER_RE.match(buf, i)
+            end = m.end() if m is not None else i
+            if not final and not buf[end:].lstrip(_NUMBER_CHARS):
+                break  # the number may continue in the next chunk
+            if m is None:
+                raise self._error('unexpected character', i)
+            text = m.group()
+            value = float(text) if (b'.' in text or b'e' in text or b'E' in text) else int(text)
+            append(('number', value, base + i, base + end))
+            i = end
+            state = _COMMA_OR_END if stack else _DONE
+        self._state = state
+        if final and i < n:
+            raise self._error('unexpected end of input', i)
+        # drop consumed bytes so the buffer only holds the incomplete tail
+        if i:
+            self._buf = buf[i:]
+            self._offset += i
+            self._string_scan = max(0, self._string_scan - i)
+        return events
+
+    def _find_string_end(self, buf: bytes, start: int, final: bool) -> int:
+        """Return the offset just past the closing quote, or -1 if more input is needed."""
+        j = max(start + 1, self._string_scan)
+        while True:
+            q = buf.find(b'"', j)
+            if q < 0:
+                if final:
+                    raise self._error('unterminated string', start)
+                self._string_scan = len(buf)
+                return -1
+            # count preceding backslashes: an even number means the quote is not escaped
+            k = q - 1
+            while k > start and buf[k] == _BACKSLASH:
+                k -= 1
+            if (q - 1 - k) % 2 == 0:
+                self._string_scan = 0
+                return q + 1
+            j = q + 1
+
+    def _decode_simple(self, raw: bytes, start: int) -> str:
+        try:
+            return raw.decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise self._error(f'invalid string ({e})', start)
+
+    def _decode_string(self, buf: bytes, start: int, end: int) -> str:
+        raw = buf[start + 1:end - 1]
+        if _CTRL_RE.search(raw):
+            raise self._error('invalid control character in string', start)
+        try:
+            if b'\\' not in raw:
+                return raw.decode('utf-8')
+            return json.loads(buf[start:end])
+        except (UnicodeDecodeError, ValueError) as e:
+            raise self._error(f'invalid string ({e})', start)
+
+
+def iter_events(fh: BinaryIO, chunk_size: int = 1 << 16) -> Iterator[Event]:
+    """Yield parse events for a binary file object, reading it in chunks."""
+    parser = JSONEventParser()
+    while True:
+        chunk = fh.read(chunk_size)
+        if not chunk:
+            break
+        yield from parser.feed(chunk)
+    yield from parser.close()
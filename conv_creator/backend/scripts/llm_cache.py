@@ -0,0 +1,169 @@
+"""
+Persistent cache for LLM completions.
+
+The LLM calls in llm_calls.py use a fixed seed and deterministic prompts, so an
+identical request can be answered from disk instead of going back to Groq.
+Entries are keyed on a hash of everything that influences the completion
+(model, system and user prompts, sampling parameters) and stored in a small
+SQLite file in the data folder (BACKEND_DATA_DIR), next to the main database.
+
+Entries expire after LLM_CACHE_TTL seconds: an expired entry is dropped when it
+is looked up, and all of them when the cache is trimmed. The cache keeps a
+running total of the stored bytes; only when it grows beyond
+LLM_CACHE_MAX_BYTES are the expired and then the least recently used entries
+evicted. Set LLM_CACHE=0 to disable the cache entirely.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+from scripts import metrics
+from scripts.db import SQLitePool
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.abspath(os.getenv('BACKEND_DATA_DIR', BACKEND_DIR))
+DEFAULT_CACHE_PATH = os.path.join(DATA_DIR, 'llm_cache.sqlite3')
+
+# request fields that change the completion; `stream` is deliberately left out so
+# streamed and non-streamed calls share entries
+KEY_FIELDS = ('model', 'messages', 'temperature', 'top_p', 'max_completion_tokens', 'seed', 'stop')
+
+
+class LLMCache:
+    """Content-addressed completion cache with TTL and size-based LRU eviction."""
+
+    def __init__(self, path: str, *, ttl_seconds: float, max_bytes: int, enabled: bool = True) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # bytes of all stored responses, summed once on first use and then kept up to date
+        self._bytes: Optional[int] = None
+        self._db = SQLitePool(path, on_connect=self._ensure_schema, observe=metrics.sqlite_observer('llm_cache'))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ensure_schema(conn) -> None:
+        conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            '''
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_created_at ON llm_cache(created_at)')
+
+    @staticmethod
+    def key_for(request: Dict[str, Any]) -> str:
+        material = {k: request.get(k) for k in KEY_FIELDS}
+        encoded = json.dumps(material, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        row = self._db.query_one('SELECT response, created_at, size FROM llm_cache WHERE key = ?', (key,))
+        if row is None or now - row[1] > self.ttl_seconds:
+            removed = row is not None and self._db.execute('DELETE FROM llm_cache WHERE key = ?', (key,)).rowcount
+            with self._lock:
+                self.misses += 1
+                if removed:
+                    self._add_bytes(-row[2])
+            return None
+        self._db.execute('UPDATE llm_cache SET last_access = ? WHERE key = ?', (now, key))
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def put(self, key: str, model: Optional[str], response: str) -> None:
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self._db.transaction() as conn:
+            old = conn.execute('SELECT size FROM llm_cache WHERE key = ?', (key,)).fetchone()
+            conn.execute(
+                'INSERT OR REPLACE INTO llm_cache(key, model, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)',
+                (key, model, response, size, now, now),
+            )
+        with self._lock:
+            total = self._add_bytes(size - (old[0] if old else 0))
+        if total > self.max_bytes:
+            self.evict()
+
+    def _add_bytes(self, delta: int) -> int:
+        """Update the running total by `delta` bytes already written; returns it (self._lock held)."""
+        if self._bytes is None:
+            # the first sum already includes the change
+            self._bytes = self._db.query_one('SELECT COALESCE(SUM(size), 0) FROM llm_cache')[0]
+        else:
+            self._bytes += delta
+        return self._bytes
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until under max_bytes.
+
+        Called by `put` once the running total is over max_bytes; the total is
+        summed again here, which also corrects it for entries written by other
+        processes sharing the file.
+        """
+        removed = 0
+        with self._db.transaction() as conn:
+            removed += conn.execute('DELETE FROM llm_cache WHERE created_at < ?', (time.time() - self.ttl_seconds,)).rowcount
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM llm_cache').fetchone()[0]
+            if total > self.max_bytes:
+                # trim to 90% so a full cache does not evict on every insert
+                target = int(self.max_bytes * 0.9)
+                doomed = []
+                for key, size in conn.execute('SELECT key, size FROM llm_cache ORDER BY last_access'):
+                    if total <= target:
+                        break
+                    doomed.append((key,))
+                    total -= size
+                conn.executemany('DELETE FROM llm_cache WHERE key = ?', doomed)
+                removed += len(doomed)
+        with self._lock:
+            self.evictions += removed
+            self._bytes = total
+        return removed
+
+    def clear(self) -> None:
+        self._db.execute('DELETE FROM llm_cache')
+        with self._lock:
+            self._bytes = 0
+
+    def close(self) -> None:
+        self._db.close_all()
+
+    def stats(self) -> Dict[str, Any]:
+        entries, size = self._db.query_one('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache')
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+response_cache = LLMCache(
+    os.getenv('LLM_CACHE_PATH', DEFAULT_CACHE_PATH),
+    ttl_seconds=float(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600))),
+    max_bytes=int(os.getenv('LLM_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    enabled=os.getenv('LLM_CACHE', '1') not in ('0', 'false', 'False', 'no'),
+)
@@ -1,10 +1,17 @@
-from groq import Groq
 from dotenv import load_dotenv
 import os
 import json
 import re
-from typing import Dict, Any, List
+import asyncio
+import random
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional, Tuple
 import sys
+import threading
+import weakref
+
+from scripts import json_codec, metrics
+from scripts.llm_cache import response_cache
 
 # Load environment variables from .env file
 # Try multiple locations: backend/.env, then conv_creator/.env
@@ -24,24 +31,177 @@ else:
     load_dotenv()
     print(f"⚠️  No .env file found at expected locations", file=sys.stderr)
 
-# Initialize Groq client
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
-    error_msg = (
-        "GROQ_API_KEY not found in environment variables. "
-        f"Please create a .env file with your API key.\n"
-        f"Checked locations: {env_path}"
-    )
-    print(f"❌ {error_msg}", file=sys.stderr)
-    raise ValueError(error_msg)
+# Groq client settings
+# GROQ_BASE_URL points the client at another OpenAI/Groq-compatible server, e.g. the
+# offline stand-in of benchmarks/fake_groq.py (which does not check the API key)
+base_url = os.getenv("GROQ_BASE_URL") or None
+# retries done by the Groq SDK itself on 429/5xx/timeouts (its default is 2)
+sdk_max_retries = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+
+# (sync, async) Groq clients; importing groq and building the clients takes a few
+# hundred ms, so it happens on the first LLM call rather than at import
+_clients: Optional[Tuple[Any, Any]] = None
+_clients_lock = threading.Lock()
+
+
+def _groq() -> Tuple[Any, Any]:
+    """Return the (sync, async) Groq clients, creating them on first use.
+
+    Raises ValueError when GROQ_API_KEY is not set (unless GROQ_BASE_URL is).
+    """
+    global _clients
+    if _clients is not None:
+        return _clients
+    with _clients_lock:
+        if _clients is not None:
+            return _clients
+        api_key = os.getenv("GROQ_API_KEY") or ("unused" if base_url else None)
+        if not api_key:
+            error_msg = (
+                "GROQ_API_KEY not found in environment variables. "
+                f"Please create a .env file with your API key.\n"
+                f"Checked locations: {env_path}"
+            )
+            print(f"❌ {error_msg}", file=sys.stderr)
+            raise ValueError(error_msg)
+        try:
+            from groq import Groq, AsyncGroq
+            client = Groq(api_key=api_key, base_url=base_url, max_retries=sdk_max_retries)
+            # async client used by the FastAPI endpoints so LLM round-trips don't block the event loop
+            async_client = AsyncGroq(api_key=api_key, base_url=base_url, max_retries=sdk_max_retries)
+            print(f"✅ Groq client initialized successfully" + (f" (base URL {base_url})" if base_url else ""), file=sys.stderr)
+        except Exception as e:
+            error_msg = f"Failed to initialize Groq client: {e}"
+            print(f"❌ {error_msg}", file=sys.stderr)
+            raise
+        _clients = (client, async_client)
+        return _clients
+
+
+# Maximum number of LLM requests in flight at once across the async API
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# One semaphore per event loop: an asyncio.Semaphore is bound to the loop that
+# first waits on it, and the app, TestClient and asyncio.run() callers each run
+# their own loop
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+@asynccontextmanager
+async def _llm_slot():
+    """Hold one of the LLM_MAX_CONCURRENCY slots of the running loop for the duration of a call."""
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _llm_semaphores[loop] = asyncio.Semaphore(max(1, LLM_MAX_CONCURRENCY))
+    async with semaphore:
+        yield
+
+
+def _complete(request: Dict[str, Any], use_cache: bool = True) -> str:
+    """Run a chat completion, answering from the response cache when possible."""
+    key = response_cache.key_for(request) if use_cache and response_cache.enabled else None
+    if key is not None:
+        cached = response_cache.get(key)
+        if cached is not None:
+            print("💾 LLM response served from cache")
+            return cached
+    completion = _groq()[0].chat.completions.create(**request)
+    content = completion.choices[0].message.content
+    if key is not None and content:
+        response_cache.put(key, request.get("model"), content)
+    return content
+
+
+async def _complete_async(request: Dict[str, Any], use_cache: bool = True) -> str:
+    """Async variant of _complete; cache hits do not take a concurrency slot.
+
+    The response cache is SQLite, so its lookups and writes run in a worker
+    thread rather than on the event loop.
+    """
+    key = response_cache.key_for(request) if use_cache and response_cache.enabled else None
+    if key is not None:
+        cached = await asyncio.to_thread(response_cache.get, key)
+        if cached is not None:
+            print("💾 LLM response served from cache")
+            return cached
+    async with _llm_slot():
+        completion = await _groq()[1].chat.completions.create(**request)
+    content = completion.choices[0].message.content
+    if key is not None and content:
+        await asyncio.to_thread(response_cache.put, key, request.get("model"), content)
+    return content
+
+
+async def _stream_async(request: Dict[str, Any], use_cache: bool = True) -> AsyncIterator[str]:
+    """Yield the completion text piece by piece as Groq streams it.
+
+    A cache hit yields the whole cached text at once; a completed stream is
+    stored in the cache like a regular completion.
+    """
+    key = response_cache.key_for(request) if use_cache and response_cache.enabled else None
+    if key is not None:
+        cached = await asyncio.to_thread(response_cache.get, key)
+        if cached is not None:
+            print("💾 LLM response served from cache")
+            yield cached
+            return
+    parts = []
+    async with _llm_slot():
+        stream = await _groq()[1].chat.completions.create(**{**request, "stream": True})
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+    content = "".join(parts)
+    if key is not None and content:
+        await asyncio.to_thread(response_cache.put, key, request.get("model"), content)
+
+
+async def _stream_events(request: Dict[str, Any], use_cache: bool, clean: Callable[[str], str], raise_error: Callable[[Exception], None]) -> AsyncIterator[Tuple[str, str]]:
+    """Wrap _stream_async into ("token", delta) events and a final ("done", cleaned text)."""
+    _groq()  # ValueError when no API key is configured
+    parts = []
+    try:
+        async for delta in _stream_async(request, use_cache):
+            parts.append(delta)
+            yield "token", delta
+    except Exception as e:
+        raise_error(e)
+    yield "done", clean("".join(parts))
+
+
+class LLMRateLimitError(Exception):
+    """Groq rejected the request with a rate limit; `retry_after` is in seconds when known."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
 
-try:
-    client = Groq(api_key=api_key)
-    print(f"✅ Groq client initialized successfully", file=sys.stderr)
-except Exception as e:
-    error_msg = f"Failed to initialize Groq client: {e}"
-    print(f"❌ {error_msg}", file=sys.stderr)
-    raise
+def _retry_after(exc: Optional[Exception]) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _upstream_error(err: str, exc: Optional[Exception] = None) -> Optional[Exception]:
+    """Map well-known Groq failures to user-facing errors (None when not recognised)."""
+    from groq import RateLimitError
+
+    low = err.lower()
+    if "authentication" in low or "api key" in low:
+        return Exception("Authentication failed. Please check your GROQ_API_KEY in the .env file.")
+    elif isinstance(exc, (RateLimitError, LLMRateLimitError)) or "rate limit" in low:
+        return LLMRateLimitError("Rate limit exceeded. Please try again later.", _retry_after(exc))
+    elif "connection" in low or "network" in low:
+        return Exception("Network error. Please check your internet connection.")
+    return None
 
 SYSTEM_PROMPT = """You are a precise JSON transformation assistant.
 
@@ -158,12 +318,77 @@ def fix_incomplete_json(json_text: str) -> str:
     return json_text
 
 
-def transform_discussion_json(input_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+def _transform_request(input_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the chat completion arguments for transform_discussion_json."""
+    user_prompt = f"""Transform the following JSON into the target schema.
+
+### Input JSON
+
+{json_codec.dumps_text(input_data, indent=True)}
+
+
+Make sure that the output ends **immediately** after the last valid closing bracket.
+If you produce an empty node or any content after the valid JSON tree, delete it before returning.
+
+### Output JSON"""
+
+    return dict(
+        model="meta-llama/llama-4-maverick-17b-128e-instruct",
+        messages=[
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": user_prompt
+            }
+        ],
+        temperature=0,
+        max_completion_tokens=8192,
+        top_p=0.7,
+        stream=False,
+        stop=None,
+        seed=42
+    )
+
+
+def _parse_transform_result(result: str) -> Dict[str, Any]:
+    """Extract the JSON tree from the raw LLM output, repairing it if needed."""
+    # Extract JSON from the response
+    json_text = extract_json_from_text(result)
+
+    # Try to parse the JSON
+    try:
+        json_output = json_codec.loads(json_text)
+        print("✅ Successfully parsed JSON from LLM")
+        return json_output
+    except json.JSONDecodeError as e:
+        print(f"⚠️  JSON parsing failed: {e}")
+        print(f"   Attempting to fix incomplete JSON...")
+
+        # Try to salvage partial JSON
+        fixed_json = fix_incomplete_json(json_text)
+        json_output = json_codec.loads(fixed_json)
+        print("✅ Recovered by fixing incomplete JSON")
+        return json_output
+
+
+def _transform_error(e: Exception) -> Exception:
+    error_msg = str(e)
+    print(f"❌ LLM call failed: {error_msg}")
+    # Provide more specific error messages
+    return _upstream_error(error_msg, e) or Exception(f"LLM API error: {error_msg}")
+
+
+@metrics.track_llm
+def transform_discussion_json(input_data: List[Dict[str, Any]], *, use_cache: bool = True) -> Dict[str, Any]:
     """
     Transform a flat discussion JSON into the hierarchical tree structure.
     
     Args:
         input_data: List of discussion items with id, speaker, text, target_id
+        use_cache: set to False to bypass the LLM response cache
     
     Returns:
         Dict: Hierarchical JSON tree following the schema
@@ -173,85 +398,38 @@ def transform_discussion_json(input_data: List[Dict[str, Any]]) -> Dict[str, Any
         Exception: If LLM call fails or JSON parsing fails
     """
     # Verify client is initialized
-    if not client:
-        raise ValueError("Groq client not initialized. Check API key configuration.")
-    
-    user_prompt = f"""Transform the following JSON into the target schema.
-
-### Input JSON
+    _groq()  # ValueError when no API key is configured
 
-{json.dumps(input_data, ensure_ascii=False, indent=2)}
+    request = _transform_request(input_data)
+    try:
+        print("📤 Sending request to Groq API...")
+        content = _complete(request, use_cache)
+        print("📥 Received response from Groq API")
+        return _parse_transform_result(content.strip())
+    except ValueError as e:
+        # Re-raise ValueError for API key issues (and unrecoverable JSON output)
+        print(f"❌ Configuration error: {e}")
+        raise
+    except Exception as e:
+        raise _transform_error(e)
 
 
-Make sure that the output ends **immediately** after the last valid closing bracket.
-If you produce an empty node or any content after the valid JSON tree, delete it before returning.
+@metrics.track_llm
+async def transform_discussion_json_async(input_data: List[Dict[str, Any]], *, use_cache: bool = True) -> Dict[str, Any]:
+    """Async variant of transform_discussion_json (non-blocking, concurrency-limited)."""
+    _groq()  # ValueError when no API key is configured
 
-### Output JSON"""
-    
+    request = _transform_request(input_data)
     try:
         print("📤 Sending request to Groq API...")
-        completion = client.chat.completions.create(
-            model="meta-llama/llama-4-maverick-17b-128e-instruct",
-            messages=[
-                {
-                    "role": "system",
-                    "content": SYSTEM_PROMPT
-                },
-                {
-                    "role": "user",
-                    "content": user_prompt
-                }
-            ],
-            temperature=0,
-            max_completion_tokens=8192,
-            top_p=0.7,
-            stream=False,
-            stop=None,
-            seed=42
-        )
-        
+        content = await _complete_async(request, use_cache)
         print("📥 Received response from Groq API")
-        result = completion.choices[0].message.content.strip()
-        
-        # Extract JSON from the response
-        json_text = extract_json_from_text(result)
-        
-        # Try to parse the JSON
-        try:
-            json_output = json.loads(json_text)
-            print("✅ Successfully parsed JSON from LLM")
-            return json_output
-        except json.JSONDecodeError as e:
-            print(f"⚠️  JSON parsing failed: {e}")
-            print(f"   Attempting to fix incomplete JSON...")
-            
-            # Try to salvage partial JSON
-            fixed_json = fix_incomplete_json(json_text)
-            json_output = json.loads(fixed_json)
-            print("✅ Recovered by fixing incomplete JSON")
-            return json_output
-            
+        return _parse_transform_result(content.strip())
     except ValueError as e:
-        # Re-raise ValueError for API key issues
         print(f"❌ Configuration error: {e}")
         raise
-    except json.JSONDecodeError as e:
-        print(f"❌ JSON parsing failed: {e}")
-        print(f"   Raw LLM output: {result[:500] if 'result' in locals() else 'N/A'}")
-        raise Exception(f"Could not parse LLM output as JSON: {e}")
     except Exception as e:
-        error_msg = str(e)
-        print(f"❌ LLM call failed: {error_msg}")
-        
-        # Provide more specific error messages
-        if "authentication" in error_msg.lower() or "api key" in error_msg.lower():
-            raise Exception("Authentication failed. Please check your GROQ_API_KEY in the .env file.")
-        elif "rate limit" in error_msg.lower():
-            raise Exception("Rate limit exceeded. Please try again later.")
-        elif "connection" in error_msg.lower() or "network" in error_msg.lower():
-            raise Exception("Network error. Please check your internet connection.")
-        else:
-            raise Exception(f"LLM API error: {error_msg}")
+        raise _transform_error(e)
 
 
 # System prompt used to generate a concise user biography based on an existing
@@ -311,7 +489,44 @@ Create a concise, natural, and vivid user biography paragraph that authentically
 """
 
 
-def generate_user_bio(existing_bio: str, chat_messages: List[str], *, model: str = "meta-llama/llama-4-maverick-17b-128e-instruct", temperature: float = 1.2, max_completion_tokens: int = 2048) -> str:
+def _bio_request(existing_bio: str, chat_messages: List[str], *, model: str, temperature: float, max_completion_tokens: int) -> Dict[str, Any]:
+    """Build the chat completion arguments for generate_user_bio."""
+    # Build the user message according to the input format described in the prompt
+    try:
+        messages_json = json_codec.dumps_text(chat_messages, indent=True)
+    except Exception:
+        # fallback: coerce into simple list representation
+        messages_json = '[' + ', '.join('"%s"' % str(m).replace('"', '\\"') for m in chat_messages) + ']' 
+
+    user_input = f"# Input\n1. {existing_bio}\n2.{messages_json}\n\n# Output"
+    print("User input", user_input)
+
+    return dict(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_BIO_PROMPT},
+            {"role": "user", "content": user_input}
+        ],
+        temperature=temperature,
+        max_completion_tokens=max_completion_tokens,
+        top_p=0.9,
+        stream=False,
+        stop=None,
+        seed=42
+    )
+
+
+def _raise_bio_error(e: Exception) -> None:
+    err = str(e)
+    print(f"❌ generate_user_bio failed: {err}", file=sys.stderr)
+    mapped = _upstream_error(err, e)
+    if mapped is not None:
+        raise mapped
+    raise e
+
+
+@metrics.track_llm
+def generate_user_bio(existing_bio: str, chat_messages: List[str], *, model: str = "meta-llama/llama-4-maverick-17b-128e-instruct", temperature: float = 1.2, max_completion_tokens: int = 2048, use_cache: bool = True) -> str:
     """
     Generate a concise third-person user biography paragraph from an existing
     biography and a list of chat messages.
@@ -320,49 +535,33 @@ def generate_user_bio(existing_bio: str, chat_messages: List[str], *, model: str
     configuration or Exception for API/LLM errors.
     """
     # verify client
-    if not client:
-        raise ValueError("Groq client not initialized. Check GROQ_API_KEY in the environment.")
+    _groq()  # ValueError when no API key is configured
 
-    # Build the user message according to the input format described in the prompt
+    request = _bio_request(existing_bio, chat_messages, model=model, temperature=temperature, max_completion_tokens=max_completion_tokens)
     try:
-        messages_json = json.dumps(chat_messages, ensure_ascii=False, indent=2)
-    except Exception:
-        # fallback: coerce into simple list representation
-        messages_json = '[' + ', '.join('"%s"' % str(m).replace('"', '\\"') for m in chat_messages) + ']' 
+        # Extract and return the text content
+        return _complete(request, use_cache).strip()
+    except Exception as e:
+        _raise_bio_error(e)
 
-    user_input = f"# Input\n1. {existing_bio}\n2.{messages_json}\n\n# Output"
-    print("User input", user_input)
 
-    try:
-        completion = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": SYSTEM_BIO_PROMPT},
-                {"role": "user", "content": user_input}
-            ],
-            temperature=temperature,
-            max_completion_tokens=max_completion_tokens,
-            top_p=0.9,
-            stream=False,
-            stop=None,
-            seed=42
-        )
+@metrics.track_llm
+def stream_user_bio_async(existing_bio: str, chat_messages: List[str], *, model: str = "meta-llama/llama-4-maverick-17b-128e-instruct", temperature: float = 1.2, max_completion_tokens: int = 2048, use_cache: bool = True) -> AsyncIterator[Tuple[str, str]]:
+    """Streaming variant of generate_user_bio: yields ("token", text) events, then ("done", bio)."""
+    request = _bio_request(existing_bio, chat_messages, model=model, temperature=temperature, max_completion_tokens=max_completion_tokens)
+    return _stream_events(request, use_cache, str.strip, _raise_bio_error)
 
-        # Extract and return the text content
-        out = completion.choices[0].message.content.strip()
-        return out
 
+@metrics.track_llm
+async def generate_user_bio_async(existing_bio: str, chat_messages: List[str], *, model: str = "meta-llama/llama-4-maverick-17b-128e-instruct", temperature: float = 1.2, max_completion_tokens: int = 2048, use_cache: bool = True) -> str:
+    """Async variant of generate_user_bio (non-blocking, concurrency-limited)."""
+    _groq()  # ValueError when no API key is configured
+
+    request = _bio_request(existing_bio, chat_messages, model=model, temperature=temperature, max_completion_tokens=max_completion_tokens)
+    try:
+        return (await _complete_async(request, use_cache)).strip()
     except Exception as e:
-        err = str(e)
-        print(f"❌ generate_user_bio failed: {err}", file=sys.stderr)
-        if "authentication" in err.lower() or "api key" in err.lower():
-            raise Exception("Authentication failed. Please check your GROQ_API_KEY in the .env file.")
-        elif "rate limit" in err.lower():
-            raise Exception("Rate limit exceeded. Please try again later.")
-        elif "connection" in err.lower() or "network" in err.lower():
-            raise Exception("Network error. Please check your internet connection.")
-        else:
-            raise
+        _raise_bio_error(e)
 
 
 REWRITE_MESSAGE_SYSTEM = """Refine a user’s draft message to fit smoothly and authentically into the ongoing conversation.
@@ -500,22 +699,8 @@ Deliver only the refined, ready-to-send message, incorporating interjections and
 """
 
 
-def generate_message_rewrite(message_obj: Dict[str, Any], speaker_profile: Dict[str, Any] = None, messages_in_chat: List[str] = None, *, temperament: str = None, style: str = None, length: str = None, model: str = "meta-llama/llama-4-maverick-17b-128e-instruct", temperature: float = 0.7, max_completion_tokens: int = 512) -> str:
-    """
-    Rewrite a single chat message using the LLM while preserving meaning.
-
-    Args:
-        message_obj: dict with keys like 'speaker', 'text', optionally 'addressees' and 'referenceId'.
-        tree_user_messages: optional list of other messages from the same speaker extracted from the tree.
-        messages_in_chat: optional list of all messages in the chat (strings) for wider context.
-
-    Returns:
-        The rewritten message as a string. Raises Exception on LLM/API errors.
-    """
-    if not client:
-        raise ValueError("Groq client not initialized. Check GROQ_API_KEY in the environment.")
-
-
+def _rewrite_request(message_obj: Dict[str, Any], speaker_profile: Dict[str, Any] = None, messages_in_chat: List[str] = None, *, temperament: str = None, style: str = None, length: str = None, model: str, temperature: float, max_completion_tokens: int) -> Dict[str, Any]:
+    """Build the chat completion arguments for generate_message_rewrite."""
     # Build contextual prompt
     context_parts = []
     if speaker_profile:
@@ -526,7 +711,7 @@ def generate_message_rewrite(message_obj: Dict[str, Any], speaker_profile: Dict[
             recent = messages_in_chat[-10:]
         except Exception:
             recent = messages_in_chat
-        context_parts.append("2. Conversation History:\n" + json.dumps(recent, ensure_ascii=False, indent=2))
+        context_parts.append("2. Conversation History:\n" + json_codec.dumps_text(recent, indent=True))
 
 
     # If the caller provided guidance for temperament/style/length, add it as a map of instructions
@@ -550,38 +735,123 @@ def generate_message_rewrite(message_obj: Dict[str, Any], speaker_profile: Dict[
     
     print("User prompt for message rewrite:", user_prompt)
 
+    return dict(
+        model=model,
+        messages=[
+            {"role": "system", "content": REWRITE_MESSAGE_SYSTEM},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=temperature,
+        max_completion_tokens=max_completion_tokens,
+        top_p=0.9,
+        stream=False,
+        stop=None,
+        seed=42,
+    )
+
+
+def _clean_rewrite(out: str) -> str:
+    out = out.strip()
+    # Attempt to extract a clean single-line/paragraph reply (strip surrounding quotes)
+    out = out.strip('"\n ')
+    print("Rewritten message:", out)
+    return out
+
+
+def _raise_rewrite_error(e: Exception) -> None:
+    err = str(e)
+    print(f"❌ generate_message_rewrite failed: {err}", file=sys.stderr)
+    mapped = _upstream_error(err, e)
+    if mapped is not None:
+        raise mapped
+    raise e
+
+
+@metrics.track_llm
+def generate_message_rewrite(message_obj: Dict[str, Any], speaker_profile: Dict[str, Any] = None, messages_in_chat: List[str] = None, *, temperament: str = None, style: str = None, length: str = None, model: str = "meta-llama/llama-4-maverick-17b-128e-instruct", temperature: float = 0.7, max_completion_tokens: int = 512, use_cache: bool = True) -> str:
+    """
+    Rewrite a single chat message using the LLM while preserving meaning.
+
+    Args:
+        message_obj: dict with keys like 'speaker', 'text', optionally 'addressees' and 'referenceId'.
+        tree_user_messages: optional list of other messages from the same speaker extracted from the tree.
+        messages_in_chat: optional list of all messages in the chat (strings) for wider context.
+        use_cache: set to False to bypass the LLM response cache.
+
+    Returns:
+        The rewritten message as a string. Raises Exception on LLM/API errors.
+    """
+    _groq()  # ValueError when no API key is configured
+
+    request = _rewrite_request(message_obj, speaker_profile, messages_in_chat, temperament=temperament, style=style, length=length, model=model, temperature=temperature, max_completion_tokens=max_completion_tokens)
     try:
-        completion = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": REWRITE_MESSAGE_SYSTEM},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=temperature,
-            max_completion_tokens=max_completion_tokens,
-            top_p=0.9,
-            stream=False,
-            stop=None,
-            seed=42,
-        )
-
-        out = completion.choices[0].message.content.strip()
-        # Attempt to extract a clean single-line/paragraph reply (strip surrounding quotes)
-        out = out.strip('"\n ')
-        print("Rewritten message:", out)
-        return out
+        return _clean_rewrite(_complete(request, use_cache))
+    except Exception as e:
+        _raise_rewrite_error(e)
+
 
+@metrics.track_llm
+async def generate_message_rewrite_async(message_obj: Dict[str, Any], speaker_profile: Dict[str, Any] = None, messages_in_chat: List[str] = None, *, temperament: str = None, style: str = None, length: str = None, model: str = "meta-llama/llama-4-maverick-17b-128e-instruct", temperature: float = 0.7, max_completion_tokens: int = 512, use_cache: bool = True) -> str:
+    """Async variant of generate_message_rewrite (non-blocking, concurrency-limited)."""
+    _groq()  # ValueError when no API key is configured
+
+    request = _rewrite_request(message_obj, speaker_profile, messages_in_chat, temperament=temperament, style=style, length=length, model=model, temperature=temperature, max_completion_tokens=max_completion_tokens)
+    try:
+        return _clean_rewrite(await _complete_async(request, use_cache))
     except Exception as e:
-        err = str(e)
-        print(f"❌ generate_message_rewrite failed: {err}", file=sys.stderr)
-        if "authentication" in err.lower() or "api key" in err.lower():
-            raise Exception("Authentication failed. Please check your GROQ_API_KEY in the .env file.")
-        elif "rate limit" in err.lower():
-            raise Exception("Rate limit exceeded. Please try again later.")
-        elif "connection" in err.lower() or "network" in err.lower():
-            raise Exception("Network error. Please check your internet connection.")
-        else:
-            raise
+        _raise_rewrite_error(e)
+
 
+@metrics.track_llm
+def stream_message_rewrite_async(message_obj: Dict[str, Any], speaker_profile: Dict[str, Any] = None, messages_in_chat: List[str] = None, *, temperament: str = None, style: str = None, length: str = None, model: str = "meta-llama/llama-4-maverick-17b-128e-instruct", temperature: float = 0.7, max_completion_tokens: int = 512, use_cache: bool = True) -> AsyncIterator[Tuple[str, str]]:
+    """Streaming variant of generate_message_rewrite: yields ("token", text) events, then ("done", rewritten)."""
+    request = _rewrite_request(message_obj, speaker_profile, messages_in_chat, temperament=temperament, style=style, length=length, model=model, temperature=temperature, max_completion_tokens=max_completion_tokens)
+    return _stream_events(request, use_cache, _clean_rewrite, _raise_rewrite_error)
 
 
+@metrics.track_llm
+async def generate_message_rewrites_async(jobs: List[Dict[str, Any]], *, max_concurrency: Optional[int] = None, max_retries: int = 4, use_cache: bool = True) -> List[Dict[str, Any]]:
+    """
+    Rewrite many messages concurrently.
+
+    Each job is a dict of generate_message_rewrite_async arguments (message_obj,
+    speaker_profile, messages_in_chat, temperament, style, length). At most
+    `max_concurrency` jobs run at once (never more than LLM_MAX_CONCURRENCY).
+    When Groq answers with a rate limit the whole batch pauses for the
+    Retry-After delay (or an exponential backoff) and the job is retried up to
+    `max_retries` times.
+
+    Returns one result per job, in order:
+    { status: 'ok', rewritten, attempts } or { status: 'error', error, attempts }.
+    """
+    limit = max(1, min(max_concurrency or LLM_MAX_CONCURRENCY, LLM_MAX_CONCURRENCY))
+    gate = asyncio.Semaphore(limit)
+    loop = asyncio.get_running_loop()
+    resume_at = 0.0
+
+    async def run(job: Dict[str, Any]) -> Dict[str, Any]:
+        nonlocal resume_at
+        options = dict(job)
+        message_obj = options.pop("message_obj")
+        attempts = 0
+        async with gate:
+            while True:
+                delay = resume_at - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                attempts += 1
+                try:
+                    rewritten = await generate_message_rewrite_async(message_obj, use_cache=use_cache, **options)
+                    return {"status": "ok", "rewritten": rewritten, "attempts": attempts}
+                except LLMRateLimitError as e:
+                    if attempts > max_retries:
+                        return {"status": "error", "error": str(e), "attempts": attempts}
+                    wait = e.retry_after if e.retry_after is not None else min(30.0, 2 ** attempts)
+                    wait += random.uniform(0, 0.5)
+                    print(f"⏳ Rate limited, retrying in {wait:.1f}s (attempt {attempts})", file=sys.stderr)
+                    metrics.LLM_RETRIES.inc("generate_message_rewrites_async")
+                    resume_at = max(resume_at, loop.time() + wait)
+                except Exception as e:
+                    return {"status": "error", "error": str(e), "attempts": attempts}
+
+    return await asyncio.gather(*(run(job) for job in jobs))
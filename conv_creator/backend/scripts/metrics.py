@@ -0,0 +1,300 @@
+"""
+In-process metrics, exposed in the Prometheus text format by GET /metrics.
+
+A deliberately small registry (no prometheus_client dependency, nothing to run
+next to the app): labelled counters and histograms, plus collectors reading
+the counters the caches already keep. Recording a value is a dict update under
+a lock, cheap enough to do for every SQLite statement.
+
+What is recorded:
+
+  - http_*         latency, request and response sizes per method and route
+                   template (MetricsMiddleware)
+  - sqlite_*       statements and their duration per database and statement
+                   kind (SQLitePool(observe=sqlite_observer(...))); for a SELECT
+                   this is the time to the first row
+  - file_parse_*   JSON files parsed by json_codec.load_file
+  - llm_*          per function of scripts/llm_calls (track_llm): latency,
+                   time to first event of streams, outcomes, rate-limit retries
+  - cache_*        entries, hits, misses and hit ratio of the caches registered
+                   with register_cache
+
+METRICS=0 turns recording off; the cache figures are still reported.
+"""
+
+import bisect
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger('uvicorn.error')
+
+ENABLED = os.getenv('METRICS', '1').lower() not in ('0', 'false', 'no')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+# (metric name, type, help, [(label pairs, value)])
+Family = Tuple[str, str, str, List[Tuple[Sequence[Tuple[str, str]], float]]]
+
+_registry: List[Any] = []
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> Iterable[Family]:
+        with self._lock:
+            items = list(self._values.items())
+        yield self.name, 'counter', self.help, [(tuple(zip(self.labels, key)), value) for key, value in items]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> per-bucket counts (not cumulative), then sum and count
+        self._values: Dict[tuple, List[float]] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def collect(self) -> Iterable[Family]:
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        samples = []
+        for key, counts in items:
+            pairs = tuple(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((pairs + (('le', _format_value(bound)),), cumulative))
+            samples.append((pairs + (('le', '+Inf'),), counts[-1]))
+        yield self.name, 'histogram', self.help, samples
+        # _sum and _count belong to the same family; they are emitted without HELP/TYPE lines
+        yield self.name + '_sum', '', '', [(tuple(zip(self.labels, key)), counts[-2]) for key, counts in items]
+        yield self.name + '_count', '', '', [(tuple(zip(self.labels, key)), counts[-1]) for key, counts in items]
+
+
+class _CacheCollector:
+    """Gauges/counters of the caches registered with register_cache, read at scrape time."""
+
+    def __init__(self) -> None:
+        self.caches: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        _registry.append(self)
+
+    def collect(self) -> Iterable[Family]:
+        stats = {}
+        for name, fn in list(self.caches.items()):
+            try:
+                stats[name] = fn()
+            except Exception as e:
+                logger.warning(f"metrics: stats of cache {name} failed: {e}")
+        rows = {key: [] for key in ('entries', 'bytes', 'hits', 'misses', 'evictions', 'hit_ratio')}
+        for name, s in stats.items():
+            labels = (('cache', name),)
+            lookups = s.get('hits', 0) + s.get('misses', 0)
+            s = {**s, 'bytes': s.get('bytes', s.get('estimated_bytes')), 'hit_ratio': s['hits'] / lookups if lookups else 0.0}
+            for key, samples in rows.items():
+                if s.get(key) is not None:
+                    samples.append((labels, s[key]))
+        yield 'cache_entries', 'gauge', 'Entries held by the cache.', rows['entries']
+        yield 'cache_bytes', 'gauge', 'Size of the cached data (estimated for parsed documents).', rows['bytes']
+        yield 'cache_hits_total', 'counter', 'Lookups answered by the cache.', rows['hits']
+        yield 'cache_misses_total', 'counter', 'Lookups not answered by the cache.', rows['misses']
+        yield 'cache_evictions_total', 'counter', 'Entries evicted to stay within the size limit.', rows['evictions']
+        yield 'cache_hit_ratio', 'gauge', 'hits / (hits + misses) since startup.', rows['hit_ratio']
+
+
+_caches = _CacheCollector()
+
+
+def register_cache(name: str, stats: Callable[[], Dict[str, Any]]) -> None:
+    """Report a cache whose `stats()` returns hits/misses (and optionally entries, bytes, evictions)."""
+    _caches.caches[name] = stats
+
+
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by route template and status.', ('method', 'route', 'status'))
+HTTP_DURATION = Histogram('http_request_duration_seconds', 'Time until the last byte of the response was sent.', ('method', 'route'))
+HTTP_REQUEST_SIZE = Histogram('http_request_size_bytes', 'Size of request bodies.', ('method', 'route'), SIZE_BUCKETS)
+HTTP_RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Size of response bodies (after compression).', ('method', 'route'), SIZE_BUCKETS)
+
+SQLITE_STATEMENTS = Counter('sqlite_statements_total', 'SQL statements executed.', ('db', 'kind'))
+SQLITE_DURATION = Histogram('sqlite_statement_duration_seconds', 'Time spent executing SQL statements.', ('db', 'kind'))
+
+FILE_PARSE_DURATION = Histogram('file_parse_duration_seconds', 'Time spent parsing JSON files.')
+FILE_PARSE_BYTES = Counter('file_parse_bytes_total', 'Bytes of JSON files parsed.')
+
+LLM_CALLS = Counter('llm_calls_total', 'Calls of llm_calls functions by outcome (ok, rate_limited, error, cancelled).', ('function', 'outcome'))
+LLM_DURATION = Histogram('llm_call_duration_seconds', 'Duration of llm_calls functions (cache hits included).', ('function',))
+LLM_TTFT = Histogram('llm_time_to_first_event_seconds', 'Time until a streaming llm_calls function produced its first event.', ('function',))
+LLM_RETRIES = Counter('llm_rate_limit_retries_total', 'Calls retried after a rate limit.', ('function',))
+
+
+def sqlite_observer(db: str) -> Callable[[str, float], None]:
+    """Return an `observe(kind, seconds)` hook for SQLitePool recording under `db`."""
+    def observe(kind: str, seconds: float) -> None:
+        SQLITE_STATEMENTS.inc(db, kind)
+        SQLITE_DURATION.observe(seconds, db, kind)
+    return observe
+
+
+def _outcome(exc: Optional[BaseException]) -> str:
+    if exc is None:
+        return 'ok'
+    if not isinstance(exc, Exception):
+        return 'cancelled'
+    return 'rate_limited' if 'RateLimit' in type(exc).__name__ else 'error'
+
+
+def _llm_done(function: str, started: float, exc: Optional[BaseException]) -> None:
+    LLM_DURATION.observe(time.perf_counter() - started, function)
+    LLM_CALLS.inc(function, _outcome(exc))
+
+
+async def _track_events(function: str, started: float, events):
+    first = True
+    try:
+        async for event in events:
+            if first:
+                LLM_TTFT.observe(time.perf_counter() - started, function)
+                first = False
+            yield event
+    except BaseException as e:
+        _llm_done(function, started, e)
+        raise
+    _llm_done(function, started, None)
+
+
+def track_llm(fn: Callable) -> Callable:
+    """Record latency and outcome of an LLM function: sync, async, or returning an async iterator."""
+    name = fn.__name__
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException as e:
+                _llm_done(name, started, e)
+                raise
+            _llm_done(name, started, None)
+            return result
+        return wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            _llm_done(name, started, e)
+            raise
+        if hasattr(result, '__aiter__'):
+            return _track_events(name, started, result)
+        _llm_done(name, started, None)
+        return result
+    return wrapper
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the http_* metrics.
+
+    Requests are labelled with the route template ('/api/files/id/{file_id}'),
+    or 'unmatched', so the number of series stays bounded.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http' or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        received = 0
+        sent = 0
+
+        async def receive_counted():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+            return message
+
+        async def send_counted(message) -> None:
+            nonlocal status, sent
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                sent += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            method = scope['method']
+            HTTP_DURATION.observe(time.perf_counter() - started, method, route)
+            HTTP_REQUESTS.inc(method, route, str(status))
+            HTTP_REQUEST_SIZE.observe(received, method, route)
+            HTTP_RESPONSE_SIZE.observe(sent, method, route)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in list(_registry):
+        for name, kind, help, samples in metric.collect():
+            if kind:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{_escape(str(v))}"' for k, v in labels)
+                lines.append(f'{name}{{{label_text}}} {_format_value(value)}' if label_text else f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
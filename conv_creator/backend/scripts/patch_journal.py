@@ -0,0 +1,405 @@
+"""
+Append-only journal of JSON Patch edits, compacted into the main file.
+
+Saving a small edit of a discussion or draft used to rewrite the whole file.
+With `PatchJournal.apply` the patch is applied to the parsed document kept in
+memory and only the patch itself is appended to a hidden sidecar journal
+(`.<name>.patchlog` next to the file, one JSON line per patch after a header
+recording the size/mtime of the main file it applies to).
+
+The journal is compacted (the current document written to the main file
+through the `compact` callback, then the journal removed) when any of these
+happens:
+
+  - JSON_PATCH_COMPACT_OPS patches were appended (default 100);
+  - the journal grew past JSON_PATCH_COMPACT_RATIO times the size of the main
+    file (default 0.5): replaying it would cost more than a rewrite;
+  - no patch arrived for JSON_PATCH_COMPACT_DELAY seconds (default 5);
+  - `flush` is called, which the backend does before anything reads the file
+    from disk (downloads, tree index, moves...).
+
+Every document has a version "<size>-<mtime_ns>.<n>" (hex size/mtime of the
+main file, number of patches applied on top of it). Patches may carry the
+version they were made against; a mismatch raises VersionConflict. The last
+version before a compaction stays valid for the compacted file, so a client
+does not get a conflict just because the journal was folded in.
+
+Idle compactions run on one background thread ("patch-journal-compaction"),
+which keeps a deadline per file.
+
+The journal on disk is the source of truth; the in-memory document is a cache
+of it, checked against the size of the journal and the size/mtime of the main
+file before every use and replayed when another process (another uvicorn
+worker) appended to, compacted or dropped the journal. Every operation on a
+file holds a lock on it: a thread lock, plus, when `lock_path` is given, a
+POSIX byte-range lock on one byte of that shared file (at an offset derived
+from the path), so several workers can serve patches of the same file. The
+version continuity across compactions (above) is only known to the worker that
+compacted: a client of another worker may get one VersionConflict after a
+compaction. Without fcntl (Windows) only the thread locks apply: run a single
+worker there.
+
+Files with a journal are listed in the `patch_journals` table. Journals left
+behind by a crash are replayed on the next access (or by `recover` at startup,
+which only looks at the files listed there) if the main file still matches
+their header; otherwise they are renamed to `.rejected` and ignored.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None
+
+from scripts import json_codec
+from scripts.db import SQLitePool
+from scripts.doc_cache import documents
+from scripts.json_patch import apply_patch
+
+logger = logging.getLogger('uvicorn.error')
+
+COMPACT_OPS = int(os.getenv('JSON_PATCH_COMPACT_OPS', '100'))
+COMPACT_RATIO = float(os.getenv('JSON_PATCH_COMPACT_RATIO', '0.5'))
+COMPACT_DELAY = float(os.getenv('JSON_PATCH_COMPACT_DELAY', '5'))
+JOURNAL_SUFFIX = '.patchlog'
+
+
+class VersionConflict(Exception):
+    def __init__(self, current: str) -> None:
+        super().__init__(f"document changed, current version is {current}")
+        self.current = current
+
+
+def ensure_schema(conn) -> None:
+    """Create the table listing the files that have a journal, if missing."""
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS patch_journals (
+            path TEXT PRIMARY KEY,
+            created_at REAL NOT NULL
+        )
+        '''
+    )
+
+
+def journal_path(path: str) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'.{name}{JOURNAL_SUFFIX}')
+
+
+def _base(st: os.stat_result) -> str:
+    return f'{st.st_size:x}-{st.st_mtime_ns:x}'
+
+
+class _Pending:
+    """In-memory state of a file with uncompacted patches."""
+
+    def __init__(self, doc: Any, st: os.stat_result) -> None:
+        self.doc = doc
+        self.base = _base(st)
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.seq = 0
+        self.journal_bytes = 0
+
+    @property
+    def version(self) -> str:
+        return f'{self.base}.{self.seq}'
+
+
+class PatchJournal:
+    """Per-file patch journals with in-memory documents and background compaction."""
+
+    def __init__(self, compact: Callable[[str, Any], None], db: SQLitePool, *, lock_path: Optional[str] = None,
+                 max_ops: int = COMPACT_OPS, max_ratio: float = COMPACT_RATIO, delay: float = COMPACT_DELAY) -> None:
+        self.compact = compact
+        self.max_ops = max_ops
+        self.max_ratio = max_ratio
+        self.delay = delay
+        self.lock_path = lock_path
+        self._db = db
+        self._pending: Dict[str, _Pending] = {}
+        # real path -> (last version before compaction, version right after it)
+        self._compacted: Dict[str, Tuple[str, str]] = {}
+        self._locks: Dict[str, threading.RLock] = {}
+        # real path -> nesting depth of _locked in the thread holding the file's lock
+        self._depth: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._lock_fd: Optional[int] = None
+        # idle compactions: real path -> (monotonic deadline, state it was scheduled for)
+        self._deadlines: Dict[str, Tuple[float, _Pending]] = {}
+        self._idle = threading.Condition(threading.Lock())
+        self._worker: Optional[threading.Thread] = None
+        self.patches = 0
+        self.compactions = 0
+        self.conflicts = 0
+
+    def _file_lock(self, key: str) -> threading.RLock:
+        with self._lock:
+            return self._locks.setdefault(key, threading.RLock())
+
+    def _shared_lock_fd(self) -> Optional[int]:
+        if self.lock_path is None or fcntl is None:
+            return None
+        with self._lock:
+            if self._lock_fd is None:
+                # kept open: closing any descriptor of the file would release this process' locks on it
+                self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            return self._lock_fd
+
+    @contextmanager
+    def _locked(self, key: str) -> Iterator[None]:
+        """Hold the lock of one file, against other threads and other processes."""
+        with self._file_lock(key):
+            depth = self._depth.get(key, 0)
+            fd = self._shared_lock_fd() if depth == 0 else None
+            offset = int.from_bytes(hashlib.sha1(key.encode('utf-8')).digest()[:7], 'big')
+            if fd is not None:
+                fcntl.lockf(fd, fcntl.LOCK_EX, 1, offset)
+            self._depth[key] = depth + 1
+            try:
+                yield
+            finally:
+                if depth:
+                    self._depth[key] = depth
+                else:
+                    del self._depth[key]
+                    if fd is not None:
+                        fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+
+    def _open(self, key: str) -> Optional[_Pending]:
+        """Return the pending state of `key` as it is on disk (lock held).
+
+        The in-memory state is used as long as the journal and the main file are
+        the ones it was built from; otherwise (another process appended,
+        compacted or dropped the journal, or a crash left one) it is replayed.
+        """
+        state = self._pending.get(key)
+        try:
+            journal_bytes = os.path.getsize(journal_path(key))
+        except FileNotFoundError:
+            if state is not None:
+                self._pending.pop(key, None)
+                self._unschedule(key)
+            return None
+        if state is not None and state.journal_bytes == journal_bytes:
+            st = os.stat(key)
+            if st.st_size == state.size and st.st_mtime_ns == state.mtime_ns:
+                return state
+        state = self._replay(key)
+        if state is not None:
+            self._pending[key] = state
+        else:
+            self._pending.pop(key, None)
+            self._unschedule(key)
+        return state
+
+    def _forget(self, key: str) -> None:
+        self._db.execute('DELETE FROM patch_journals WHERE path = ?', (key,))
+
+    def _replay(self, key: str) -> Optional[_Pending]:
+        jpath = journal_path(key)
+        try:
+            with open(jpath, 'r', encoding='utf-8') as fh:
+                lines = fh.read().splitlines()
+            st = os.stat(key)
+            header = json_codec.loads(lines[0]) if lines else {}
+            if header.get('base') != [st.st_size, st.st_mtime_ns]:
+                raise ValueError('the file changed since the journal was started')
+            state = _Pending(documents.load(key), st)
+            for line in lines[1:]:
+                try:
+                    entry = json_codec.loads(line)
+                except ValueError:
+                    break  # torn last line: the patch was never acknowledged
+                state.doc = apply_patch(state.doc, entry['patch'])
+                state.seq += 1
+            state.journal_bytes = os.path.getsize(jpath)
+            logger.info(f"patch journal: replayed {state.seq} patch(es) for {key}")
+            return state
+        except Exception as e:
+            logger.warning(f"patch journal: ignoring journal of {key}: {e}")
+            try:
+                os.replace(jpath, f'{jpath}.rejected')
+            except OSError:
+                pass
+            self._forget(key)
+            return None
+
+    def version(self, path: str) -> str:
+        key = os.path.realpath(path)
+        with self._locked(key):
+            state = self._open(key)
+            if state is not None:
+                return state.version
+            return f'{_base(os.stat(key))}.0'
+
+    def load(self, path: str) -> Any:
+        """Return the current document, including patches not compacted yet (read-only)."""
+        key = os.path.realpath(path)
+        with self._locked(key):
+            state = self._open(key)
+            return state.doc if state is not None else documents.load(key)
+
+    def apply(self, path: str, patch: List[dict], base_version: Optional[str] = None) -> str:
+        """Apply `patch` to the current document, journal it and return the new version.
+
+        Raises VersionConflict if `base_version` is given and is not current, and
+        the errors of scripts.json_patch if the patch does not apply (nothing is
+        recorded then).
+        """
+        key = os.path.realpath(path)
+        with self._locked(key):
+            state = self._open(key)
+            current = state.version if state is not None else f'{_base(os.stat(key))}.0'
+            if base_version is not None and base_version != current:
+                compacted = self._compacted.get(key)
+                if compacted is None or compacted != (base_version, current):
+                    self.conflicts += 1
+                    raise VersionConflict(current)
+            fresh = state is None
+            if fresh:
+                state = _Pending(documents.load(key), os.stat(key))
+            doc = apply_patch(state.doc, patch)
+            jpath = journal_path(key)
+            entry = json_codec.dumps({"seq": state.seq + 1, "patch": patch}) + b'\n'
+            if fresh:
+                created_at = time.time()
+                entry = json_codec.dumps({"base": [state.size, state.mtime_ns], "created_at": created_at}) + b'\n' + entry
+                # listed before the journal exists, so `recover` never misses one
+                self._db.execute('INSERT OR REPLACE INTO patch_journals(path, created_at) VALUES (?, ?)', (key, created_at))
+            with open(jpath, 'wb' if fresh else 'ab') as fh:
+                fh.write(entry)
+            state.journal_bytes += len(entry)
+            state.doc = doc
+            state.seq += 1
+            self._pending[key] = state
+            self._compacted.pop(key, None)
+            self.patches += 1
+            if state.seq >= self.max_ops or state.journal_bytes > state.size * self.max_ratio:
+                self._compact(key, state)
+                return self._compacted[key][1]
+            self._schedule(key, state)
+            return state.version
+
+    def _schedule(self, key: str, state: _Pending) -> None:
+        """(Re)arm the idle compaction of `key`, `delay` seconds from now."""
+        with self._idle:
+            self._deadlines[key] = (time.monotonic() + self.delay, state)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run_compactions, name='patch-journal-compaction', daemon=True)
+                self._worker.start()
+            self._idle.notify()
+
+    def _unschedule(self, key: str) -> None:
+        with self._idle:
+            self._deadlines.pop(key, None)
+
+    def _run_compactions(self) -> None:
+        """Body of the compaction thread: compact files whose deadline passed."""
+        while True:
+            with self._idle:
+                while True:
+                    now = time.monotonic()
+                    due = [(key, state) for key, (deadline, state) in self._deadlines.items() if deadline <= now]
+                    if due:
+                        for key, _ in due:
+                            del self._deadlines[key]
+                        break
+                    next_deadline = min((deadline for deadline, _ in self._deadlines.values()), default=None)
+                    self._idle.wait(None if next_deadline is None else next_deadline - now)
+            for key, state in due:
+                self._compact_if_idle(key, state)
+
+    def _compact_if_idle(self, key: str, state: _Pending) -> None:
+        try:
+            with self._locked(key):
+                # a newer patch (of this or another process) re-armed or replaced the state
+                if self._open(key) is state and key not in self._deadlines:
+                    self._compact(key, state)
+        except Exception as e:
+            logger.error(f"patch journal: compaction of {key} failed: {e}")
+
+    def _compact(self, key: str, state: _Pending) -> None:
+        """Write the current document to the main file and drop the journal (lock held)."""
+        self._unschedule(key)
+        self.compact(key, state.doc)
+        documents.store(key, state.doc)
+        self._pending.pop(key, None)
+        try:
+            os.remove(journal_path(key))
+        except FileNotFoundError:
+            pass
+        self._forget(key)
+        self._compacted[key] = (state.version, f'{_base(os.stat(key))}.0')
+        self.compactions += 1
+
+    def flush(self, path: str) -> None:
+        """Compact pending patches of `path`, so the file on disk is current."""
+        key = os.path.realpath(path)
+        with self._locked(key):
+            state = self._open(key)
+            if state is not None:
+                self._compact(key, state)
+
+    def flush_all(self) -> None:
+        for key in list(self._pending):
+            try:
+                self.flush(key)
+            except Exception as e:
+                logger.error(f"patch journal: compaction of {key} failed: {e}")
+
+    def discard(self, path: str) -> None:
+        """Forget pending patches of `path` (the file is being replaced or deleted)."""
+        key = os.path.realpath(path)
+        with self._locked(key):
+            self._pending.pop(key, None)
+            self._unschedule(key)
+            self._compacted.pop(key, None)
+            try:
+                os.remove(journal_path(key))
+            except FileNotFoundError:
+                pass
+            self._forget(key)
+
+    def _listed(self, directory: str) -> List[str]:
+        """Files under `directory` with a journal, in any process."""
+        prefix = os.path.realpath(directory) + os.sep
+        rows = self._db.query_all('SELECT path FROM patch_journals WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))
+        return sorted({path for (path,) in rows} | {k for k in list(self._pending) if k.startswith(prefix)})
+
+    def discard_tree(self, directory: str) -> None:
+        for key in self._listed(directory):
+            self.discard(key)
+
+    def recover(self, root: str) -> int:
+        """Compact the journals of files under `root` left behind by a crash; returns how many.
+
+        Only the files listed in `patch_journals` are looked at, not the whole tree.
+        """
+        recovered = 0
+        for key in self._listed(root):
+            if not (os.path.exists(key) and os.path.exists(journal_path(key))):
+                with self._locked(key):
+                    if not os.path.exists(journal_path(key)):
+                        self._forget(key)
+                continue
+            self.flush(key)
+            recovered += 1
+        return recovered
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_files": len(self._pending),
+            "pending_patches": sum(s.seq for s in list(self._pending.values())),
+            "patches": self.patches,
+            "compactions": self.compactions,
+            "conflicts": self.conflicts,
+        }
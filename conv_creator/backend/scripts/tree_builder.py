@@ -0,0 +1,124 @@
+"""
+Deterministic conversion of flat discussion exports into the `{users, tree}` format.
+
+A flat export is a list of messages where each item names its parent:
+
+    [{"id": "1", "speaker": "Alice", "text": "...", "target_id": "0"},
+     {"id": "1.1", "speaker": "Bob", "text": "...", "target_id": "1"}, ...]
+
+`build_discussion_tree` links the items through a single id -> node map, so the
+conversion is O(n) and needs no LLM call. It returns None for inputs it does not
+recognise, in which case callers fall back to `transform_discussion_json`.
+
+Edge cases handled:
+  - orphans (parent id not in the list) and nodes stuck in reply cycles are
+    attached to the root
+  - several top-level messages are grouped under a synthetic root node
+  - numeric ids are converted to strings; children keep the input order
+"""
+
+from typing import Any, Dict, List, Optional
+
+# parent ids meaning "this message starts the conversation"
+ROOT_TARGET_IDS = ('0', '', 'None', 'null')
+PARENT_KEYS = ('target_id', 'parent_id', 'reply_to')
+# wrappers some exports put around the message list
+LIST_KEYS = ('messages', 'discussion', 'items', 'nodes')
+USER_DESCRIPTION = "This is a telegram user"
+
+
+def _as_id(value: Any) -> Optional[str]:
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _flat_items(data: Any) -> Optional[List[Dict[str, Any]]]:
+    if isinstance(data, dict):
+        lists = [data[k] for k in LIST_KEYS if isinstance(data.get(k), list)]
+        if len(lists) != 1 or 'tree' in data:
+            return None
+        data = lists[0]
+    if not isinstance(data, list) or not data:
+        return None
+    for item in data:
+        if not isinstance(item, dict):
+            return None
+        if not isinstance(item.get('text'), str) or not isinstance(item.get('speaker'), str):
+            return None
+        if _as_id(item.get('id')) is None:
+            return None
+    return data
+
+
+def _parent_of(item: Dict[str, Any]) -> Optional[str]:
+    for key in PARENT_KEYS:
+        if key in item:
+            value = item[key]
+            return None if value is None else _as_id(value)
+    return None
+
+
+def build_discussion_tree(data: Any) -> Optional[Dict[str, Any]]:
+    """Build `{users, tree}` from a flat message list, or return None if `data` is not one."""
+    items = _flat_items(data)
+    if items is None:
+        return None
+
+    nodes: Dict[str, Dict[str, Any]] = {}
+    order: List[str] = []
+    users: List[Dict[str, str]] = []
+    seen_speakers = set()
+    for item in items:
+        nid = _as_id(item['id'])
+        if nid in nodes:
+            # ambiguous structure: let the LLM sort it out
+            return None
+        nodes[nid] = {"id": nid, "speaker": item['speaker'], "text": item['text'], "children": []}
+        order.append(nid)
+        if item['speaker'] not in seen_speakers:
+            seen_speakers.add(item['speaker'])
+            users.append({"speaker": item['speaker'], "description": USER_DESCRIPTION})
+
+    roots: List[str] = []
+    detached: List[str] = []
+    parents: Dict[str, str] = {}
+    for item, nid in zip(items, order):
+        parent = _parent_of(item)
+        if parent is None or parent in ROOT_TARGET_IDS:
+            roots.append(nid)
+        elif parent in nodes and parent != nid:
+            parents[nid] = parent
+            nodes[parent]["children"].append(nodes[nid])
+        else:
+            detached.append(nid)
+
+    # nodes whose ancestry loops back on itself are never reached from a root
+    reached = set()
+
+    def mark(start: str) -> None:
+        stack = [start]
+        while stack:
+            nid = stack.pop()
+            reached.add(nid)
+            stack.extend(child["id"] for child in nodes[nid]["children"])
+
+    for nid in roots + detached:
+        mark(nid)
+    for nid in order:
+        if nid not in reached:
+            # break the cycle above this node and attach it like an orphan
+            siblings = nodes[parents[nid]]["children"]
+            siblings[:] = [c for c in siblings if c["id"] != nid]
+            detached.append(nid)
+            mark(nid)
+
+    if len(roots) == 1:
+        root = nodes[roots[0]]
+    else:
+        root_id = '0' if '0' not in nodes else '__root__'
+        root = {"id": root_id, "speaker": "", "text": "", "children": [nodes[r] for r in roots]}
+    root["children"].extend(nodes[nid] for nid in detached)
+    return {"users": users, "tree": root}
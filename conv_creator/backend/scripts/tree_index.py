@@ -0,0 +1,293 @@
+"""
+Per-file index of discussion tree nodes, stored in SQLite.
+
+For every node of a file's `tree` the index keeps its parent id, depth,
+pre-order position, number of descendants, speaker, child ids and the byte
+spans of the node object and of its `text` string in the file. With it a single
+node (or a node's ancestry) can be looked up with a few primary-key reads and
+one small file read instead of parsing the whole document.
+
+The index is built in one pass of the streaming tokenizer (scripts/json_stream)
+and is tagged with the file's size and mtime_ns; `ensure_index` rebuilds it
+whenever those no longer match the file on disk. Saves only drop the index
+(`invalidate`): it is rebuilt by the first lookup after the write, so a file
+that is edited but never browsed node by node is not tokenized again on every
+save. Rows are removed by a trigger when the file's row is deleted from the
+files table.
+
+Nodes are stored in pre-order, so the subtree of a node is the position range
+[position, position + descendants].
+"""
+
+import os
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from scripts import json_codec
+from scripts.db import SQLitePool
+from scripts.json_stream import JSONEventParser, JSONStreamError
+
+CHUNK_SIZE = 1 << 16
+
+NODE_COLUMNS = 'node_id, parent_id, depth, position, descendants, speaker, child_ids, start, end, text_start, text_end'
+
+# record slots used while building
+_ID, _PARENT, _DEPTH, _SPEAKER, _TEXT_START, _TEXT_END, _START, _END, _CHILDREN = range(9)
+
+
+def ensure_schema(conn) -> None:
+    """Create the index tables (and the cleanup trigger on files) if missing."""
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS tree_nodes (
+            file_id INTEGER NOT NULL,
+            node_id TEXT NOT NULL,
+            parent_id TEXT,
+            depth INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            descendants INTEGER NOT NULL,
+            speaker TEXT,
+            child_ids TEXT NOT NULL,
+            start INTEGER NOT NULL,
+            end INTEGER NOT NULL,
+            text_start INTEGER,
+            text_end INTEGER,
+            PRIMARY KEY (file_id, node_id)
+        ) WITHOUT ROWID
+        '''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tree_nodes_position ON tree_nodes(file_id, position)')
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS tree_index_meta (
+            file_id INTEGER PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            nodes INTEGER NOT NULL,
+            built_at REAL NOT NULL
+        )
+        '''
+    )
+    conn.execute(
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_files_drop_tree_index AFTER DELETE ON files
+        BEGIN
+            DELETE FROM tree_nodes WHERE file_id = OLD.id;
+            DELETE FROM tree_index_meta WHERE file_id = OLD.id;
+        END
+        '''
+    )
+
+
+def _node_id(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def scan_tree(fh) -> List[list]:
+    """Tokenize an open binary file and return its tree nodes as records, in pre-order.
+
+    Raises JSONStreamError if the file is not valid JSON. Returns an empty list
+    when the document has no object under a top-level `tree` key.
+    """
+    parser = JSONEventParser()
+    records: List[list] = []
+    # container stack entries: [role, current key, record index (nodes only)]
+    stack: List[list] = []
+
+    def handle(events) -> None:
+        for kind, value, start, end in events:
+            if kind == 'map_key':
+                stack[-1][1] = value
+                continue
+            if kind == 'end_map' or kind == 'end_array':
+                role, _, rec = stack.pop()
+                if role == 'node':
+                    records[rec][_END] = end
+                continue
+            parent = stack[-1] if stack else None
+            if parent is None:
+                role = 'top' if kind == 'start_map' else 'other'
+            elif parent[0] == 'top':
+                role = 'node' if (parent[1] == 'tree' and kind == 'start_map') else 'other'
+            elif parent[0] == 'node':
+                key = parent[1]
+                rec = records[parent[2]]
+                role = 'other'
+                if key == 'children' and kind == 'start_array':
+                    role = 'children'
+                elif key == 'id' and rec[_ID] is None and kind in ('string', 'number', 'boolean'):
+                    rec[_ID] = _node_id(value)
+                elif key == 'speaker' and kind == 'string':
+                    rec[_SPEAKER] = value
+                elif key == 'text' and kind == 'string':
+                    rec[_TEXT_START], rec[_TEXT_END] = start, end
+            elif parent[0] == 'children':
+                role = 'node' if kind == 'start_map' else 'other'
+            else:
+                role = 'other'
+            if kind != 'start_map' and kind != 'start_array':
+                continue
+            rec_index = None
+            if role == 'node':
+                parent_rec = None
+                depth = 0
+                if parent is not None and parent[0] == 'children':
+                    parent_rec = stack[-2][2]
+                    depth = records[parent_rec][_DEPTH] + 1
+                    records[parent_rec][_CHILDREN].append(len(records))
+                rec_index = len(records)
+                records.append([None, parent_rec, depth, None, None, None, start, None, []])
+            stack.append([role, None, rec_index])
+
+    while True:
+        chunk = fh.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        handle(parser.feed(chunk))
+    handle(parser.close())
+    return records
+
+
+def _rows(file_id: int, records: List[list]) -> List[tuple]:
+    # descendants per record: records are in pre-order, so accumulate bottom-up
+    descendants = [0] * len(records)
+    for i in range(len(records) - 1, -1, -1):
+        parent = records[i][_PARENT]
+        if parent is not None:
+            descendants[parent] += descendants[i] + 1
+    rows = []
+    for position, rec in enumerate(records):
+        if rec[_ID] is None:
+            continue
+        parent = rec[_PARENT]
+        child_ids = [records[c][_ID] for c in rec[_CHILDREN] if records[c][_ID] is not None]
+        rows.append((
+            file_id, rec[_ID], records[parent][_ID] if parent is not None else None, rec[_DEPTH],
+            position, descendants[position], rec[_SPEAKER], json.dumps(child_ids, ensure_ascii=False),
+            rec[_START], rec[_END], rec[_TEXT_START], rec[_TEXT_END],
+        ))
+    return rows
+
+
+def build_index(db: SQLitePool, file_id: int, path: str) -> int:
+    """(Re)build the index of one file and return the number of indexed nodes.
+
+    Files that cannot be parsed get an empty index, so they are not re-read on
+    every lookup until they change.
+    """
+    st = os.stat(path)
+    try:
+        with open(path, 'rb') as fh:
+            records = scan_tree(fh)
+    except (OSError, JSONStreamError):
+        records = []
+    rows = _rows(file_id, records)
+    with db.transaction() as conn:
+        conn.execute('DELETE FROM tree_nodes WHERE file_id = ?', (file_id,))
+        # duplicate ids: the first occurrence in document order wins
+        conn.executemany(f'INSERT OR IGNORE INTO tree_nodes(file_id, {NODE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        conn.execute(
+            'INSERT OR REPLACE INTO tree_index_meta(file_id, size, mtime_ns, nodes, built_at) VALUES (?, ?, ?, ?, ?)',
+            (file_id, st.st_size, st.st_mtime_ns, len(rows), time.time()),
+        )
+    return len(rows)
+
+
+def invalidate(db: SQLitePool, file_id: int) -> None:
+    """Drop the index of a file that was just written; the next lookup rebuilds it."""
+    with db.transaction() as conn:
+        conn.execute('DELETE FROM tree_nodes WHERE file_id = ?', (file_id,))
+        conn.execute('DELETE FROM tree_index_meta WHERE file_id = ?', (file_id,))
+
+
+def is_fresh(db: SQLitePool, file_id: int, st: os.stat_result) -> bool:
+    row = db.query_one('SELECT size, mtime_ns FROM tree_index_meta WHERE file_id = ?', (file_id,))
+    return row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns
+
+
+def ensure_index(db: SQLitePool, file_id: int, path: str) -> int:
+    """Make sure the file's index matches the file on disk; returns the node count."""
+    st = os.stat(path)
+    row = db.query_one('SELECT size, mtime_ns, nodes FROM tree_index_meta WHERE file_id = ?', (file_id,))
+    if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+        return row[2]
+    return build_index(db, file_id, path)
+
+
+def _node(row: tuple) -> Dict[str, Any]:
+    return {
+        "id": row[0], "parent_id": row[1], "depth": row[2], "position": row[3], "descendants": row[4],
+        "speaker": row[5], "child_ids": json.loads(row[6]), "start": row[7], "end": row[8],
+        "text_start": row[9], "text_end": row[10],
+    }
+
+
+def get_node(db: SQLitePool, file_id: int, node_id: str) -> Optional[Dict[str, Any]]:
+    row = db.query_one(f'SELECT {NODE_COLUMNS} FROM tree_nodes WHERE file_id = ? AND node_id = ?', (file_id, node_id))
+    return _node(row) if row else None
+
+
+def get_root(db: SQLitePool, file_id: int) -> Optional[Dict[str, Any]]:
+    row = db.query_one(f'SELECT {NODE_COLUMNS} FROM tree_nodes WHERE file_id = ? AND position = 0', (file_id,))
+    return _node(row) if row else None
+
+
+def get_ancestors(db: SQLitePool, file_id: int, node_id: str) -> List[Dict[str, Any]]:
+    """Return the nodes from the root down to `node_id` (inclusive); empty if unknown."""
+    path = []
+    node = get_node(db, file_id, node_id)
+    # depth bounds the walk even if duplicate ids made the parent links ambiguous
+    limit = node["depth"] + 1 if node else 0
+    while node is not None and len(path) < limit:
+        path.append(node)
+        if node["parent_id"] is None:
+            break
+        node = get_node(db, file_id, node["parent_id"])
+    path.reverse()
+    return path
+
+
+def get_subtree(db: SQLitePool, file_id: int, node: Dict[str, Any], depth: int) -> List[Dict[str, Any]]:
+    """Return `node` and its descendants at most `depth` levels below it, in pre-order."""
+    rows = db.query_all(
+        f'SELECT {NODE_COLUMNS} FROM tree_nodes WHERE file_id = ? AND position BETWEEN ? AND ? AND depth <= ? ORDER BY position',
+        (file_id, node["position"], node["position"] + node["descendants"], node["depth"] + depth),
+    )
+    return [_node(r) for r in rows]
+
+
+def get_first_descendants(db: SQLitePool, file_id: int, node: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Follow the first child from `node` down to a leaf; returns the nodes below `node`."""
+    out = []
+    limit = node["descendants"]
+    while node["child_ids"] and len(out) < limit:
+        node = get_node(db, file_id, node["child_ids"][0])
+        if node is None:
+            break
+        out.append(node)
+    return out
+
+
+def read_texts(path: str, nodes: List[Dict[str, Any]]) -> None:
+    """Set `text` on every node, reading the spans in file order through one handle."""
+    with open(path, 'rb') as fh:
+        for node in sorted(nodes, key=lambda n: n["text_start"] if n["text_start"] is not None else -1):
+            if node["text_start"] is None:
+                node["text"] = None
+                continue
+            fh.seek(node["text_start"])
+            node["text"] = json_codec.loads(fh.read(node["text_end"] - node["text_start"]))
+
+
+def read_span(path: str, start: int, end: int) -> Any:
+    """Read and decode the JSON value stored at bytes [start, end) of the file."""
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        return json_codec.loads(fh.read(end - start))
+
+
+def read_text(path: str, node: Dict[str, Any]) -> Optional[str]:
+    if node.get("text_start") is None:
+        return None
+    return read_span(path, node["text_start"], node["text_end"])
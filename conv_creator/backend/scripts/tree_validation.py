@@ -0,0 +1,157 @@
+"""
+Single-pass validator for discussion trees.
+
+One explicit-stack walk (no recursion, so deep reply chains cannot hit Python's
+recursion limit) performs every check the server and the scripts need:
+
+  - node shape: `schema='loose'` requires string id/speaker/text and a children
+    list (the server's rules), `schema='strict'` additionally rejects any other
+    key (scripts/check_structure.py), `schema=None` only requires an id and a
+    list-valued children when present (scripts/validate_discussion.py)
+  - non-empty text (`require_text`)
+  - target_id pointing at the parent node (`check_target_ids`)
+  - duplicate ids (`check_duplicates`)
+
+All state lives on a `TreeValidator` instance, so concurrent validations never
+share anything. Issues are returned as `Issue` tuples.
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional
+
+NODE_KEYS = ('id', 'speaker', 'text', 'children')
+
+
+class Issue(NamedTuple):
+    code: str
+    path: List[str]
+    node_id: Any = None
+    detail: Any = None
+
+
+class TreeValidator:
+    """Validate one or more trees, collecting issues across all of them."""
+
+    def __init__(
+        self,
+        schema: Optional[str] = 'loose',
+        *,
+        require_text: bool = False,
+        check_target_ids: bool = False,
+        check_duplicates: bool = True,
+        stop_on_first: bool = False,
+    ) -> None:
+        if schema not in (None, 'loose', 'strict'):
+            raise ValueError(f"unknown schema: {schema!r}")
+        self.schema = schema
+        self.require_text = require_text
+        self.check_target_ids = check_target_ids
+        self.check_duplicates = check_duplicates
+        self.stop_on_first = stop_on_first
+        self.issues: List[Issue] = []
+        # visited nodes as parallel arrays so paths can be rebuilt on demand
+        self._labels: List[str] = []
+        self._parents: List[int] = []
+        self._ids: Dict[str, List[int]] = {}
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_on_first and bool(self.issues)
+
+    def _path(self, index: int) -> List[str]:
+        out = []
+        while index >= 0:
+            out.append(self._labels[index])
+            index = self._parents[index]
+        out.reverse()
+        return out
+
+    def _add(self, code: str, index: int, node_id: Any = None, detail: Any = None) -> None:
+        self.issues.append(Issue(code, self._path(index), node_id, detail))
+
+    def visit(self, root: Any, label: str = '<root>') -> None:
+        """Walk the tree rooted at `root` in pre-order."""
+        if self.stopped:
+            return
+        labels, parents = self._labels, self._parents
+        labels.append(label)
+        parents.append(-1)
+        # stack entries: (node, index of parent in labels/parents, parent id, has parent node)
+        stack = [(root, len(labels) - 1, None, False)]
+        schema = self.schema
+        while stack:
+            node, parent_index, parent_id, has_parent = stack.pop()
+            is_obj = isinstance(node, dict)
+            labels.append(str(node.get('id')) if is_obj else '<non-node>')
+            parents.append(parent_index)
+            index = len(labels) - 1
+
+            if not is_obj:
+                self._add('not_an_object', index, None, type(node).__name__)
+                if self.stopped:
+                    return
+                continue
+
+            nid = node.get('id')
+            if nid is None:
+                self._add('missing_id', index, None, list(node.keys()))
+            elif self.check_duplicates:
+                self._ids.setdefault(str(nid), []).append(index)
+
+            if schema is not None:
+                for k in ('id', 'speaker', 'text'):
+                    if k not in node:
+                        if k != 'id':
+                            self._add('missing_key', index, nid, k)
+                    elif not isinstance(node[k], str):
+                        self._add('wrong_type', index, nid, k)
+                if 'children' not in node:
+                    self._add('missing_key', index, nid, 'children')
+                if schema == 'strict':
+                    for k in node:
+                        if k not in NODE_KEYS:
+                            self._add('unexpected_key', index, nid, k)
+
+            children = node.get('children', [])
+            if not isinstance(children, list):
+                self._add('children_not_array', index, nid, type(children).__name__)
+                children = []
+
+            if self.require_text and node.get('text') in (None, ''):
+                self._add('missing_text', index, nid)
+
+            # if there's a parent, target_id should point to it
+            if self.check_target_ids and has_parent:
+                if 'target_id' not in node:
+                    self._add('missing_target_id', index, nid)
+                elif str(node.get('target_id')) != str(parent_id):
+                    self._add('target_mismatch', index, nid, (parent_id, node.get('target_id')))
+
+            if self.stopped:
+                return
+            for child in reversed(children):
+                stack.append((child, index, nid, True))
+
+    def finish(self) -> List[Issue]:
+        """Run the cross-tree checks and return every issue found."""
+        if self.check_duplicates and not self.stopped:
+            for nid, indexes in self._ids.items():
+                if nid and len(indexes) > 1:
+                    paths = [self._path(i) for i in indexes]
+                    self.issues.append(Issue('duplicate_id', paths[0], nid, paths))
+                    if self.stop_on_first:
+                        break
+        return self.issues
+
+
+def validate_tree(root: Any, schema: Optional[str] = 'loose', **options: Any) -> List[Issue]:
+    """Validate a single tree and return its issues (empty when valid)."""
+    validator = TreeValidator(schema, **options)
+    validator.visit(root)
+    return validator.finish()
+
+
+def is_valid_tree(root: Any, schema: str = 'loose') -> bool:
+    """Fast yes/no node-shape check: stops at the first problem, ignores duplicate ids."""
+    if not isinstance(root, dict):
+        return False
+    return not validate_tree(root, schema, check_duplicates=False, stop_on_first=True)
@@ -24,6 +24,13 @@ import json
 import sys
 from pathlib import Path
 
+# Make the backend package importable when run as a standalone script
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from scripts.tree_validation import Issue, TreeValidator
+
 
 DEFAULT_PATH = Path(__file__).parent.parent / 'backend' / 'files_root' / 'bp_130_0_d3.json'
 
@@ -44,62 +51,19 @@ def is_node(obj):
     return isinstance(obj, dict)
 
 
-issues = []
-ids = {}
-
-
-def traverse(node, parent_id=None, path=None):
-    if path is None:
-        path = []
-    # use a readable placeholder for path items
-    node_id = node.get('id') if is_node(node) else '<non-node>'
-    node_path = path + [str(node_id)]
-
-    if not is_node(node):
-        issues.append(("not_an_object", node_path, type(node).__name__))
-        return
-
-    nid = node.get('id')
-    if nid is None:
-        issues.append(("missing_id", node_path, list(node.keys())))
-    else:
-        ids.setdefault(str(nid), []).append(node_path)
-
-    text = node.get('text')
-    if text in (None, ''):
-        issues.append(("missing_text", node_path, nid))
-
-    if 'children' in node and not isinstance(node['children'], list):
-        issues.append(("children_not_array", node_path, type(node['children']).__name__))
-
-    # if there's a parent, target_id should point to it (if present)
-    if parent_id is not None:
-        if 'target_id' not in node:
-            issues.append(("missing_target_id", node_path, nid))
-        else:
-            target = node.get('target_id')
-            if str(target) != str(parent_id):
-                issues.append(("target_mismatch", node_path, nid, parent_id, target))
-
-    for child in node.get('children', []):
-        traverse(child, nid, node_path)
-
-
 def validate(data):
+    """Validate a D3 discussion (a root node or a list of roots) and return its issues."""
+    validator = TreeValidator(schema=None, require_text=True, check_target_ids=True)
     # top-level should be a dict (a single root node)
     if isinstance(data, list):
         # allow a list of roots, but validate each
         for i, root in enumerate(data):
-            traverse(root, parent_id=None, path=[f'<root[{i}]>'])
+            validator.visit(root, label=f'<root[{i}]>')
     elif is_node(data):
-        traverse(data, parent_id=None, path=['<root>'])
+        validator.visit(data, label='<root>')
     else:
-        issues.append(("top_level_invalid", [str(type(data).__name__)], None))
-
-    # duplicate ids
-    for nid, paths in ids.items():
-        if nid and len(paths) > 1:
-            issues.append(("duplicate_id", nid, paths))
+        return [Issue("top_level_invalid", [str(type(data).__name__)])]
+    return validator.finish()
 
 
 def format_and_report(issues_list):
@@ -109,23 +73,24 @@ def format_and_report(issues_list):
 
     print(f"Found {len(issues_list)} issue(s):\n")
     for it in issues_list:
-        tag = it[0]
+        tag = it.code
+        path = ' > '.join(it.path)
         if tag == 'missing_id':
-            print(f"- Missing id at path: {' > '.join(it[1])} -- node keys: {it[2]}")
+            print(f"- Missing id at path: {path} -- node keys: {it.detail}")
         elif tag == 'missing_text':
-            print(f"- Missing text for node id: {it[2]} at path: {' > '.join(it[1])}")
+            print(f"- Missing text for node id: {it.node_id} at path: {path}")
         elif tag == 'children_not_array':
-            print(f"- children is not array at path {' > '.join(it[1])}: type={it[2]}")
+            print(f"- children is not array at path {path}: type={it.detail}")
         elif tag == 'missing_target_id':
-            print(f"- missing target_id for node id {it[2]} at path {' > '.join(it[1])}")
+            print(f"- missing target_id for node id {it.node_id} at path {path}")
         elif tag == 'target_mismatch':
-            print(f"- target_id mismatch for node id {it[2]} at path {' > '.join(it[1])}: parent_id={it[3]}, target_id={it[4]}")
+            print(f"- target_id mismatch for node id {it.node_id} at path {path}: parent_id={it.detail[0]}, target_id={it.detail[1]}")
         elif tag == 'duplicate_id':
-            print(f"- duplicate id '{it[1]}' found in {len(it[2])} locations:\n  " + "\n  ".join([' > '.join(p) for p in it[2]]))
+            print(f"- duplicate id '{it.node_id}' found in {len(it.detail)} locations:\n  " + "\n  ".join([' > '.join(p) for p in it.detail]))
         elif tag == 'not_an_object':
-            print(f"- Node at path {' > '.join(it[1])} is not an object: found {it[2]}")
+            print(f"- Node at path {path} is not an object: found {it.detail}")
         elif tag == 'top_level_invalid':
-            print(f"- Top-level JSON is not an object or array of objects: found {it[1][0]}")
+            print(f"- Top-level JSON is not an object or array of objects: found {it.path[0]}")
         else:
             print(f"- {it}")
 
@@ -137,7 +102,7 @@ def main(argv=None):
     path = Path(argv[0]) if argv else DEFAULT_PATH
 
     data = load_json(path)
-    validate(data)
+    issues = validate(data)
     code = format_and_report(issues)
     sys.exit(code)
 
@@ -0,0 +1,66 @@
+"""
+Shared fixtures.
+
+The app is imported once per session against a scratch data folder
+(BACKEND_DATA_DIR), so the tests never touch backend/files_root or
+backend/db.sqlite3, and never call Groq.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+DATA_DIR = tempfile.mkdtemp(prefix='conv_tests_')
+# read by main and scripts/ at import time
+os.environ['BACKEND_DATA_DIR'] = DATA_DIR
+os.environ['LLM_CACHE'] = '0'
+os.environ['LLM_CACHE_PATH'] = os.path.join(DATA_DIR, 'llm_cache.sqlite3')
+os.environ['FS_WATCHER'] = '0'
+os.environ['BLOB_STORE'] = '0'
+
+TREE = {
+    "id": "1", "speaker": "alice", "text": "root", "children": [
+        {"id": "2", "speaker": "bob", "text": "first reply", "children": [
+            {"id": "4", "speaker": "alice", "text": "nested \"quoted\" é", "children": []},
+        ]},
+        {"id": "3", "speaker": "carol", "text": "second reply", "children": []},
+    ],
+}
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def app_main():
+    import main
+    return main
+
+
+@pytest.fixture(scope='session')
+def client(app_main):
+    from fastapi.testclient import TestClient
+    with TestClient(app_main.app) as c:
+        yield c
+
+
+@pytest.fixture
+def discussion(app_main, client):
+    """A new discussion file registered in the DB; returns (file id, full path)."""
+    name = f'disc_{uuid.uuid4().hex[:8]}.json'
+    full = os.path.join(app_main.FILES_ROOT, name)
+    with open(full, 'w', encoding='utf-8') as fh:
+        json.dump({"users": [{"speaker": "alice"}], "tree": TREE}, fh, indent=2)
+    client.post('/api/migrate-files').raise_for_status()
+    row = app_main._db.query_one('SELECT id FROM files WHERE name = ?', (name,))
+    return row[0], full
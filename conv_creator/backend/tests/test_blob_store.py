@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from scripts import blob_store
+from scripts.blob_store import BlobStore
+from scripts.db import SQLitePool
+
+
+@pytest.fixture
+def store(tmp_path):
+    db = SQLitePool(str(tmp_path / 'db.sqlite3'), on_connect=blob_store.ensure_schema)
+    yield BlobStore(str(tmp_path / 'blobs'), db, hardlinks=True)
+    db.close_all()
+
+
+def _write(path, data):
+    with open(path, 'wb') as fh:
+        fh.write(data)
+
+
+def test_duplicates_share_a_blob(store, tmp_path):
+    a, b = str(tmp_path / 'a.json'), str(tmp_path / 'b.json')
+    _write(a, b'{"same": 1}')
+    _write(b, b'{"same": 1}')
+    assert store.track(a) == store.track(b)
+    assert store.stats()['blobs'] == 1 and store.stats()['references'] == 2
+
+
+def test_backup_is_never_a_hard_link(store, tmp_path):
+    live, backup = str(tmp_path / 'live.json'), str(tmp_path / 'live.json.backup')
+    _write(live, b'{"version": 1}')
+    store.copy(live, backup)
+    assert os.stat(backup).st_nlink == 1
+    assert not os.path.samefile(live, backup)
+    # an in-place write to the live file leaves the backup alone
+    with open(live, 'r+b') as fh:
+        fh.write(b'{"version": 2}')
+    with open(backup, 'rb') as fh:
+        assert fh.read() == b'{"version": 1}'
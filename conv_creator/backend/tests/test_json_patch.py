@@ -0,0 +1,62 @@
+import copy
+
+import pytest
+
+from scripts.json_patch import InvalidPatch, JsonPatchError, PatchTestFailed, apply_patch, parse_pointer
+
+DOC = {"users": [{"speaker": "alice"}], "tree": {"id": "1", "text": "root", "children": [{"id": "2", "children": []}]}}
+
+
+def test_apply_all_operations():
+    patch = [
+        {"op": "add", "path": "/users/-", "value": {"speaker": "bob"}},
+        {"op": "replace", "path": "/tree/text", "value": "edited"},
+        {"op": "copy", "from": "/tree/children/0", "path": "/tree/children/1"},
+        {"op": "replace", "path": "/tree/children/1/id", "value": "3"},
+        {"op": "move", "from": "/users/0", "path": "/users/1"},
+        {"op": "remove", "path": "/tree/children/0"},
+        {"op": "test", "path": "/tree/children/0/id", "value": "3"},
+    ]
+    result = apply_patch(DOC, patch)
+    assert result["users"] == [{"speaker": "bob"}, {"speaker": "alice"}]
+    assert result["tree"]["text"] == "edited"
+    assert result["tree"]["children"] == [{"id": "3", "children": []}]
+
+
+def test_input_is_not_mutated_and_untouched_parts_are_shared():
+    before = copy.deepcopy(DOC)
+    result = apply_patch(DOC, [{"op": "add", "path": "/users/0/role", "value": "host"}])
+    assert DOC == before
+    assert result["users"][0] == {"speaker": "alice", "role": "host"}
+    assert result["tree"] is DOC["tree"]
+
+
+def test_patch_is_atomic():
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOC, [
+            {"op": "replace", "path": "/tree/text", "value": "edited"},
+            {"op": "remove", "path": "/missing"},
+        ])
+    assert DOC["tree"]["text"] == "root"
+
+
+def test_pointer_escapes():
+    assert parse_pointer('/a~1b/c~0d') == ['a/b', 'c~d']
+    assert apply_patch({"a/b": 1}, [{"op": "replace", "path": "/a~1b", "value": 2}]) == {"a/b": 2}
+
+
+@pytest.mark.parametrize('patch, error', [
+    ({"op": "add"}, InvalidPatch),
+    ([{"op": "frobnicate", "path": "/x"}], InvalidPatch),
+    ([{"op": "add", "path": "/x"}], InvalidPatch),
+    ([{"op": "add", "path": "x", "value": 1}], InvalidPatch),
+    ([{"op": "test", "path": "/tree/id", "value": "2"}], PatchTestFailed),
+    ([{"op": "test", "path": "/users/0/speaker", "value": True}], PatchTestFailed),
+    ([{"op": "add", "path": "/users/5", "value": 1}], JsonPatchError),
+    ([{"op": "add", "path": "/users/01", "value": 1}], JsonPatchError),
+    ([{"op": "move", "from": "/tree", "path": "/tree/children/0"}], JsonPatchError),
+    ([{"op": "remove", "path": ""}], JsonPatchError),
+])
+def test_errors(patch, error):
+    with pytest.raises(error):
+        apply_patch(DOC, patch)
@@ -0,0 +1,102 @@
+import io
+import json
+
+import pytest
+
+from scripts.json_stream import JSONEventParser, JSONStreamError, iter_events
+
+DOCUMENT = json.dumps({
+    "users": [{"speaker": "alice", "age": 31, "score": -1.5e3}],
+    "tree": {"text": "café \"quoted\" \\ back\nslash 😀", "ok": True, "missing": None, "flag": False},
+    "empty": [{}, []],
+}, ensure_ascii=False).encode('utf-8')
+
+
+def _events(data, chunk_size):
+    parser = JSONEventParser()
+    events = []
+    for i in range(0, len(data), chunk_size):
+        events += parser.feed(data[i:i + chunk_size])
+    return events + parser.close()
+
+
+def _rebuild(events):
+    """Rebuild the document from the events, checking keys and scalars against their byte spans."""
+    stack, key, root = [], None, None
+    for kind, value, start, end in events:
+        if kind == 'map_key':
+            assert json.loads(DOCUMENT[start:end]) == value
+            key = value
+            continue
+        if kind in ('end_map', 'end_array'):
+            root = stack.pop()
+            continue
+        if kind in ('start_map', 'start_array'):
+            value = {} if kind == 'start_map' else []
+        else:
+            assert json.loads(DOCUMENT[start:end]) == value
+        if stack:
+            if isinstance(stack[-1], dict):
+                stack[-1][key] = value
+            else:
+                stack[-1].append(value)
+        if kind in ('start_map', 'start_array'):
+            stack.append(value)
+        else:
+            root = value
+    return root
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 1 << 16])
+def test_events_and_offsets_do_not_depend_on_chunking(chunk_size):
+    events = _events(DOCUMENT, chunk_size)
+    assert events == _events(DOCUMENT, len(DOCUMENT))
+    assert _rebuild(events) == json.loads(DOCUMENT)
+
+
+def test_offsets_are_byte_offsets():
+    data = '{"é": "ü", "n": 12}'.encode('utf-8')
+    events = _events(data, 1)
+    assert [(kind, start, end) for kind, _, start, end in events] == [
+        ('start_map', 0, 1), ('map_key', 1, 5), ('string', 7, 11),
+        ('map_key', 13, 16), ('number', 18, 20), ('end_map', 20, 21),
+    ]
+
+
+def test_numbers_split_across_chunks():
+    parser = JSONEventParser()
+    assert parser.feed(b'[12') == [('start_array', None, 0, 1)]
+    assert parser.feed(b'34.5') == []
+    assert parser.feed(b',') == [('number', 1234.5, 1, 7)]
+    assert parser.depth == 1
+    assert parser.feed(b'1e2]') == [('number', 100.0, 8, 11), ('end_array', None, 11, 12)]
+    assert parser.close() == []
+    assert parser.depth == 0
+
+
+def test_top_level_scalar_is_completed_by_close():
+    parser = JSONEventParser()
+    assert parser.feed(b'42') == []
+    assert parser.close() == [('number', 42, 0, 2)]
+
+
+@pytest.mark.parametrize('data', [b'', b'{"a": 1', b'["abc', b'[tru', b'{"a"'])
+def test_close_rejects_incomplete_input(data):
+    parser = JSONEventParser()
+    parser.feed(data)
+    with pytest.raises(JSONStreamError):
+        parser.close()
+
+
+@pytest.mark.parametrize('data', [
+    b'{"a" 1}', b'[1 2]', b'{1: 2}', b'[1, ]x', b'[nul]', b'"a\x01b"', b'[01]', b'{"a": 1}}', b'[1] [2]', b'"\xff"',
+])
+def test_invalid_json(data):
+    parser = JSONEventParser()
+    with pytest.raises(JSONStreamError):
+        parser.feed(data)
+        parser.close()
+
+
+def test_iter_events_reads_in_chunks():
+    assert list(iter_events(io.BytesIO(DOCUMENT), chunk_size=5)) == _events(DOCUMENT, len(DOCUMENT))
@@ -0,0 +1,61 @@
+import pytest
+
+from scripts.llm_cache import LLMCache
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make(**options):
+        options.setdefault('ttl_seconds', 3600)
+        options.setdefault('max_bytes', 1000)
+        cache = LLMCache(str(tmp_path / 'llm_cache.sqlite3'), **options)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.close()
+
+
+def test_hit_and_miss(make_cache):
+    cache = make_cache()
+    key = LLMCache.key_for({"model": "m", "messages": [{"role": "user", "content": "hi"}], "stream": True})
+    assert key == LLMCache.key_for({"model": "m", "messages": [{"role": "user", "content": "hi"}]})
+    assert cache.get(key) is None
+    cache.put(key, 'm', 'hello')
+    assert cache.get(key) == 'hello'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_running_total(make_cache):
+    cache = make_cache()
+    cache.put('a', 'm', 'x' * 100)
+    cache.put('b', 'm', 'é' * 50)
+    cache.put('a', 'm', 'x' * 10)
+    assert cache._bytes == cache.stats()['bytes'] == 110
+    # picked up from the file by a new instance
+    other = make_cache()
+    other.put('c', 'm', 'x')
+    assert other._bytes == 111
+
+
+def test_evicts_least_recently_used_only_over_the_limit(make_cache):
+    cache = make_cache(max_bytes=350)
+    for key in 'abc':
+        cache.put(key, 'm', 'x' * 100)
+    assert cache.evictions == 0
+    cache.get('a')
+    cache.put('d', 'm', 'x' * 100)
+    assert cache.get('b') is None
+    assert cache.get('a') == cache.get('c') == cache.get('d') == 'x' * 100
+    assert cache.evictions == 1
+    assert cache._bytes == cache.stats()['bytes'] == 300
+
+
+def test_expired_entries(make_cache):
+    cache = make_cache(ttl_seconds=-1)
+    cache.put('a', 'm', 'x' * 100)
+    assert cache.get('a') is None
+    assert cache._bytes == cache.stats()['entries'] == 0
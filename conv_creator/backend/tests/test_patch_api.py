@@ -0,0 +1,95 @@
+import json
+import os
+
+import pytest
+
+from scripts.patch_journal import journal_path
+
+PATCH_TYPE = {'Content-Type': 'application/json-patch+json'}
+
+
+def _rename_root(value='renamed'):
+    return [{"op": "replace", "path": "/tree/text", "value": value}]
+
+
+def _on_disk(full):
+    with open(full, encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def test_patch_by_id(client, discussion):
+    file_id, full = discussion
+    version = client.get(f'/api/files/id/{file_id}').headers['X-Document-Version']
+    res = client.patch(f'/api/files/id/{file_id}', json={"patch": _rename_root(), "baseVersion": version})
+    assert res.status_code == 200
+    assert res.json()['message'] == 'Patched'
+    assert res.json()['version'] != version
+    # journaled, not written yet
+    assert _on_disk(full)['tree']['text'] == 'root'
+    assert os.path.exists(journal_path(full))
+
+
+def test_patch_by_name_with_patch_media_type(client, discussion):
+    file_id, full = discussion
+    version = client.get(f'/api/files/id/{file_id}').headers['X-Document-Version']
+    res = client.patch(f'/api/files/{os.path.basename(full)}', content=json.dumps(_rename_root()),
+                       headers={**PATCH_TYPE, 'If-Match': f'"{version}"'})
+    assert res.status_code == 200
+    assert client.get(f'/api/files/id/{file_id}').json()['tree']['text'] == 'renamed'
+
+
+def test_get_returns_journaled_state(client, discussion):
+    file_id, full = discussion
+    client.patch(f'/api/files/id/{file_id}', json={"patch": _rename_root('from the journal')}).raise_for_status()
+    assert os.path.exists(journal_path(full))
+    res = client.get(f'/api/files/id/{file_id}')
+    assert res.json()['tree']['text'] == 'from the journal'
+    assert res.headers['X-Document-Version'].endswith('.0')
+
+
+def test_stale_base_version(client, discussion):
+    file_id, _ = discussion
+    stale = client.get(f'/api/files/id/{file_id}').headers['X-Document-Version']
+    client.patch(f'/api/files/id/{file_id}', json={"patch": _rename_root('first'), "baseVersion": stale}).raise_for_status()
+    res = client.patch(f'/api/files/id/{file_id}', json={"patch": _rename_root('second'), "baseVersion": stale})
+    assert res.status_code == 409
+    assert res.json()['detail']['currentVersion'] != stale
+    assert client.get(f'/api/files/id/{file_id}').json()['tree']['text'] == 'first'
+
+
+@pytest.mark.parametrize('patch, status', [
+    ([{"op": "replace", "path": "/tree/missing/text", "value": 1}], 422),
+    ([{"op": "test", "path": "/tree/text", "value": "nope"}], 409),
+    ([{"op": "replace", "path": "/tree/text"}], 400),
+])
+def test_patch_that_does_not_apply(client, discussion, patch, status):
+    file_id, full = discussion
+    before = _on_disk(full)
+    assert client.patch(f'/api/files/id/{file_id}', json={"patch": patch}).status_code == status
+    assert _on_disk(full) == before
+    assert not os.path.exists(journal_path(full))
+
+
+@pytest.mark.parametrize('body, headers', [
+    ({"patch": {"op": "replace", "path": "/tree/text", "value": "x"}}, {}),
+    ({"patch": ["not an operation"]}, {}),
+    ({"patch": _rename_root(), "users": []}, {}),
+    ({"patch": _rename_root(), "baseVersion": 3}, {}),
+    (_rename_root(), {}),
+    ({"op": "replace", "path": "/tree/text", "value": "x"}, PATCH_TYPE),
+])
+def test_malformed_patch_body_is_rejected(client, discussion, body, headers):
+    file_id, full = discussion
+    before = _on_disk(full)
+    for url in (f'/api/files/id/{file_id}', f'/api/files/{os.path.basename(full)}'):
+        res = client.patch(url, content=json.dumps(body), headers={'Content-Type': 'application/json', **headers})
+        assert res.status_code == 400, res.text
+    assert _on_disk(full) == before
+
+
+def test_whole_document_is_still_saved(client, discussion):
+    file_id, full = discussion
+    document = {"users": [], "tree": {"id": "1", "text": "replaced", "children": []}}
+    res = client.patch(f'/api/files/id/{file_id}', json=document)
+    assert res.json()['message'] == 'Saved'
+    assert _on_disk(full) == document
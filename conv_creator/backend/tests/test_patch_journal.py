@@ -0,0 +1,150 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from scripts import patch_journal
+from scripts.db import SQLitePool
+from scripts.patch_journal import PatchJournal, VersionConflict, journal_path
+
+
+def _compact(path, doc):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(doc, fh)
+    os.replace(tmp, path)
+
+
+def _journal(directory, **options):
+    db = SQLitePool(os.path.join(directory, 'db.sqlite3'), on_connect=patch_journal.ensure_schema)
+    options.setdefault('delay', 60)
+    options.setdefault('max_ratio', 1000)
+    return PatchJournal(_compact, db, lock_path=os.path.join(directory, '.patchlog.lock'), **options)
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+@pytest.fixture
+def doc(tmp_path):
+    path = str(tmp_path / 'doc.json')
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump({"items": []}, fh)
+    return path
+
+
+def _append(value):
+    return [{"op": "add", "path": "/items/-", "value": value}]
+
+
+def test_apply_journals_without_rewriting(tmp_path, doc):
+    journal = _journal(str(tmp_path))
+    v0 = journal.version(doc)
+    v1 = journal.apply(doc, _append('a'), v0)
+    v2 = journal.apply(doc, _append('b'), v1)
+    assert v0.endswith('.0') and v1.endswith('.1') and v2.endswith('.2')
+    assert _read(doc) == {"items": []}
+    assert os.path.exists(journal_path(doc))
+    assert journal.load(doc) == {"items": ['a', 'b']}
+    assert journal.version(doc) == v2
+
+
+def test_stale_base_version_conflicts(tmp_path, doc):
+    journal = _journal(str(tmp_path))
+    v0 = journal.version(doc)
+    v1 = journal.apply(doc, _append('a'), v0)
+    with pytest.raises(VersionConflict) as info:
+        journal.apply(doc, _append('b'), v0)
+    assert info.value.current == v1
+    assert journal.load(doc) == {"items": ['a']}
+    assert journal.stats()['conflicts'] == 1
+
+
+def test_version_survives_compaction(tmp_path, doc):
+    journal = _journal(str(tmp_path))
+    v1 = journal.apply(doc, _append('a'))
+    journal.flush(doc)
+    # the version the client holds is still accepted for the compacted file
+    journal.apply(doc, _append('b'), v1)
+    assert journal.load(doc) == {"items": ['a', 'b']}
+
+
+def test_flush_compacts(tmp_path, doc):
+    journal = _journal(str(tmp_path))
+    journal.apply(doc, _append('a'))
+    journal.flush(doc)
+    assert _read(doc) == {"items": ['a']}
+    assert not os.path.exists(journal_path(doc))
+    assert journal.version(doc).endswith('.0')
+    assert journal.stats()['compactions'] == 1
+
+
+def test_compacts_after_max_ops(tmp_path, doc):
+    journal = _journal(str(tmp_path), max_ops=3)
+    for value in 'abc':
+        journal.apply(doc, _append(value))
+    assert _read(doc) == {"items": ['a', 'b', 'c']}
+    assert not os.path.exists(journal_path(doc))
+
+
+def test_recover_after_crash(tmp_path, doc):
+    crashed = _journal(str(tmp_path))
+    crashed.apply(doc, _append('a'))
+    crashed.apply(doc, _append('b'))
+    # the process dies here: nothing compacted, the journal is left on disk
+    assert os.path.exists(journal_path(doc))
+    journal = _journal(str(tmp_path))
+    assert journal.recover(str(tmp_path)) == 1
+    assert _read(doc) == {"items": ['a', 'b']}
+    assert not os.path.exists(journal_path(doc))
+    assert journal._db.query_all('SELECT path FROM patch_journals') == []
+    assert journal.recover(str(tmp_path)) == 0
+
+
+def test_recover_rejects_journal_of_changed_file(tmp_path, doc):
+    crashed = _journal(str(tmp_path))
+    crashed.apply(doc, _append('a'))
+    with open(doc, 'w', encoding='utf-8') as fh:
+        json.dump({"items": ['replaced elsewhere']}, fh)
+    journal = _journal(str(tmp_path))
+    journal.recover(str(tmp_path))
+    assert _read(doc) == {"items": ['replaced elsewhere']}
+    assert os.path.exists(journal_path(doc) + '.rejected')
+
+
+def test_discard(tmp_path, doc):
+    journal = _journal(str(tmp_path))
+    journal.apply(doc, _append('a'))
+    journal.discard(doc)
+    assert journal.load(doc) == {"items": []}
+    assert not os.path.exists(journal_path(doc))
+
+
+def _worker(directory, doc, n, count):
+    journal = _journal(directory, max_ops=7, delay=0.05)
+    for i in range(count):
+        journal.apply(doc, _append(f'{n}-{i}'))
+        if i % 5 == 0:
+            journal.load(doc)
+    journal.flush_all()
+
+
+@pytest.mark.skipif(patch_journal.fcntl is None, reason='byte-range locks need fcntl')
+def test_processes_share_a_journal(tmp_path, doc):
+    processes, count = 4, 50
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_worker, args=(str(tmp_path), doc, n, count)) for n in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+    _journal(str(tmp_path)).flush(doc)
+    items = _read(doc)['items']
+    assert sorted(items) == sorted(f'{n}-{i}' for n in range(processes) for i in range(count))
+    for n in range(processes):
+        assert [x for x in items if x.startswith(f'{n}-')] == [f'{n}-{i}' for i in range(count)]
+    assert not any(name.endswith('.rejected') for name in os.listdir(tmp_path))
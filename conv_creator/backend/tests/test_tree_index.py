@@ -0,0 +1,117 @@
+import json
+import os
+
+import pytest
+
+from scripts import tree_index
+from scripts.db import SQLitePool
+
+from conftest import TREE
+
+
+def _schema(conn):
+    # the cleanup trigger is declared on the backend's files table
+    conn.execute('CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, name TEXT)')
+    tree_index.ensure_schema(conn)
+
+
+@pytest.fixture
+def db(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'db.sqlite3'), on_connect=_schema)
+    pool.execute("INSERT INTO files(id, name) VALUES (1, 'doc.json')")
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture
+def doc(tmp_path):
+    path = str(tmp_path / 'doc.json')
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump({"users": [{"id": "not a node"}], "tree": TREE}, fh, indent=2, ensure_ascii=False)
+    return path
+
+
+def test_build_index(db, doc):
+    assert tree_index.build_index(db, 1, doc) == 4
+    root = tree_index.get_root(db, 1)
+    assert root["id"] == "1" and root["parent_id"] is None
+    assert root["child_ids"] == ["2", "3"] and root["descendants"] == 3
+    nested = tree_index.get_node(db, 1, "4")
+    assert (nested["parent_id"], nested["depth"], nested["position"], nested["speaker"]) == ("2", 2, 2, "alice")
+    assert tree_index.read_text(doc, nested) == 'nested "quoted" é'
+    # the node span covers the whole node object
+    assert tree_index.read_span(doc, nested["start"], nested["end"]) == TREE["children"][0]["children"][0]
+    assert tree_index.get_node(db, 1, "missing") is None
+
+
+def test_lookups(db, doc):
+    tree_index.build_index(db, 1, doc)
+    assert [n["id"] for n in tree_index.get_ancestors(db, 1, "4")] == ["1", "2", "4"]
+    assert tree_index.get_ancestors(db, 1, "missing") == []
+    root = tree_index.get_root(db, 1)
+    assert [n["id"] for n in tree_index.get_subtree(db, 1, root, 1)] == ["1", "2", "3"]
+    assert [n["id"] for n in tree_index.get_subtree(db, 1, root, 5)] == ["1", "2", "4", "3"]
+    assert [n["id"] for n in tree_index.get_first_descendants(db, 1, root)] == ["2", "4"]
+    nodes = tree_index.get_subtree(db, 1, root, 5)
+    tree_index.read_texts(doc, nodes)
+    assert [n["text"] for n in nodes] == ["root", "first reply", 'nested "quoted" é', "second reply"]
+
+
+def test_ensure_index_rebuilds_stale_index(db, doc):
+    assert tree_index.ensure_index(db, 1, doc) == 4
+    assert tree_index.is_fresh(db, 1, os.stat(doc))
+    with open(doc, 'w', encoding='utf-8') as fh:
+        json.dump({"tree": {"id": "only", "text": "new", "children": []}}, fh)
+    assert not tree_index.is_fresh(db, 1, os.stat(doc))
+    assert tree_index.ensure_index(db, 1, doc) == 1
+    assert tree_index.get_node(db, 1, "1") is None
+    assert tree_index.get_root(db, 1)["id"] == "only"
+
+
+def test_invalidate_and_trigger(db, doc):
+    tree_index.build_index(db, 1, doc)
+    tree_index.invalidate(db, 1)
+    assert tree_index.get_root(db, 1) is None
+    assert not tree_index.is_fresh(db, 1, os.stat(doc))
+    tree_index.build_index(db, 1, doc)
+    db.execute('DELETE FROM files WHERE id = 1')
+    assert db.query_one('SELECT COUNT(*) FROM tree_nodes')[0] == 0
+    assert db.query_one('SELECT COUNT(*) FROM tree_index_meta')[0] == 0
+
+
+def test_unparsable_file_gets_an_empty_index(db, tmp_path):
+    path = str(tmp_path / 'broken.json')
+    with open(path, 'w', encoding='utf-8') as fh:
+        fh.write('{"tree": {"id": "1", ')
+    assert tree_index.build_index(db, 1, path) == 0
+    assert tree_index.is_fresh(db, 1, os.stat(path))
+
+
+def test_node_endpoint(client, discussion):
+    file_id, _ = discussion
+    res = client.get(f'/api/files/id/{file_id}/nodes/4')
+    assert res.status_code == 200
+    assert res.json()["text"] == 'nested "quoted" é'
+    assert res.json()["path"] == ["1", "2", "4"]
+    assert client.get(f'/api/files/id/{file_id}/nodes/missing').status_code == 404
+
+
+def test_subtree_and_branch_endpoints(client, discussion):
+    file_id, _ = discussion
+    tree = client.get(f'/api/files/id/{file_id}/subtree', params={"depth": 1}).json()["tree"]
+    assert [c["id"] for c in tree["children"]] == ["2", "3"]
+    assert tree["children"][0]["children"] == [] and tree["children"][0]["child_count"] == 1
+    branch = client.get(f'/api/files/id/{file_id}/branch', params={"node": "2"}).json()["branch"]
+    assert [n["id"] for n in branch] == ["1", "2", "4"]
+
+
+def test_index_follows_saves(client, discussion):
+    file_id, _ = discussion
+    assert client.get(f'/api/files/id/{file_id}/nodes/3').json()["text"] == "second reply"
+    patch = [{"op": "replace", "path": "/tree/children/1/text", "value": "edited"}]
+    client.patch(f'/api/files/id/{file_id}', json={"patch": patch}).raise_for_status()
+    assert client.get(f'/api/files/id/{file_id}/nodes/3').json()["text"] == "edited"
+    document = {"tree": {"id": "x", "text": "replaced", "children": []}}
+    client.patch(f'/api/files/id/{file_id}', json=document).raise_for_status()
+    assert client.get(f'/api/files/id/{file_id}/nodes/3').status_code == 404
+    assert client.get(f'/api/files/id/{file_id}/nodes/x').json()["text"] == "replaced"